@@ -0,0 +1,173 @@
+# AWS Config aggregator backend for the daily resource checks.
+# Instead of one Describe call chain per API, region and account, the
+# backend runs one select_aggregate_resource_config query per resource type
+# across everything the aggregator covers, and streams the pages into the
+# same item shapes the Describe APIs return, grouped by account and region.
+# Checks read them through the usual Query objects, so they run unchanged;
+# queries Config cannot answer (and ECS, whose running task counts Config
+# does not record) still use the Describe APIs.
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from metrics import bind
+from queries import ALL_ADDRESSES, ALL_VOLUMES, AVAILABLE_DB_INSTANCES, RUNNING_INSTANCES, RequestCache, record
+
+CONFIG_AGGREGATOR_NAME = os.environ.get('CONFIG_AGGREGATOR_NAME', '')
+# Largest page select_aggregate_resource_config returns
+CONFIG_PAGE_SIZE = 100
+
+
+def _instance(item):
+    configuration = item['configuration']
+    return {
+        'InstanceId': item['resourceId'],
+        'InstanceType': configuration['instanceType'],
+        'State': {'Name': configuration['state']['name']},
+    }
+
+
+def _db_instance(item):
+    configuration = item['configuration']
+    return {
+        'DBInstanceIdentifier': item['resourceName'],
+        'DBInstanceClass': configuration['dBInstanceClass'],
+        'DBInstanceStatus': configuration['dBInstanceStatus'],
+        'Engine': configuration.get('engine'),
+        'MultiAZ': configuration.get('multiAZ', False),
+    }
+
+
+def _volume(item):
+    configuration = item['configuration']
+    return {
+        'VolumeId': item['resourceId'],
+        'VolumeType': configuration['volumeType'],
+        'Size': configuration['size'],
+        'State': configuration['state'],
+    }
+
+
+def _address(item):
+    configuration = item['configuration']
+    address = {'PublicIp': configuration['publicIp']}
+    if configuration.get('instanceId'):
+        address['InstanceId'] = configuration['instanceId']
+    return address
+
+
+# Query name -> (Config SQL, conversion to the Describe item shape)
+CONFIG_QUERIES = {
+    RUNNING_INSTANCES.name: (
+        "SELECT resourceId, accountId, awsRegion, configuration.instanceType, configuration.state.name "
+        "WHERE resourceType = 'AWS::EC2::Instance' AND configuration.state.name = 'running'",
+        _instance,
+    ),
+    AVAILABLE_DB_INSTANCES.name: (
+        "SELECT resourceName, accountId, awsRegion, configuration.dBInstanceClass, configuration.dBInstanceStatus, "
+        "configuration.engine, configuration.multiAZ WHERE resourceType = 'AWS::RDS::DBInstance'",
+        _db_instance,
+    ),
+    ALL_VOLUMES.name: (
+        "SELECT resourceId, accountId, awsRegion, configuration.volumeType, configuration.size, configuration.state "
+        "WHERE resourceType = 'AWS::EC2::Volume'",
+        _volume,
+    ),
+    ALL_ADDRESSES.name: (
+        "SELECT accountId, awsRegion, configuration.publicIp, configuration.instanceId "
+        "WHERE resourceType = 'AWS::EC2::EIP'",
+        _address,
+    ),
+}
+
+
+def run_config_query(config, aggregator_name, name):
+    # Returns {(account id, region): [items]} for one resource type
+    expression, convert = CONFIG_QUERIES[name]
+    scoped = defaultdict(list)
+    paginator = config.get_paginator('select_aggregate_resource_config')
+    pages = paginator.paginate(
+        Expression=expression,
+        ConfigurationAggregatorName=aggregator_name,
+        PaginationConfig={'PageSize': CONFIG_PAGE_SIZE},
+    )
+    for page in pages:
+        headers = page.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+        record(f"config_{name}", calls=1, items=len(page['Results']), bytes=int(headers.get('content-length', 0)))
+        for result in page['Results']:
+            item = json.loads(result)
+            scoped[(item['accountId'], item['awsRegion'])].append(convert(item))
+    return scoped
+
+
+def fetch_source_status(config, aggregator_name):
+    # Returns {(account id, region): last update status} for the sources the
+    # aggregator is configured with; organization sources cover every account
+    # and are keyed ('*', region). None when the status cannot be read.
+    status = {}
+    try:
+        paginator = config.get_paginator('describe_configuration_aggregator_sources_status')
+        for page in paginator.paginate(ConfigurationAggregatorName=aggregator_name):
+            for source in page['AggregatedSourceStatusList']:
+                account = source['SourceId'] if source['SourceType'] == 'ACCOUNT' else '*'
+                status[(account, source['AwsRegion'])] = source.get('LastUpdateStatus')
+    except ClientError as e:
+        print(f"⚠️ Could not read the Config aggregator's source status, trusting only scopes it returned: {e}")
+        return None
+    return status
+
+
+class Inventory:
+    # Every resource type, fetched once for the whole aggregator
+    def __init__(self, by_query, source_status=None):
+        # by_query: {query name: {(account id, region): [items]}}
+        self.by_query = by_query
+        self.source_status = source_status
+        self.returned = {scope for by_scope in by_query.values() for scope in by_scope}
+
+    def covers(self, account_id, region):
+        # A scope the aggregator is not configured for, or has not synced
+        # yet, would look empty; only scopes it has current data for count
+        if self.source_status is None:
+            return (account_id, region) in self.returned
+        status = self.source_status.get((account_id, region)) or self.source_status.get(('*', region))
+        return status == 'SUCCEEDED'
+
+    def requests(self, account_id, region, shared_names=()):
+        if not self.covers(account_id, region):
+            print(f"⚠️ Config aggregator has no current data for {account_id}/{region}; using the Describe APIs")
+            return RequestCache(shared_names)
+        return InventoryRequests(self, account_id, region, shared_names)
+
+
+class InventoryRequests:
+    # Drop-in for RequestCache in one account and region the aggregator covers
+    def __init__(self, inventory, account_id, region, shared_names=()):
+        self.inventory = inventory
+        self.scope = (account_id, region)
+        self.fallback = RequestCache(shared_names)
+
+    def run(self, client, query):
+        by_scope = self.inventory.by_query.get(query.name)
+        if by_scope is None:
+            return self.fallback.run(client, query)
+        # A covered scope without results for this query has none of it
+        items = by_scope.get(self.scope, [])
+        if query.name == RUNNING_INSTANCES.name:
+            # Describe returns instances inside reservations
+            return iter([{'Instances': items}] if items else [])
+        return (item for item in items if query.predicate is None or query.predicate(item))
+
+
+def fetch_inventory(config, aggregator_name=CONFIG_AGGREGATOR_NAME, max_workers=len(CONFIG_QUERIES) + 1):
+    # One paginated query per resource type plus the source status, all running at once
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        status = pool.submit(bind(fetch_source_status), config, aggregator_name)
+        futures = {
+            name: pool.submit(bind(run_config_query), config, aggregator_name, name)
+            for name in CONFIG_QUERIES
+        }
+        return Inventory({name: future.result() for name, future in futures.items()}, status.result())
@@ -0,0 +1,182 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Each scenario is the size of the fake account (FakeAWS arguments), the
+# environment the checker is configured with and the event it is invoked with
+SCENARIOS = {
+    'small': {
+        'fake': {'instances': 50, 'volumes': 20, 'db_instances': 5, 'clusters': 2, 'services_per_cluster': 5, 'addresses': 3},
+        'env': {},
+        'event': {},
+    },
+    'large': {
+        'fake': {'instances': 20000, 'volumes': 5000, 'db_instances': 200, 'clusters': 30, 'services_per_cluster': 10, 'addresses': 100},
+        'env': {},
+        'event': {},
+    },
+    'large-slow': {
+        'fake': {'instances': 20000, 'volumes': 5000, 'db_instances': 200, 'clusters': 30, 'services_per_cluster': 10, 'addresses': 100,
+                 'latency_ms': 80},
+        'env': {},
+        'event': {},
+    },
+    'large-all-checks': {
+        'fake': {'instances': 20000, 'volumes': 5000, 'db_instances': 200, 'clusters': 30, 'services_per_cluster': 10, 'addresses': 100,
+                 'latency_ms': 20},
+        'env': {'IDLE_DETECTION': 'true', 'COST_ESTIMATION': 'true'},
+        'event': {},
+    },
+    'multi-region': {
+        'fake': {'instances': 5000, 'volumes': 1250, 'db_instances': 50, 'clusters': 8, 'services_per_cluster': 10, 'addresses': 25,
+                 'regions': ['us-east-1', 'us-east-2', 'us-west-2', 'eu-west-1'], 'latency_ms': 40},
+        'env': {},
+        'event': {'all_regions': True},
+    },
+    'multi-region-sharded': {
+        'fake': {'instances': 5000, 'volumes': 1250, 'db_instances': 50, 'clusters': 8, 'services_per_cluster': 10, 'addresses': 25,
+                 'regions': ['us-east-1', 'us-east-2', 'us-west-2', 'eu-west-1'], 'latency_ms': 40},
+        'env': {'SHARD_POLL_SECONDS': '0.1'},
+        'event': {'all_regions': True, 'sharded': True, 'shard_invoker': 'local'},
+    },
+    'multi-region-asyncio': {
+        'fake': {'instances': 5000, 'volumes': 1250, 'db_instances': 50, 'clusters': 8, 'services_per_cluster': 10, 'addresses': 25,
+                 'regions': ['us-east-1', 'us-east-2', 'us-west-2', 'eu-west-1'], 'latency_ms': 40},
+        'env': {},
+        'event': {'all_regions': True, 'engine': 'asyncio'},
+    },
+    # One call in 25 stalls for three seconds, as in a slow region; pages are
+    # kept small so network time, not the fake's CPU, dominates
+    'slow-tail': {
+        'fake': {'instances': 2000, 'volumes': 2000, 'db_instances': 400, 'clusters': 2, 'services_per_cluster': 5, 'addresses': 25,
+                 'regions': ['us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'eu-west-1', 'eu-west-2', 'eu-central-1', 'ap-south-1'],
+                 'latency_ms': 80, 'tail_rate': 0.04, 'tail_latency_ms': 3000},
+        'env': {},
+        'event': {'all_regions': True},
+    },
+    'slow-tail-hedged': {
+        'fake': {'instances': 2000, 'volumes': 2000, 'db_instances': 400, 'clusters': 2, 'services_per_cluster': 5, 'addresses': 25,
+                 'regions': ['us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'eu-west-1', 'eu-west-2', 'eu-central-1', 'ap-south-1'],
+                 'latency_ms': 80, 'tail_rate': 0.04, 'tail_latency_ms': 3000},
+        'env': {},
+        'event': {'all_regions': True, 'hedge': True},
+    },
+    'multi-region-config': {
+        'fake': {'instances': 5000, 'volumes': 1250, 'db_instances': 50, 'clusters': 8, 'services_per_cluster': 10, 'addresses': 25,
+                 'regions': ['us-east-1', 'us-east-2', 'us-west-2', 'eu-west-1'], 'latency_ms': 40},
+        'env': {'CONFIG_AGGREGATOR_NAME': 'benchmark'},
+        'event': {'all_regions': True, 'backend': 'config'},
+    },
+    # Many regions with little in each, where per-region Describe calls dominate
+    'sparse-regions': {
+        'fake': {'instances': 20, 'volumes': 10, 'db_instances': 2, 'clusters': 1, 'services_per_cluster': 2, 'addresses': 2,
+                 'regions': ['us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'ca-central-1', 'eu-west-1', 'eu-west-2',
+                             'eu-west-3', 'eu-central-1', 'eu-north-1', 'ap-south-1', 'ap-northeast-1', 'ap-northeast-2',
+                             'ap-northeast-3', 'ap-southeast-1', 'ap-southeast-2', 'sa-east-1'], 'latency_ms': 40},
+        'env': {},
+        'event': {'all_regions': True},
+    },
+    'sparse-regions-asyncio': {
+        'fake': {'instances': 20, 'volumes': 10, 'db_instances': 2, 'clusters': 1, 'services_per_cluster': 2, 'addresses': 2,
+                 'regions': ['us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'ca-central-1', 'eu-west-1', 'eu-west-2',
+                             'eu-west-3', 'eu-central-1', 'eu-north-1', 'ap-south-1', 'ap-northeast-1', 'ap-northeast-2',
+                             'ap-northeast-3', 'ap-southeast-1', 'ap-southeast-2', 'sa-east-1'], 'latency_ms': 40},
+        'env': {},
+        'event': {'all_regions': True, 'engine': 'asyncio'},
+    },
+    'sparse-regions-config': {
+        'fake': {'instances': 20, 'volumes': 10, 'db_instances': 2, 'clusters': 1, 'services_per_cluster': 2, 'addresses': 2,
+                 'regions': ['us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'ca-central-1', 'eu-west-1', 'eu-west-2',
+                             'eu-west-3', 'eu-central-1', 'eu-north-1', 'ap-south-1', 'ap-northeast-1', 'ap-northeast-2',
+                             'ap-northeast-3', 'ap-southeast-1', 'ap-southeast-2', 'sa-east-1'], 'latency_ms': 40},
+        'env': {'CONFIG_AGGREGATOR_NAME': 'benchmark'},
+        'event': {'all_regions': True, 'backend': 'config'},
+    },
+}
+
+
+def run_child(name):
+    # Runs one scenario in this (fresh) process and prints its measurements as JSON
+    scenario = SCENARIOS[name]
+    import boto3
+    import clients
+    import script
+    from fakeaws import FakeAWS
+
+    fake = FakeAWS(**scenario['fake'])
+    clients.set_session(fake.install(boto3.session.Session()))
+    event = dict(scenario['event'], report_mode='full')
+
+    logs = io.StringIO()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(logs):
+        script.lambda_handler(event, None)
+    wall = time.perf_counter() - started
+
+    print(json.dumps({
+        'scenario': name,
+        'wall_s': round(wall, 3),
+        'api_calls': sum(fake.calls.values()),
+        'calls_by_operation': dict(sorted(fake.calls.items())),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'report_bytes': fake.published_bytes,
+        'offloaded_bytes': fake.uploaded_bytes,
+    }))
+
+
+def run_scenario(name):
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            AWS_DEFAULT_REGION='us-west-2',
+            AWS_ACCESS_KEY_ID='benchmark',
+            AWS_SECRET_ACCESS_KEY='benchmark',
+            SNAPSHOT_PATH=os.path.join(tmp, 'snapshot.json.gz'),
+            SHARD_RESULTS_PATH=os.path.join(tmp, 'shards'),
+            INVENTORY_CACHE_PATH=os.path.join(tmp, 'cache'),
+            REPORT_BUCKET='benchmark-reports',
+            **SCENARIOS[name]['env'],
+        )
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', name],
+            cwd=here, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark lambda_handler against a synthetic large account.')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='Scenario to run (repeatable, default: all)')
+    parser.add_argument('--json', help='Also write the results to this file, to compare against a later run')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    results = []
+    print(f"{'scenario':<22} {'wall s':>8} {'API calls':>10} {'peak RSS MB':>12} {'report B':>10} {'offloaded B':>12}")
+    for name in args.scenario or list(SCENARIOS):
+        result = run_scenario(name)
+        results.append(result)
+        print(
+            f"{name:<22} {result['wall_s']:>8.2f} {result['api_calls']:>10} {result['peak_rss_mb']:>12.1f} "
+            f"{result['report_bytes']:>10} {result['offloaded_bytes']:>12}"
+        )
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
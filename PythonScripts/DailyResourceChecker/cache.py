@@ -0,0 +1,117 @@
+# Warm-container cache of check results.
+# EventBridge retries, manual re-runs and ad-hoc invocations usually land on
+# a container that scanned the same account and region minutes ago. Every
+# finished check's results are kept in /tmp (one file per account and region,
+# plus an in-memory copy) with the time they were collected; within the TTL
+# they are served from there, and only checks whose entries have expired are
+# run again. Checks that did not finish are never cached. Off unless
+# INVENTORY_CACHE_TTL (or a per-check TTL) is set, since a scheduled daily
+# report should always be a fresh scan.
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from shards import decode_results, encode_results
+
+INVENTORY_CACHE_PATH = os.environ.get('INVENTORY_CACHE_PATH', '/tmp/daily-resource-cache')
+# Seconds a check's results stay fresh; 0 (the default) turns the cache off
+INVENTORY_CACHE_TTL = float(os.environ.get('INVENTORY_CACHE_TTL', '0'))
+# Per-check overrides, e.g. "ec2=60,idle=3600"
+INVENTORY_CACHE_TTLS = {
+    name.strip(): float(ttl)
+    for name, _, ttl in (item.partition('=') for item in os.environ.get('INVENTORY_CACHE_TTLS', '').split(','))
+    if name.strip()
+}
+
+# Names of the files this cache writes (and the temporary copies it
+# replaces them from); nothing else in INVENTORY_CACHE_PATH is touched
+CACHE_FILE_PATTERN = re.compile(r'inventory-[\w.-]+\.json(\.tmp)?')
+
+# {(account, region): {check: (collected at, results)}}, mirrors the files
+_entries = {}
+_lock = threading.Lock()
+_stats = Counter()
+
+
+def check_ttl(name):
+    return INVENTORY_CACHE_TTLS.get(name, INVENTORY_CACHE_TTL)
+
+
+def _cache_file(scope):
+    account, region = scope
+    return os.path.join(INVENTORY_CACHE_PATH, f"inventory-{account}-{region}.json")
+
+
+def _load_scope(scope):
+    # Memory first; the file covers a new runtime process in a reused container
+    if scope not in _entries:
+        try:
+            with open(_cache_file(scope)) as f:
+                stored = decode_results(f.read(), {})
+            _entries[scope] = {name: (entry['at'], entry['results']) for name, entry in stored.items()}
+        except (OSError, ValueError):
+            _entries[scope] = {}
+    return _entries[scope]
+
+
+def cached_results(account_id, region, names):
+    # Returns {check: results} for every check still within its TTL
+    if not any(check_ttl(name) > 0 for name in names):
+        return {}
+    scope = (account_id or 'local', region)
+    now = time.time()
+    with _lock:
+        entries = _load_scope(scope)
+        fresh = {
+            name: entries[name][1]
+            for name in names
+            if name in entries and now - entries[name][0] < check_ttl(name)
+        }
+        _stats.update(hits=len(fresh), misses=len(names) - len(fresh))
+    return fresh
+
+
+def store_results(account_id, region, results):
+    # results: {check: results} for checks that finished in this run
+    results = {name: result for name, result in results.items() if check_ttl(name) > 0}
+    if not results:
+        return
+    scope = (account_id or 'local', region)
+    now = time.time()
+    with _lock:
+        entries = _load_scope(scope)
+        entries.update((name, (now, result)) for name, result in results.items())
+        stored = {name: {'at': at, 'results': result} for name, (at, result) in entries.items()}
+        try:
+            os.makedirs(INVENTORY_CACHE_PATH, exist_ok=True)
+            path = _cache_file(scope)
+            with open(f"{path}.tmp", 'w') as f:
+                f.write(encode_results(stored, {}))
+            os.replace(f"{path}.tmp", path)
+        except (OSError, TypeError) as e:
+            # The in-memory copy still serves this container
+            print(f"⚠️ Could not write the inventory cache for {scope[0]}/{scope[1]}: {e}")
+
+
+def clear_cache():
+    with _lock:
+        _entries.clear()
+        if os.path.isdir(INVENTORY_CACHE_PATH):
+            for name in os.listdir(INVENTORY_CACHE_PATH):
+                path = os.path.join(INVENTORY_CACHE_PATH, name)
+                if CACHE_FILE_PATTERN.fullmatch(name) and os.path.isfile(path):
+                    os.remove(path)
+
+
+def reset_cache_stats():
+    with _lock:
+        _stats.clear()
+
+
+def log_cache_stats():
+    with _lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    if hits or misses:
+        print(f"cache: hits={hits} misses={misses} ttl_s={INVENTORY_CACHE_TTL:g}")
@@ -0,0 +1,213 @@
+# Record/replay of raw AWS responses for offline profiling.
+# Record mode runs the handler against real AWS and captures every raw HTTP
+# response (status, headers, body) botocore receives into a gzipped cassette.
+# Replay mode answers botocore's 'before-send' event from the cassette, so
+# requests are still serialized and signed and responses still go through
+# botocore's full parsing pipeline, but nothing touches the network. Replayed
+# runs are repeatable, which makes before/after profiles directly comparable.
+import argparse
+import base64
+import cProfile
+import gzip
+import hashlib
+import io
+import json
+import os
+import pstats
+import re
+import tempfile
+import threading
+from collections import defaultdict, deque
+from urllib.parse import unquote, urlsplit
+
+from botocore.awsrequest import AWSResponse
+
+CASSETTE_VERSION = 1
+
+# Request timestamps (e.g. GetMetricData StartTime/EndTime) change between
+# runs, so they are left out of the request fingerprint
+_TIMESTAMP = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:?\d{2})?')
+
+
+def fingerprint(request):
+    # request is the prepared botocore request passed to 'before-send'
+    url = urlsplit(request.url)
+    body = request.body
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+    if not isinstance(body, str):
+        # Streamed bodies (e.g. S3 uploads) are not read, only the URL counts
+        body = ''
+    text = _TIMESTAMP.sub('', unquote(f"{request.method} {url.path}?{url.query} {body}"))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _operation(event_name):
+    # 'before-send.ec2.DescribeInstances' -> 'ec2.DescribeInstances'
+    return event_name.split('.', 1)[1]
+
+
+class _Body(io.BytesIO):
+    # AWSResponse reads its content through raw.stream()
+    def stream(self, **kwargs):
+        yield self.getvalue()
+
+
+class Cassette:
+    def __init__(self, region=None):
+        self.region = region
+        self.entries = []
+        self._by_key = defaultdict(deque)
+        self._by_operation = defaultdict(deque)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # -----------------------------
+    # Recording
+    # -----------------------------
+    def record(self, session):
+        # session is a boto3 Session; every client created from it afterwards is recorded
+        session.events.register('before-send', self._remember_request)
+        session.events.register('before-parse', self._record_response)
+        return session
+
+    def _remember_request(self, request, event_name, **kwargs):
+        self._local.pending = (_operation(event_name), fingerprint(request))
+
+    def _record_response(self, operation_model, response_dict, **kwargs):
+        pending = getattr(self._local, 'pending', None)
+        body = response_dict['body']
+        if pending is None or not isinstance(body, bytes):
+            # Streaming bodies (e.g. S3 GetObject) are left to the caller and not recorded
+            return
+        operation, key = pending
+        self._local.pending = None
+        entry = {
+            'operation': operation,
+            'key': key,
+            'status': response_dict['status_code'],
+            'headers': dict(response_dict['headers']),
+            'body': base64.b64encode(body).decode('ascii'),
+        }
+        with self._lock:
+            self.entries.append(entry)
+
+    def save(self, path):
+        with self._lock:
+            document = {'version': CASSETTE_VERSION, 'region': self.region, 'entries': self.entries}
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            json.dump(document, f, separators=(',', ':'))
+
+    # -----------------------------
+    # Replay
+    # -----------------------------
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            document = json.load(f)
+        if document.get('version') != CASSETTE_VERSION:
+            raise ValueError(f"Unsupported cassette version in {path}: {document.get('version')}")
+        cassette = cls(document.get('region'))
+        cassette.entries = document['entries']
+        return cassette
+
+    def replay(self, session):
+        # Responses are served in recorded order, matched by request fingerprint
+        # first and by operation when the request changed (e.g. an S3 key with a date)
+        self._by_key.clear()
+        self._by_operation.clear()
+        for entry in self.entries:
+            entry['used'] = False
+            self._by_key[(entry['operation'], entry['key'])].append(entry)
+            self._by_operation[entry['operation']].append(entry)
+        session.events.register('before-send', self._replay_response)
+        return session
+
+    def _next(self, queue):
+        while queue:
+            entry = queue.popleft()
+            if not entry['used']:
+                entry['used'] = True
+                return entry
+        return None
+
+    def _replay_response(self, request, event_name, **kwargs):
+        operation = _operation(event_name)
+        with self._lock:
+            entry = (self._next(self._by_key[(operation, fingerprint(request))])
+                     or self._next(self._by_operation[operation]))
+        if entry is None:
+            raise LookupError(f"No recorded response left for {operation} ({request.method} {request.url})")
+        return AWSResponse(request.url, entry['status'], entry['headers'], _Body(base64.b64decode(entry['body'])))
+
+    def unused(self):
+        return sum(1 for entry in self.entries if not entry.get('used'))
+
+
+# -----------------------------
+# Command line
+# -----------------------------
+def _intercept_publish(session):
+    # Recording and replaying must never email anyone, so SNS Publish is answered locally
+    def respond(**kwargs):
+        return AWSResponse(None, 200, {}, None), {'MessageId': 'cassette'}
+    session.events.register('before-call.sns.Publish', respond)
+    return session
+
+
+def run_handler(session, event, profile=None):
+    import clients
+    import script
+
+    clients.set_session(session)
+    if profile is None:
+        return script.lambda_handler(event, None)
+    return profile.runcall(script.lambda_handler, event, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record AWS responses for a handler run, or replay them offline.')
+    parser.add_argument('mode', choices=['record', 'replay'])
+    parser.add_argument('path', help='Cassette file (gzipped JSON)')
+    parser.add_argument('--event', default='{"report_mode": "full"}', help='Event passed to lambda_handler, as JSON')
+    parser.add_argument('--profile', action='store_true', help='Replay under cProfile and print the hottest functions')
+    parser.add_argument('--sort', default='cumulative', help='pstats sort key (default: cumulative)')
+    parser.add_argument('--limit', type=int, default=30, help='Number of functions to print (default: 30)')
+    parser.add_argument('--stats', help='Also write the raw profile to this file, e.g. to compare runs')
+    args = parser.parse_args()
+    event = json.loads(args.event)
+
+    import boto3
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # A fresh snapshot and an empty cache every run keep replays identical to each other
+        os.environ['SNAPSHOT_PATH'] = os.path.join(tmp, 'snapshot.json.gz')
+        os.environ['INVENTORY_CACHE_PATH'] = os.path.join(tmp, 'cache')
+
+        if args.mode == 'record':
+            session = boto3.session.Session()
+            cassette = Cassette(session.region_name)
+            run_handler(_intercept_publish(cassette.record(session)), event)
+            cassette.save(args.path)
+            print(f"Recorded {len(cassette.entries)} responses to {args.path}")
+            return
+
+        cassette = Cassette.load(args.path)
+        if cassette.region:
+            os.environ['AWS_DEFAULT_REGION'] = cassette.region
+        # Requests are still signed, so any credentials will do
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'cassette')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'cassette')
+        session = _intercept_publish(cassette.replay(boto3.session.Session()))
+        profile = cProfile.Profile() if args.profile else None
+        run_handler(session, event, profile)
+        print(f"Replayed {len(cassette.entries) - cassette.unused()} of {len(cassette.entries)} responses")
+
+        if profile is not None:
+            if args.stats:
+                profile.dump_stats(args.stats)
+            pstats.Stats(profile).sort_stats(args.sort).print_stats(args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Client lifecycle for the DailyResourceChecker Lambda.
+# The session and every client are created lazily at module scope, so a warm
+# container reuses them and only a cold start pays for loading service
+# models, resolving endpoints and finding credentials.
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+from metrics import instrument
+from ratelimit import SHARED_RATE_LIMIT, share_rate_limits
+
+CLIENT_CONFIG = Config(
+    max_pool_connections=int(os.environ.get('CLIENT_POOL_SIZE', '10')),
+    connect_timeout=float(os.environ.get('CLIENT_CONNECT_TIMEOUT', '5')),
+    read_timeout=float(os.environ.get('CLIENT_READ_TIMEOUT', '30')),
+    retries={
+        'mode': os.environ.get('CLIENT_RETRY_MODE', 'standard'),
+        'max_attempts': int(os.environ.get('CLIENT_MAX_ATTEMPTS', '5')),
+    },
+)
+
+_session = None
+_clients = {}
+# Sessions are not thread-safe, so clients are only ever built under this lock
+_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            _session = boto3.session.Session()
+        return _session
+
+
+def set_session(session):
+    # Replaces the module session and drops cached clients, e.g. to run the
+    # handler against a local stand-in for AWS
+    global _session
+    with _lock:
+        _session = session
+        _clients.clear()
+
+
+def get_client(service, region_name=None, session=None):
+    session = session or get_session()
+    key = (session, service, region_name)
+    with _lock:
+        if key not in _clients:
+            client = instrument(session.client(service, region_name=region_name, config=CLIENT_CONFIG))
+            # One adaptive limiter per API for all clients, instead of per-client retry storms
+            _clients[key] = share_rate_limits(client) if SHARED_RATE_LIMIT else client
+        return _clients[key]
+
+
+def clients_created():
+    with _lock:
+        return len(_clients)
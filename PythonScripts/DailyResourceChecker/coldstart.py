@@ -0,0 +1,57 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Runs in a fresh interpreter each time, like a Lambda cold start: times the
+# module import (Lambda init), the first round of client creation inside the
+# handler, and the same round again once the clients are cached (warm).
+CHILD = """
+import json, time
+started = time.perf_counter()
+import script
+init = time.perf_counter() - started
+
+def build():
+    started = time.perf_counter()
+    session = script.get_session()
+    script.create_clients(session)
+    script.get_client('sns')
+    return time.perf_counter() - started
+
+cold = build()
+warm = build()
+print(json.dumps({'init_ms': init * 1000, 'cold_clients_ms': cold * 1000, 'warm_clients_ms': warm * 1000}))
+"""
+
+
+def measure_once(region):
+    env = dict(os.environ, AWS_DEFAULT_REGION=region)
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD], cwd=here, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure DailyResourceChecker init time and client creation time.')
+    parser.add_argument('--runs', type=int, default=10, help='Number of fresh interpreters to start')
+    parser.add_argument('--region', default='us-west-2', help='Region the clients are created for')
+    args = parser.parse_args()
+
+    samples = [measure_once(args.region) for _ in range(args.runs)]
+
+    print(f"⏱️ {args.runs} cold starts")
+    for key in ('init_ms', 'cold_clients_ms', 'warm_clients_ms'):
+        values = [sample[key] for sample in samples]
+        print(
+            f"{key:>16}: median {statistics.median(values):8.1f}  "
+            f"min {min(values):8.1f}  max {max(values):8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
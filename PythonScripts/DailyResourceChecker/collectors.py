@@ -0,0 +1,144 @@
+# Streaming, paginated collectors for the daily resource checks.
+# Every collector is a generator built on a botocore paginator (hedged
+# queries page by hand, see queries.py), so only one page of a response is
+# held in memory at a time and only the fields a check needs are passed on.
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from metrics import THROTTLE_ERROR_CODES, bind
+from queries import ALL_ADDRESSES, ALL_VOLUMES, AVAILABLE_DB_INSTANCES, DIRECT, RUNNING_INSTANCES
+
+# Largest page list_clusters/list_services accept
+ECS_PAGE_SIZE = 100
+
+ECS_DESCRIBE_BATCH_SIZE = 10
+ECS_MAX_WORKERS = int(os.environ.get('ECS_MAX_WORKERS', '8'))
+
+# Throttled calls are retried with jittered exponential backoff on top of
+# botocore's own retries, so a burst of parallel describes slows down instead
+# of failing the whole check
+THROTTLE_MAX_ATTEMPTS = 5
+THROTTLE_BASE_DELAY = 0.5
+
+
+def call_with_backoff(operation, **kwargs):
+    for attempt in range(THROTTLE_MAX_ATTEMPTS):
+        try:
+            return operation(**kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in THROTTLE_ERROR_CODES or attempt == THROTTLE_MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(random.uniform(0, THROTTLE_BASE_DELAY * 2 ** attempt))
+
+
+def iter_running_instance_ids(ec2, requests=DIRECT):
+    for reservation in requests.run(ec2, RUNNING_INSTANCES):
+        for instance in reservation['Instances']:
+            yield instance['InstanceId']
+
+
+def iter_running_instance_types(ec2, requests=DIRECT):
+    # Yields (instance id, instance type) pairs
+    for reservation in requests.run(ec2, RUNNING_INSTANCES):
+        for instance in reservation['Instances']:
+            yield instance['InstanceId'], instance['InstanceType']
+
+
+def iter_available_db_ids(rds, requests=DIRECT):
+    for db in requests.run(rds, AVAILABLE_DB_INSTANCES):
+        yield db['DBInstanceIdentifier']
+
+
+def iter_available_db_classes(rds, requests=DIRECT):
+    # Yields (identifier, instance class) pairs
+    for db in requests.run(rds, AVAILABLE_DB_INSTANCES):
+        yield db['DBInstanceIdentifier'], db['DBInstanceClass']
+
+
+def iter_volumes(ec2, requests=DIRECT):
+    # Yields (volume id, state, size in GiB) tuples
+    for vol in requests.run(ec2, ALL_VOLUMES):
+        yield vol['VolumeId'], vol['State'], vol['Size']
+
+
+def iter_volume_types(ec2, requests=DIRECT):
+    # Yields (volume id, volume type, size in GiB) tuples
+    for vol in requests.run(ec2, ALL_VOLUMES):
+        yield vol['VolumeId'], vol['VolumeType'], vol['Size']
+
+
+# Record streams for the finding rules: one dict of rule-visible fields per resource
+def iter_instance_records(ec2, requests=DIRECT):
+    for reservation in requests.run(ec2, RUNNING_INSTANCES):
+        for instance in reservation['Instances']:
+            yield {'id': instance['InstanceId'], 'type': instance['InstanceType']}
+
+
+def iter_db_records(rds, requests=DIRECT):
+    for db in requests.run(rds, AVAILABLE_DB_INSTANCES):
+        yield {
+            'id': db['DBInstanceIdentifier'],
+            'class': db['DBInstanceClass'],
+            'engine': db.get('Engine'),
+            'multi_az': db.get('MultiAZ', False),
+        }
+
+
+def iter_volume_records(ec2, requests=DIRECT):
+    for vol in requests.run(ec2, ALL_VOLUMES):
+        yield {'id': vol['VolumeId'], 'type': vol['VolumeType'], 'size': vol['Size'], 'state': vol['State']}
+
+
+def iter_addresses(ec2, requests=DIRECT):
+    # describe_addresses has no pagination; it always returns every address
+    # Yields (public ip, instance id or None) pairs
+    for addr in requests.run(ec2, ALL_ADDRESSES):
+        yield addr['PublicIp'], addr.get('InstanceId')
+
+
+def iter_cluster_arns(ecs):
+    paginator = ecs.get_paginator('list_clusters')
+    yield from paginator.paginate(PaginationConfig={'PageSize': ECS_PAGE_SIZE}).search('clusterArns')
+
+
+def iter_service_arn_pages(ecs, cluster_arn, page_size=ECS_PAGE_SIZE):
+    # Yields one list of service ARNs per list_services page
+    paginator = ecs.get_paginator('list_services')
+    for page in paginator.paginate(cluster=cluster_arn, PaginationConfig={'PageSize': page_size}):
+        if page['serviceArns']:
+            yield page['serviceArns']
+
+
+def describe_running_services(ecs, cluster_arn, service_arns):
+    described = call_with_backoff(ecs.describe_services, cluster=cluster_arn, services=service_arns)
+    return [svc['serviceName'] for svc in described['services'] if svc['runningCount'] > 0]
+
+
+def list_service_batches(ecs, cluster_arn):
+    # describe_services accepts at most 10 services per call
+    batches = []
+    for service_arns in iter_service_arn_pages(ecs, cluster_arn):
+        for i in range(0, len(service_arns), ECS_DESCRIBE_BATCH_SIZE):
+            batches.append(service_arns[i:i + ECS_DESCRIBE_BATCH_SIZE])
+    return batches
+
+
+def iter_running_services(ecs, max_workers=ECS_MAX_WORKERS):
+    # Yields (service name, cluster arn) pairs in cluster order, while every
+    # cluster is listed and every batch is described concurrently
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        listings = [
+            (cluster_arn, pool.submit(bind(list_service_batches), ecs, cluster_arn))
+            for cluster_arn in iter_cluster_arns(ecs)
+        ]
+        described = []
+        for cluster_arn, listing in listings:
+            for service_arns in listing.result():
+                described.append((cluster_arn, pool.submit(bind(describe_running_services), ecs, cluster_arn, service_arns)))
+        for cluster_arn, future in described:
+            for service_name in future.result():
+                yield service_name, cluster_arn
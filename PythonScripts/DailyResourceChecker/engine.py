@@ -0,0 +1,205 @@
+# Asyncio collection engine for the daily resource checks.
+# The thread-pool fan-out nests a pool per account, per region and per scan,
+# so concurrency is the product of three settings and every waiting check
+# still holds a thread. Here one event loop schedules every job (a check in
+# one account and region) and admits it only when its region and each
+# service it calls have a free slot (asyncio semaphores), then runs the
+# blocking botocore work on one bounded executor. Results are consumed as
+# they complete, and the engine records peak concurrency and how long jobs
+# queued for their slots, to tune the limits for very wide scans. The
+# service and region limits count jobs (checks), not API requests: a check
+# may still fan out inside (the ECS describe pool, paginated calls), so the
+# number of requests in flight can be higher than the limit.
+import argparse
+import asyncio
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import bind
+
+# Threads running blocking botocore calls, for the whole invocation
+ENGINE_MAX_THREADS = int(os.environ.get('ENGINE_MAX_THREADS', '64'))
+# Jobs (checks, not requests) in flight per service across all regions and
+# accounts, and per region
+ENGINE_SERVICE_CONCURRENCY = int(os.environ.get('ENGINE_SERVICE_CONCURRENCY', '32'))
+ENGINE_REGION_CONCURRENCY = int(os.environ.get('ENGINE_REGION_CONCURRENCY', '16'))
+
+
+class Engine:
+    def __init__(self, max_threads=ENGINE_MAX_THREADS, service_limit=ENGINE_SERVICE_CONCURRENCY,
+                 region_limit=ENGINE_REGION_CONCURRENCY):
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='engine')
+        self.max_threads = max_threads
+        # Semaphores are created on first use, inside the running loop
+        self.service_slots = defaultdict(lambda: asyncio.Semaphore(service_limit))
+        self.region_slots = defaultdict(lambda: asyncio.Semaphore(region_limit))
+        # Admitting no more jobs than threads keeps the queueing visible here,
+        # instead of hidden in the executor's queue
+        self.thread_slots = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.in_flight_by_service = Counter()
+        self.peak_by_service = Counter()
+        self.queue_delays = []
+        self.timed_out = 0
+
+    async def submit(self, fn, *args, services=(), region=None, timeout=None, on_start=None):
+        # Runs fn(*args) on the executor once the region and every service
+        # have a slot, calling on_start() as it is admitted; raises
+        # asyncio.TimeoutError after `timeout` seconds of running. The thread
+        # itself cannot be stopped, so a job that times out (or is cancelled)
+        # keeps its slots until its thread really finishes, and the limits
+        # stay true of the threads actually running.
+        queued = time.perf_counter()
+        if self.thread_slots is None:
+            self.thread_slots = asyncio.Semaphore(self.max_threads)
+        # Always acquired in the same order, so jobs cannot deadlock
+        wanted = [self.region_slots[region]] if region is not None else []
+        wanted += [self.service_slots[service] for service in sorted(set(services))]
+        wanted.append(self.thread_slots)
+        held = []
+        try:
+            for slot in wanted:
+                await slot.acquire()
+                held.append(slot)
+        except BaseException:
+            self._release(held)
+            raise
+        self.queue_delays.append(time.perf_counter() - queued)
+        self._started(services)
+        if on_start is not None:
+            on_start()
+
+        def finish(_):
+            self._finished(services, held)
+
+        try:
+            future = asyncio.wrap_future(self.executor.submit(bind(fn), *args))
+        except BaseException:
+            finish(None)
+            raise
+        try:
+            done, _ = await asyncio.wait({future}, timeout=timeout)
+        except BaseException:
+            # Cancelled while the thread runs on
+            future.add_done_callback(finish)
+            raise
+        if not done:
+            self.timed_out += 1
+            future.add_done_callback(finish)
+            raise asyncio.TimeoutError()
+        finish(future)
+        return future.result()
+
+    @staticmethod
+    def _release(slots):
+        for slot in slots:
+            slot.release()
+
+    def _started(self, services):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        for service in set(services):
+            self.in_flight_by_service[service] += 1
+            self.peak_by_service[service] = max(self.peak_by_service[service], self.in_flight_by_service[service])
+
+    def _finished(self, services, slots):
+        self.in_flight -= 1
+        for service in set(services):
+            self.in_flight_by_service[service] -= 1
+        self._release(slots)
+
+    def shutdown(self):
+        # Jobs still running past the deadline are abandoned, as with the thread pools
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        delays = sorted(self.queue_delays)
+        return {
+            'jobs': len(delays),
+            'threads': self.max_threads,
+            'peak_in_flight': self.peak_in_flight,
+            'peak_by_service': dict(sorted(self.peak_by_service.items())),
+            'queue_ms_avg': sum(delays) / len(delays) * 1000 if delays else 0.0,
+            'queue_ms_p95': delays[int(len(delays) * 0.95)] * 1000 if delays else 0.0,
+            'queue_ms_max': delays[-1] * 1000 if delays else 0.0,
+            'timed_out': self.timed_out,
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        services = ' '.join(f"{name}={peak}" for name, peak in stats['peak_by_service'].items())
+        print(
+            f"engine: jobs={stats['jobs']} threads={stats['threads']} peak_in_flight={stats['peak_in_flight']} "
+            f"queue_ms_avg={stats['queue_ms_avg']:.1f} queue_ms_p95={stats['queue_ms_p95']:.1f} "
+            f"queue_ms_max={stats['queue_ms_max']:.1f} timed_out={stats['timed_out']} peak_by_service: {services}"
+        )
+
+
+async def run_jobs(engine, jobs, timeout=None):
+    # jobs: {key: coroutine}; returns ({key: result}, {key: exception}) for the
+    # jobs that completed within `timeout`, consuming them as they complete.
+    # Jobs still pending are cancelled and left out of both.
+    tasks = {asyncio.ensure_future(job): key for key, job in jobs.items()}
+    results, errors = {}, {}
+    pending = set(tasks)
+    give_up_at = None if timeout is None else time.monotonic() + timeout
+    while pending:
+        remaining = None if give_up_at is None else max(0.0, give_up_at - time.monotonic())
+        done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            break
+        for task in done:
+            if task.exception() is None:
+                results[tasks[task]] = task.result()
+            else:
+                errors[tasks[task]] = task.exception()
+    for task in pending:
+        task.cancel()
+    return results, errors
+
+
+# -----------------------------
+# Tuning Simulation
+# -----------------------------
+def simulate(jobs, services, regions, latency_ms, max_threads, service_limit, region_limit):
+    # Runs `jobs` fake describe calls spread over services and regions, each
+    # blocking for `latency_ms`, and returns the wall time and engine stats
+    async def main():
+        engine = Engine(max_threads, service_limit, region_limit)
+        work = {
+            i: engine.submit(time.sleep, latency_ms / 1000,
+                             services=[f"service{i % services}"], region=f"region-{i % regions}")
+            for i in range(jobs)
+        }
+        started = time.perf_counter()
+        await run_jobs(engine, work)
+        wall = time.perf_counter() - started
+        engine.shutdown()
+        return wall, engine.stats()
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate the asyncio engine on many blocking calls to tune its limits.')
+    parser.add_argument('--jobs', type=int, default=2000, help='Concurrent describe calls (default: 2000)')
+    parser.add_argument('--services', type=int, default=4)
+    parser.add_argument('--regions', type=int, default=17)
+    parser.add_argument('--latency-ms', type=float, default=50, help='Time each call blocks (default: 50)')
+    parser.add_argument('--threads', type=int, action='append', help='Executor sizes to try (repeatable)')
+    parser.add_argument('--service-limit', type=int, default=ENGINE_SERVICE_CONCURRENCY)
+    parser.add_argument('--region-limit', type=int, default=ENGINE_REGION_CONCURRENCY)
+    args = parser.parse_args()
+
+    print(f"{'threads':>7} {'wall s':>7} {'peak':>5} {'queue ms avg':>13} {'p95':>8} {'max':>8}")
+    for threads in args.threads or [16, 64, 256]:
+        wall, stats = simulate(args.jobs, args.services, args.regions, args.latency_ms, threads,
+                               args.service_limit, args.region_limit)
+        print(f"{threads:>7} {wall:>7.2f} {stats['peak_in_flight']:>5} {stats['queue_ms_avg']:>13.1f} "
+              f"{stats['queue_ms_p95']:>8.1f} {stats['queue_ms_max']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+# Local stand-in for the AWS APIs the checker calls.
+# Hooks the same botocore 'before-call' event that botocore's Stubber uses,
+# but generates realistically sized, paginated responses on the fly instead
+# of replaying a fixed queue, so any number of threads can call it in any
+# order. Used by benchmark.py and for offline runs of the handler.
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+
+INSTANCE_TYPES = ['t3.micro', 't3.small', 't3.medium', 'm5.large', 'c5.large', 'r5.large']
+VOLUME_TYPES = ['gp3', 'gp2', 'io1', 'st1']
+DB_CLASSES = ['db.t3.micro', 'db.t3.medium', 'db.m5.large', 'db.r5.large']
+
+
+class FakeAWS:
+    def __init__(self, instances=50, volumes=20, db_instances=5, clusters=2, services_per_cluster=5,
+                 addresses=3, regions=('us-west-2',), accounts=('123456789012',), latency_ms=0, throttle_rate=0.0, seed=0,
+                 tail_rate=0.0, tail_latency_ms=0, config_regions=None):
+        self.instances = instances
+        self.volumes = volumes
+        self.db_instances = db_instances
+        self.clusters = clusters
+        self.services_per_cluster = services_per_cluster
+        self.addresses = addresses
+        self.regions = list(regions)
+        # Every account holds the same resources; they only differ in AWS Config results
+        self.accounts = list(accounts)
+        # Regions the fake Config aggregator has synced; the rest it does not cover
+        self.config_regions = list(regions if config_regions is None else config_regions)
+        self.latency_ms = latency_ms
+        self.throttle_rate = throttle_rate
+        # Share of calls that stall for tail_latency_ms, like a slow region or host
+        self.tail_rate = tail_rate
+        self.tail_latency_ms = tail_latency_ms
+        self.calls = Counter()
+        self.throttled = 0
+        self.published_bytes = 0
+        self.uploaded_bytes = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def install(self, session):
+        # session is a boto3 Session; every client created from it afterwards uses the stand-in
+        session.events.register('before-parameter-build', self._remember_params)
+        session.events.register('before-call', self._respond)
+        return session
+
+    @classmethod
+    def supported_operations(cls):
+        # API operation names with a generated response (_DescribeInstances etc.)
+        return sorted(name[1:] for name in dir(cls) if name[1:2].isupper() and callable(getattr(cls, name)))
+
+    def _remember_params(self, params, context, **kwargs):
+        context['fake_params'] = dict(params)
+
+    def _respond(self, model, context, **kwargs):
+        operation = model.name
+        with self._lock:
+            self.calls[operation] += 1
+            jitter = self._random.uniform(0.5, 1.5)
+            throttle = self._random.random() < self.throttle_rate
+            stall = self._random.random() < self.tail_rate
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000 * jitter)
+        if stall:
+            time.sleep(self.tail_latency_ms / 1000)
+        if throttle:
+            with self._lock:
+                self.throttled += 1
+            raise ClientError({'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}, operation)
+
+        handler = getattr(self, f"_{operation}", None)
+        if handler is None:
+            # Fails like AWS does for an unsupported call; the checker reports
+            # the check that made it as failed (CheckFailed in script.py) and
+            # still sends the rest of the report
+            raise ClientError({'Error': {
+                'Code': 'UnsupportedOperation',
+                'Message': f"FakeAWS does not implement {operation}; it supports {', '.join(self.supported_operations())}",
+            }}, operation)
+        return AWSResponse(None, 200, {}, None), handler(context['fake_params'])
+
+    # -----------------------------
+    # Pagination
+    # -----------------------------
+    def _page(self, count, make_item, params, token_key, limit_key, default_limit, result_key, next_key=None):
+        start = int(params.get(token_key) or 0)
+        limit = params.get(limit_key) or default_limit or count
+        end = min(count, start + limit)
+        response = {result_key: [make_item(i) for i in range(start, end)]}
+        if end < count:
+            response[next_key or token_key] = str(end)
+        return response
+
+    # -----------------------------
+    # EC2
+    # -----------------------------
+    def _DescribeRegions(self, params):
+        return {'Regions': [{'RegionName': region} for region in self.regions]}
+
+    def _DescribeInstances(self, params):
+        def reservation(i):
+            return {'ReservationId': f"r-{i:08x}", 'Instances': [{
+                'InstanceId': f"i-{i:017x}",
+                'InstanceType': INSTANCE_TYPES[i % len(INSTANCE_TYPES)],
+                'State': {'Code': 16, 'Name': 'running'},
+                'PrivateIpAddress': f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+                'Tags': [{'Key': 'Name', 'Value': f"app-{i}"}],
+            }]}
+        return self._page(self.instances, reservation, params, 'NextToken', 'MaxResults', None, 'Reservations')
+
+    def _volume(self, i):
+        return {
+            'VolumeId': f"vol-{i:017x}",
+            'Size': 8 + (i % 16) * 8,
+            'VolumeType': VOLUME_TYPES[i % len(VOLUME_TYPES)],
+            'State': 'available' if i % 10 == 0 else 'in-use',
+            'AvailabilityZone': 'us-west-2a',
+            'Attachments': [] if i % 10 == 0 else [{'InstanceId': f"i-{i % max(self.instances, 1):017x}"}],
+        }
+
+    def _DescribeVolumes(self, params):
+        filters = {f['Name']: f['Values'] for f in params.get('Filters', [])}
+        if 'status' in filters:
+            volumes = [v for v in map(self._volume, range(self.volumes)) if v['State'] in filters['status']]
+            return self._page(len(volumes), volumes.__getitem__, params, 'NextToken', 'MaxResults', None, 'Volumes')
+        return self._page(self.volumes, self._volume, params, 'NextToken', 'MaxResults', None, 'Volumes')
+
+    def _DescribeAddresses(self, params):
+        def address(i):
+            addr = {'PublicIp': f"198.51.{i >> 8 & 255}.{i & 255}", 'AllocationId': f"eipalloc-{i:08x}", 'Domain': 'vpc'}
+            if i % 3:
+                addr['InstanceId'] = f"i-{i % max(self.instances, 1):017x}"
+                addr['AssociationId'] = f"eipassoc-{i:08x}"
+            return addr
+        return {'Addresses': [address(i) for i in range(self.addresses)]}
+
+    # -----------------------------
+    # RDS
+    # -----------------------------
+    def _DescribeDBInstances(self, params):
+        def db(i):
+            return {
+                'DBInstanceIdentifier': f"db-{i}",
+                'DBInstanceClass': DB_CLASSES[i % len(DB_CLASSES)],
+                'DBInstanceStatus': 'stopped' if i % 7 == 0 else 'available',
+                'Engine': 'postgres',
+            }
+        return self._page(self.db_instances, db, params, 'Marker', 'MaxRecords', 100, 'DBInstances')
+
+    # -----------------------------
+    # ECS
+    # -----------------------------
+    def _cluster_arn(self, i):
+        return f"arn:aws:ecs:us-west-2:123456789012:cluster/cluster-{i}"
+
+    def _ListClusters(self, params):
+        return self._page(self.clusters, self._cluster_arn, params, 'nextToken', 'maxResults', 100, 'clusterArns')
+
+    def _ListServices(self, params):
+        cluster = params['cluster'].rsplit('-', 1)[-1]
+        def service_arn(i):
+            return f"arn:aws:ecs:us-west-2:123456789012:service/cluster-{cluster}/service-{i}"
+        return self._page(self.services_per_cluster, service_arn, params, 'nextToken', 'maxResults', 10, 'serviceArns')
+
+    def _DescribeServices(self, params):
+        if len(params['services']) > 10:
+            raise ClientError({'Error': {'Code': 'InvalidParameterException', 'Message': 'Too many services'}}, 'DescribeServices')
+        return {'services': [
+            {'serviceArn': arn, 'serviceName': arn.rsplit('/', 1)[-1], 'runningCount': 0 if i % 4 == 0 else 2}
+            for i, arn in enumerate(params['services'])
+        ], 'failures': []}
+
+    # -----------------------------
+    # CloudWatch
+    # -----------------------------
+    def _GetMetricData(self, params):
+        queries = params['MetricDataQueries']
+        if len(queries) > 500:
+            raise ClientError({'Error': {'Code': 'ValidationError', 'Message': 'Too many queries'}}, 'GetMetricData')
+        results = []
+        for n, query in enumerate(queries):
+            peak = 1.0 if n % 5 == 0 else 35.0
+            results.append({'Id': query['Id'], 'Label': query['Id'], 'Values': [peak / 2, peak], 'StatusCode': 'Complete'})
+        return {'MetricDataResults': results, 'Messages': []}
+
+    # -----------------------------
+    # STS
+    # -----------------------------
+    def _GetCallerIdentity(self, params):
+        return {'Account': self.accounts[0], 'Arn': f"arn:aws:iam::{self.accounts[0]}:user/fake", 'UserId': 'FAKE'}
+
+    def _AssumeRole(self, params):
+        return {'Credentials': {
+            'AccessKeyId': 'fake', 'SecretAccessKey': 'fake', 'SessionToken': 'fake',
+            'Expiration': datetime.now(timezone.utc) + timedelta(hours=1),
+        }}
+
+    # -----------------------------
+    # AWS Config
+    # -----------------------------
+    def _config_item(self, resource_type, i):
+        # Same resources as the Describe handlers, in AWS Config's JSON shape
+        if resource_type == 'AWS::EC2::Instance':
+            instance = self._DescribeInstances({'NextToken': str(i), 'MaxResults': 1})['Reservations'][0]['Instances'][0]
+            return {'resourceId': instance['InstanceId'], 'configuration': {
+                'instanceType': instance['InstanceType'], 'state': {'name': instance['State']['Name']}}}
+        if resource_type == 'AWS::RDS::DBInstance':
+            db = self._DescribeDBInstances({'Marker': str(i), 'MaxRecords': 1})['DBInstances'][0]
+            return {'resourceName': db['DBInstanceIdentifier'], 'configuration': {
+                'dBInstanceClass': db['DBInstanceClass'], 'dBInstanceStatus': db['DBInstanceStatus'], 'engine': db['Engine']}}
+        if resource_type == 'AWS::EC2::Volume':
+            volume = self._volume(i)
+            return {'resourceId': volume['VolumeId'], 'configuration': {
+                'volumeType': volume['VolumeType'], 'size': volume['Size'], 'state': volume['State']}}
+        address = self._DescribeAddresses({})['Addresses'][i]
+        return {'configuration': {'publicIp': address['PublicIp'], 'instanceId': address.get('InstanceId')}}
+
+    def _SelectAggregateResourceConfig(self, params):
+        resource_type = params['Expression'].split("resourceType = '", 1)[1].split("'", 1)[0]
+        count = {
+            'AWS::EC2::Instance': self.instances,
+            'AWS::RDS::DBInstance': self.db_instances,
+            'AWS::EC2::Volume': self.volumes,
+            'AWS::EC2::EIP': self.addresses,
+        }[resource_type]
+        scopes = [(account, region) for account in self.accounts for region in self.config_regions]
+
+        def result(n):
+            account, region = scopes[n // count]
+            item = dict(self._config_item(resource_type, n % count), accountId=account, awsRegion=region)
+            return json.dumps(item)
+        return self._page(count * len(scopes), result, params, 'NextToken', 'Limit', 100, 'Results')
+
+    def _DescribeConfigurationAggregatorSourcesStatus(self, params):
+        return {'AggregatedSourceStatusList': [
+            {'SourceId': account, 'SourceType': 'ACCOUNT', 'AwsRegion': region, 'LastUpdateStatus': 'SUCCEEDED'}
+            for account in self.accounts
+            for region in self.config_regions
+        ]}
+
+    # -----------------------------
+    # SNS and S3
+    # -----------------------------
+    def _Publish(self, params):
+        with self._lock:
+            self.published_bytes += len(params['Message'].encode())
+        return {'MessageId': '00000000-0000-0000-0000-000000000000'}
+
+    def _PutObject(self, params):
+        size = len(params['Body'].read())
+        with self._lock:
+            self.uploaded_bytes += size
+        return {'ETag': '"fake"'}
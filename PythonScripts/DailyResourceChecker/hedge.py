@@ -0,0 +1,218 @@
+# Hedged requests for the read-only Describe calls of the daily checks.
+# One slow page in one region sets the latency of the whole report. With
+# hedging on, a call that is still waiting after its API's p95 latency gets
+# a duplicate, and whichever answers first is used. The other is cancelled:
+# stopped before its next retry or before its response is parsed, which is
+# where a large Describe page costs the most CPU (a request already on the
+# wire cannot be recalled). Hedges are paid for from a global budget (a
+# share of all calls plus a small burst), and an API that has been
+# throttled in the invocation is not hedged again, so hedging cannot add to
+# throttling. Latencies are kept per API for the life of the container.
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from metrics import bind, throttles
+
+HEDGED_REQUESTS = os.environ.get('HEDGED_REQUESTS', 'false').lower() == 'true'
+# Hedges allowed per primary call, plus the burst a run may start with
+HEDGE_BUDGET_RATIO = float(os.environ.get('HEDGE_BUDGET_RATIO', '0.1'))
+HEDGE_BUDGET_BURST = float(os.environ.get('HEDGE_BUDGET_BURST', '5'))
+# Calls are not hedged before this delay, nor before an API has enough
+# samples for a p95 (until then HEDGE_INITIAL_DELAY_MS applies)
+HEDGE_MIN_DELAY_MS = float(os.environ.get('HEDGE_MIN_DELAY_MS', '50'))
+HEDGE_INITIAL_DELAY_MS = float(os.environ.get('HEDGE_INITIAL_DELAY_MS', '1000'))
+HEDGE_MIN_SAMPLES = 20
+# Latencies kept per API for its p95
+HEDGE_WINDOW = 200
+# Hedges running at once; a call that would need one more is not hedged
+HEDGE_MAX_WORKERS = int(os.environ.get('HEDGE_MAX_WORKERS', '32'))
+
+_lock = threading.Lock()
+# The cancel flag of the attempt running on this thread
+_local = threading.local()
+_latencies = defaultdict(lambda: deque(maxlen=HEDGE_WINDOW))
+_stats = defaultdict(Counter)
+_enabled = HEDGED_REQUESTS
+_tokens = HEDGE_BUDGET_BURST
+_pool = None
+_hedge_slots = threading.BoundedSemaphore(HEDGE_MAX_WORKERS)
+
+
+class HedgeCancelled(Exception):
+    # Stops the attempt that lost the race; nobody is waiting for it
+    abandoned = True
+
+
+def set_hedging(enabled):
+    # Per invocation; resets the budget and the hit counts, keeps latencies
+    global _enabled, _tokens
+    with _lock:
+        _enabled = bool(enabled)
+        _tokens = HEDGE_BUDGET_BURST
+        _stats.clear()
+
+
+def hedging_enabled():
+    return _enabled
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix='hedge')
+        return _pool
+
+
+def hedge_delay(api):
+    # Seconds to wait before hedging a call to `api`
+    with _lock:
+        samples = sorted(_latencies[api])
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_INITIAL_DELAY_MS / 1000
+    return max(HEDGE_MIN_DELAY_MS / 1000, samples[int(len(samples) * 0.95)])
+
+
+def _take_budget(api):
+    # One hedge costs one token; every primary call earns HEDGE_BUDGET_RATIO.
+    # An API throttled in this invocation (counted by metrics.py, with or
+    # without the shared rate limiter) is not hedged for the rest of it.
+    global _tokens
+    if throttles(api):
+        with _lock:
+            _stats[api]['throttled_skips'] += 1
+        return False
+    with _lock:
+        if _tokens < 1:
+            _stats[api]['budget_skips'] += 1
+            return False
+        _tokens -= 1
+        return True
+
+
+def _stop_if_cancelled(**kwargs):
+    cancelled = getattr(_local, 'cancelled', None)
+    if cancelled is not None and cancelled.is_set():
+        raise HedgeCancelled()
+
+
+def _attempt(api, method, kwargs, cancelled, timed):
+    # Runs one attempt; the primary's latency is recorded even when nobody waits for it
+    _local.cancelled = cancelled
+    started = time.perf_counter()
+    try:
+        return method(**kwargs)
+    finally:
+        _local.cancelled = None
+        if timed:
+            with _lock:
+                _latencies[api].append(time.perf_counter() - started)
+
+
+def _start_primary(api, method, kwargs, cancelled):
+    # The primary starts at once on a thread of its own: a shared pool would
+    # cap every API call in the run at its size and count queueing towards
+    # the hedge delay, and the caller has to stay free to take the hedge's
+    # answer while the primary is still blocked on its socket
+    primary = Future()
+
+    def run():
+        try:
+            primary.set_result(_attempt(api, method, kwargs, cancelled, True))
+        except BaseException as e:
+            primary.set_exception(e)
+
+    # start() returns once the thread runs, so the hedge delay starts with the call
+    threading.Thread(target=bind(run), name='hedge-primary', daemon=True).start()
+    return primary
+
+
+def _start_hedge(api, method, kwargs, cancelled):
+    # Hedges only run on a free worker of their own pool, never queued, so a
+    # hedge is never spent on a call that cannot start right away
+    if not _hedge_slots.acquire(blocking=False):
+        with _lock:
+            _stats[api]['busy_skips'] += 1
+        return None
+    hedge = _get_pool().submit(bind(_attempt), api, method, kwargs, cancelled, False)
+    hedge.add_done_callback(lambda _: _hedge_slots.release())
+    return hedge
+
+
+def hedged(client, operation_name, method=None):
+    # Wraps a client method (e.g. client.describe_db_instances) so slow calls are hedged
+    method = method or getattr(client, operation_name)
+    api = (client.meta.service_model.service_name, client.meta.method_to_api_mapping.get(operation_name, operation_name))
+    # unique_id keeps these to one registration per client
+    client.meta.events.register('before-send', _stop_if_cancelled, unique_id='hedge-before-send')
+    client.meta.events.register('before-parse', _stop_if_cancelled, unique_id='hedge-before-parse')
+
+    def call(**kwargs):
+        global _tokens
+        if not _enabled:
+            return method(**kwargs)
+        with _lock:
+            _stats[api]['calls'] += 1
+            _tokens = min(HEDGE_BUDGET_BURST, _tokens + HEDGE_BUDGET_RATIO)
+        cancel_primary, cancel_hedge = threading.Event(), threading.Event()
+        primary = _start_primary(api, method, kwargs, cancel_primary)
+        done, _ = wait([primary], timeout=hedge_delay(api))
+        if done or not _take_budget(api):
+            return primary.result()
+        hedge = _start_hedge(api, method, kwargs, cancel_hedge)
+        if hedge is None:
+            return primary.result()
+
+        with _lock:
+            _stats[api]['hedged'] += 1
+        done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        first = hedge if hedge in done and primary not in done else primary
+        if first.exception() is not None:
+            # The first answer failed, so the other one decides
+            first = hedge if first is primary else primary
+        if first is hedge:
+            cancel_primary.set()
+            with _lock:
+                _stats[api]['hedge_wins'] += 1
+        else:
+            cancel_hedge.set()
+        return first.result()
+    return call
+
+
+def hedge_stats():
+    with _lock:
+        return {api: dict(counts) for api, counts in _stats.items()}
+
+
+def log_hedge_stats():
+    for (service, operation), counts in sorted(hedge_stats().items()):
+        print(
+            f"hedge {service}.{operation}: calls={counts.get('calls', 0)} hedged={counts.get('hedged', 0)} "
+            f"wins={counts.get('hedge_wins', 0)} budget_skips={counts.get('budget_skips', 0)} busy_skips={counts.get('busy_skips', 0)} "
+            f"throttled_skips={counts.get('throttled_skips', 0)} p95_ms={hedge_delay((service, operation)) * 1000:.0f}"
+        )
+
+
+def render_hedge_summary():
+    # One report line with the hedge and hit rates, when hedging was on
+    if not _enabled:
+        return []
+    totals = Counter()
+    for counts in hedge_stats().values():
+        totals.update(counts)
+    if not totals['calls']:
+        return []
+    hedge_rate = totals['hedged'] / totals['calls'] * 100
+    hit_rate = totals['hedge_wins'] / totals['hedged'] * 100 if totals['hedged'] else 0.0
+    line = (
+        f"🏁 Hedged requests: {totals['hedged']} of {totals['calls']} calls hedged ({hedge_rate:.1f}%), "
+        f"{totals['hedge_wins']} answered first (hit rate {hit_rate:.0f}%)"
+    )
+    skipped = totals['budget_skips'] + totals['throttled_skips'] + totals['busy_skips']
+    if skipped:
+        line += f"; {skipped} not hedged to stay within the budget, after throttling or with no free hedge worker"
+    return [line + "\n"]
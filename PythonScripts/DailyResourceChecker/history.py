@@ -0,0 +1,257 @@
+# Inventory history for the daily resource checks.
+# Optionally (HISTORY_PATH) every run's inventory is appended to an indexed
+# SQLite database, kept locally or synced to S3, so questions such as "how
+# long has this volume been unattached?" are one query instead of a search
+# through old emails. Rows are written with batched executemany inserts in a
+# single transaction, and the primary keys double as the indexes the CLI
+# queries use, so they stay fast over a year of daily runs.
+import argparse
+import os
+import sqlite3
+import time
+from collections import Counter
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+from clients import get_client
+
+# Local path or s3://bucket/key; history is off when empty
+HISTORY_PATH = os.environ.get('HISTORY_PATH', '')
+# Working copy of a history kept in S3
+HISTORY_LOCAL_PATH = os.environ.get('HISTORY_LOCAL_PATH', '/tmp/daily-resource-history.sqlite')
+
+# Resources per key lookup; older SQLite builds allow 999 bound parameters
+KEY_LOOKUP_CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    taken_at TEXT NOT NULL
+);
+-- Checks that completed in each run; a resource missing from a completed
+-- check is gone, a resource missing from an unfinished one is unknown
+CREATE TABLE IF NOT EXISTS run_checks (
+    scope TEXT NOT NULL,
+    check_name TEXT NOT NULL,
+    run_id INTEGER NOT NULL,
+    PRIMARY KEY (scope, check_name, run_id)
+) WITHOUT ROWID;
+-- Each resource is stored once; daily observations refer to it by key
+CREATE TABLE IF NOT EXISTS resources (
+    resource_key INTEGER PRIMARY KEY,
+    resource TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    check_name TEXT NOT NULL,
+    UNIQUE (resource, scope, check_name)
+);
+CREATE TABLE IF NOT EXISTS observations (
+    resource_key INTEGER NOT NULL,
+    run_id INTEGER NOT NULL,
+    state,
+    PRIMARY KEY (resource_key, run_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS observations_by_run ON observations (run_id);
+-- Resources per state in each run, so trends never scan observations
+CREATE TABLE IF NOT EXISTS run_totals (
+    run_id INTEGER NOT NULL,
+    scope TEXT NOT NULL,
+    check_name TEXT NOT NULL,
+    state,
+    resources INTEGER NOT NULL,
+    PRIMARY KEY (run_id, scope, check_name, state)
+) WITHOUT ROWID;
+"""
+
+
+def _split_s3_path(path):
+    bucket, _, key = path[len('s3://'):].partition('/')
+    return bucket, key
+
+
+def connect(path):
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    return db
+
+
+def _resource_keys(db, scope, name, resources):
+    # Keys of this run's resources only, so a write costs the same however
+    # many resources the history has seen; chunked under SQLite's limit on
+    # bound parameters
+    keys = {}
+    for i in range(0, len(resources), KEY_LOOKUP_CHUNK):
+        chunk = resources[i:i + KEY_LOOKUP_CHUNK]
+        keys.update(db.execute(
+            "SELECT resource, resource_key FROM resources WHERE scope = ? AND check_name = ? "
+            f"AND resource IN ({', '.join('?' * len(chunk))})",
+            (scope, name, *chunk),
+        ))
+    return keys
+
+
+def append_run(db, inventory, taken_at):
+    # inventory: {scope: {check: {resource: state}}}, as built for snapshots
+    with db:
+        run_id = db.execute("INSERT INTO runs (taken_at) VALUES (?)", (taken_at,)).lastrowid
+        for scope, checks in inventory.items():
+            for name, resources in checks.items():
+                db.execute("INSERT INTO run_checks (scope, check_name, run_id) VALUES (?, ?, ?)", (scope, name, run_id))
+                db.executemany(
+                    "INSERT OR IGNORE INTO resources (resource, scope, check_name) VALUES (?, ?, ?)",
+                    ((resource, scope, name) for resource in resources),
+                )
+                keys = _resource_keys(db, scope, name, list(resources))
+                db.executemany(
+                    "INSERT INTO observations (resource_key, run_id, state) VALUES (?, ?, ?)",
+                    ((keys[resource], run_id, state) for resource, state in resources.items()),
+                )
+                db.executemany(
+                    "INSERT INTO run_totals (run_id, scope, check_name, state, resources) VALUES (?, ?, ?, ?, ?)",
+                    ((run_id, scope, name, state, count) for state, count in Counter(resources.values()).items()),
+                )
+    return run_id
+
+
+def record_history(path, inventory, session):
+    # Appends this run's inventory; failures are logged and never fail the report
+    started = time.perf_counter()
+    taken_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        if path.startswith('s3://'):
+            bucket, key = _split_s3_path(path)
+            s3 = get_client('s3', session=session)
+            try:
+                s3.download_file(bucket, key, HISTORY_LOCAL_PATH)
+            except ClientError as e:
+                # First run: start a new history
+                if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                    raise
+                if os.path.exists(HISTORY_LOCAL_PATH):
+                    os.remove(HISTORY_LOCAL_PATH)
+            db = connect(HISTORY_LOCAL_PATH)
+            run_id = append_run(db, inventory, taken_at)
+            db.close()
+            s3.upload_file(HISTORY_LOCAL_PATH, bucket, key)
+        else:
+            db = connect(path)
+            run_id = append_run(db, inventory, taken_at)
+            db.close()
+    except (ClientError, OSError, sqlite3.Error) as e:
+        print(f"⚠️ Could not append to inventory history {path}: {e}")
+        return
+    print(f"history: run_id={run_id} ms={(time.perf_counter() - started) * 1000:.1f}")
+
+
+# -----------------------------
+# Queries
+# -----------------------------
+# For every scope and check a resource is in, the run its current state began:
+# the first run after the last completed run where it was absent or different
+AGE_QUERY = """
+WITH latest AS (
+    SELECT r.resource_key, r.scope, r.check_name, o.state, MAX(o.run_id) AS run_id
+    FROM resources r JOIN observations o ON o.resource_key = r.resource_key
+    WHERE r.resource = :resource
+    GROUP BY r.resource_key
+)
+SELECT latest.scope, latest.check_name, latest.state, latest.run_id,
+    (SELECT MIN(o.run_id) FROM observations o
+     WHERE o.resource_key = latest.resource_key AND o.state IS latest.state
+       AND o.run_id > COALESCE((
+           SELECT MAX(c.run_id) FROM run_checks c
+           WHERE c.scope = latest.scope AND c.check_name = latest.check_name AND c.run_id < latest.run_id
+             AND NOT EXISTS (
+                 SELECT 1 FROM observations p
+                 WHERE p.resource_key = latest.resource_key AND p.run_id = c.run_id AND p.state IS latest.state)
+       ), 0)) AS since_run_id
+FROM latest
+ORDER BY latest.scope, latest.check_name
+"""
+
+TREND_QUERY = """
+SELECT ru.taken_at, t.scope, t.check_name, SUM(t.resources)
+FROM runs ru JOIN run_totals t ON t.run_id = ru.run_id
+WHERE ru.taken_at >= :since AND (:check_name IS NULL OR t.check_name = :check_name)
+  AND (:state IS NULL OR t.state = :state)
+GROUP BY ru.run_id, t.scope, t.check_name
+ORDER BY ru.run_id, t.scope, t.check_name
+"""
+
+
+def _taken_at(db, run_id):
+    return db.execute("SELECT taken_at FROM runs WHERE run_id = ?", (run_id,)).fetchone()[0]
+
+
+def resource_age(db, resource):
+    # Returns (scope, check, state, since, last seen, days in state) per scope and check
+    rows = []
+    for scope, name, state, last_run, since_run in db.execute(AGE_QUERY, {'resource': resource}).fetchall():
+        since, last_seen = _taken_at(db, since_run), _taken_at(db, last_run)
+        days = (datetime.fromisoformat(last_seen) - datetime.fromisoformat(since)).total_seconds() / 86400
+        rows.append((scope, name, state, since, last_seen, days))
+    return rows
+
+
+def trend(db, check_name=None, state=None, days=30):
+    # Returns (taken_at, scope, check, resource count) per run over the last `days` days
+    since = datetime.utcfromtimestamp(time.time() - days * 86400).strftime('%Y-%m-%d %H:%M:%S')
+    return db.execute(TREND_QUERY, {'since': since, 'check_name': check_name, 'state': state}).fetchall()
+
+
+def oldest(db, check_name, state, limit=20):
+    # Resources in `state` in the latest run of the check, longest in that state first
+    latest = db.execute("SELECT MAX(run_id) FROM run_checks WHERE check_name = ?", (check_name,)).fetchone()[0]
+    if latest is None:
+        return []
+    resources = [row[0] for row in db.execute(
+        "SELECT r.resource FROM observations o JOIN resources r ON r.resource_key = o.resource_key "
+        "WHERE o.run_id = ? AND r.check_name = ? AND o.state = ?",
+        (latest, check_name, state),
+    )]
+    ages = [
+        (scope, resource, since, days)
+        for resource in resources
+        for scope, name, current, since, _, days in resource_age(db, resource)
+        if name == check_name and current == state
+    ]
+    return sorted(ages, key=lambda age: age[3], reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the inventory history written by the daily resource checker.')
+    local_history = HISTORY_PATH if HISTORY_PATH and not HISTORY_PATH.startswith('s3://') else HISTORY_LOCAL_PATH
+    parser.add_argument('--db', default=local_history,
+                        help='SQLite history file (download it first if it is kept in S3)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    age_parser = commands.add_parser('age', help='How long a resource has been in its current state')
+    age_parser.add_argument('resource', help='Resource id, e.g. vol-0123456789abcdef0')
+    trend_parser = commands.add_parser('trend', help='Resources per check and run')
+    trend_parser.add_argument('--check', help='Only this check, e.g. ebs')
+    trend_parser.add_argument('--state', help='Only resources in this state, e.g. unattached')
+    trend_parser.add_argument('--days', type=int, default=30)
+    oldest_parser = commands.add_parser('oldest', help='Resources longest in a state, e.g. ebs unattached')
+    oldest_parser.add_argument('check')
+    oldest_parser.add_argument('state')
+    oldest_parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    db = connect(args.db)
+    if args.command == 'age':
+        rows = resource_age(db, args.resource)
+        if not rows:
+            print(f"{args.resource} is not in the history.")
+        for scope, name, state, since, last_seen, days in rows:
+            print(f"{args.resource} ({name} in {scope}): {state} since {since}, last seen {last_seen} ({days:.1f} days)")
+    elif args.command == 'trend':
+        for taken_at, scope, name, count in trend(db, args.check, args.state, args.days):
+            print(f"{taken_at}  {scope:<28} {name:<6} {count:>8}")
+    else:
+        for scope, resource, since, days in oldest(db, args.check, args.state, args.limit):
+            print(f"{resource:<30} {scope:<28} since {since} ({days:.1f} days)")
+    print(f"({(time.perf_counter() - started) * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# Idle-resource detection for running EC2 and RDS instances.
+# Every metric for every instance is packed into GetMetricData calls of up to
+# 500 queries each, the batches run concurrently, and each series is reduced
+# to its peak in one pass, so a region costs one or two API calls rather than
+# one per resource.
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from metrics import bind
+
+# GetMetricData accepts at most 500 queries per call
+METRIC_BATCH_SIZE = 500
+METRIC_MAX_WORKERS = int(os.environ.get('METRIC_MAX_WORKERS', '4'))
+
+IDLE_LOOKBACK_DAYS = int(os.environ.get('IDLE_LOOKBACK_DAYS', '7'))
+IDLE_PERIOD_SECONDS = 3600
+IDLE_CPU_PERCENT = float(os.environ.get('IDLE_CPU_PERCENT', '5'))
+
+# (resource kind, namespace, dimension, metric, statistic, idle when peak is at or below)
+IDLE_METRICS = [
+    ('EC2', 'AWS/EC2', 'InstanceId', 'CPUUtilization', 'Maximum', IDLE_CPU_PERCENT),
+    ('RDS', 'AWS/RDS', 'DBInstanceIdentifier', 'CPUUtilization', 'Maximum', IDLE_CPU_PERCENT),
+    ('RDS', 'AWS/RDS', 'DBInstanceIdentifier', 'DatabaseConnections', 'Maximum', 0),
+]
+
+
+def build_metric_queries(resources):
+    # resources: {'EC2': [instance ids], 'RDS': [db identifiers]}
+    # Returns the queries plus a parallel list of (kind, resource id, metric, threshold)
+    queries = []
+    targets = []
+    for kind, namespace, dimension, metric, stat, threshold in IDLE_METRICS:
+        for resource_id in resources.get(kind, []):
+            queries.append({
+                'Id': f"m{len(queries)}",
+                'MetricStat': {
+                    'Metric': {
+                        'Namespace': namespace,
+                        'MetricName': metric,
+                        'Dimensions': [{'Name': dimension, 'Value': resource_id}],
+                    },
+                    'Period': IDLE_PERIOD_SECONDS,
+                    'Stat': stat,
+                },
+                'ReturnData': True,
+            })
+            targets.append((kind, resource_id, metric, threshold))
+    return queries, targets
+
+
+def fetch_peaks(cloudwatch, queries, start, end):
+    # Returns {query id: peak value} for one batch; series without data are left out
+    peaks = {}
+    paginator = cloudwatch.get_paginator('get_metric_data')
+    for page in paginator.paginate(MetricDataQueries=queries, StartTime=start, EndTime=end):
+        for result in page['MetricDataResults']:
+            if result['Values']:
+                # A series can continue on the next page, so keep the running peak
+                peak = max(result['Values'])
+                peaks[result['Id']] = max(peak, peaks.get(result['Id'], peak))
+    return peaks
+
+
+def find_idle_resources(cloudwatch, resources, max_workers=METRIC_MAX_WORKERS):
+    # Returns sorted (kind, resource id, {metric: peak}) for every resource whose
+    # metrics all stayed at or below their idle threshold
+    queries, targets = build_metric_queries(resources)
+    if not queries:
+        return []
+
+    end = datetime.utcnow()
+    start = end - timedelta(days=IDLE_LOOKBACK_DAYS)
+    batches = [queries[i:i + METRIC_BATCH_SIZE] for i in range(0, len(queries), METRIC_BATCH_SIZE)]
+    peaks = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for batch_peaks in pool.map(bind(lambda batch: fetch_peaks(cloudwatch, batch, start, end)), batches):
+            peaks.update(batch_peaks)
+
+    # A resource is idle only if it reported data and every metric stayed under its threshold
+    busy = set()
+    observed = {}
+    for index, (kind, resource_id, metric, threshold) in enumerate(targets):
+        peak = peaks.get(f"m{index}")
+        if peak is None:
+            continue
+        observed.setdefault((kind, resource_id), {})[metric] = peak
+        if peak > threshold:
+            busy.add((kind, resource_id))
+
+    return sorted(
+        (kind, resource_id, metrics)
+        for (kind, resource_id), metrics in observed.items()
+        if (kind, resource_id) not in busy
+    )
@@ -0,0 +1,149 @@
+# Per-check timing and API-call instrumentation.
+# Every client the checker creates is hooked through the botocore event
+# system, so calls, retries, throttles and API time are counted without
+# touching the collectors. Calls are attributed to the check running on the
+# current thread. At the end of the invocation everything is printed as one
+# CloudWatch Embedded Metric Format (EMF) log line, which CloudWatch turns
+# into metrics without any extra API calls.
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'DailyResourceChecker')
+
+THROTTLE_ERROR_CODES = {'Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequestsException'}
+
+_local = threading.local()
+_lock = threading.Lock()
+_counts = defaultdict(Counter)
+_durations_ms = defaultdict(float)
+# Throttles in this invocation per (service, operation), for hedging
+_throttles_by_api = Counter()
+
+
+def reset_metrics():
+    with _lock:
+        _counts.clear()
+        _durations_ms.clear()
+        _throttles_by_api.clear()
+
+
+def current_check():
+    return getattr(_local, 'check', 'handler')
+
+
+@contextmanager
+def timed_check(name):
+    previous = current_check()
+    _local.check = name
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _durations_ms[name] += (time.perf_counter() - started) * 1000
+        _local.check = previous
+
+
+def bind(fn):
+    # Carries the current check over to work handed to another thread pool
+    check = current_check()
+
+    def run(*args, **kwargs):
+        previous = current_check()
+        _local.check = check
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.check = previous
+    return run
+
+
+def _record(**counts):
+    with _lock:
+        _counts[current_check()].update(counts)
+
+
+def _before_call(context, **kwargs):
+    context['metrics_started'] = time.perf_counter()
+
+
+def _after_call(http_response, parsed, context, **kwargs):
+    # Error responses from AWS (including throttling once retries run out)
+    # come through here, before botocore raises them as a ClientError;
+    # throttles are already counted per attempt in _needs_retry
+    started = context.get('metrics_started', time.perf_counter())
+    _record(
+        ApiCalls=1,
+        Retries=parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0),
+        Errors=1 if http_response.status_code >= 400 else 0,
+        ApiTimeMs=(time.perf_counter() - started) * 1000,
+    )
+
+
+def _after_call_error(exception, **kwargs):
+    # Only failures that never got a response (connection errors, timeouts)
+    # and attempts stopped by a handler arrive here. Attempts abandoned on
+    # purpose (the losing side of a hedged request) are not errors
+    if getattr(exception, 'abandoned', False):
+        _record(ApiCalls=1)
+        return
+    code = getattr(exception, 'response', {}).get('Error', {}).get('Code')
+    _record(ApiCalls=1, Errors=1, Throttles=1 if code in THROTTLE_ERROR_CODES else 0)
+
+
+def _needs_retry(response, operation, **kwargs):
+    # Sees every attempt before botocore decides whether to retry it; only counts
+    if response is not None:
+        code = response[1].get('Error', {}).get('Code')
+        if code in THROTTLE_ERROR_CODES:
+            _record(Throttles=1)
+            with _lock:
+                _throttles_by_api[(operation.service_model.service_name, operation.name)] += 1
+
+
+def throttles(api):
+    # Throttles seen for (service, operation) since the invocation started
+    with _lock:
+        return _throttles_by_api[api]
+
+
+def instrument(client):
+    events = client.meta.events
+    # Registered first so they run before any handler that answers the event
+    events.register_first('before-call', _before_call)
+    events.register_first('needs-retry', _needs_retry)
+    events.register('after-call', _after_call)
+    events.register('after-call-error', _after_call_error)
+    return client
+
+
+def emit_metrics(handler_ms):
+    with _lock:
+        counts = {check: dict(values) for check, values in _counts.items()}
+        durations = dict(_durations_ms)
+
+    document = {'Service': METRICS_NAMESPACE, 'HandlerDurationMs': round(handler_ms, 1)}
+    metrics = [{'Name': 'HandlerDurationMs', 'Unit': 'Milliseconds'}]
+    for check in sorted(set(counts) | set(durations)):
+        if check in durations:
+            document[f"{check}.DurationMs"] = round(durations[check], 1)
+            metrics.append({'Name': f"{check}.DurationMs", 'Unit': 'Milliseconds'})
+        for name, unit in (('ApiCalls', 'Count'), ('Retries', 'Count'), ('Throttles', 'Count'),
+                           ('Errors', 'Count'), ('ApiTimeMs', 'Milliseconds')):
+            value = counts.get(check, {}).get(name, 0)
+            document[f"{check}.{name}"] = round(value, 1) if unit == 'Milliseconds' else value
+            metrics.append({'Name': f"{check}.{name}", 'Unit': unit})
+
+    document['_aws'] = {
+        'Timestamp': int(time.time() * 1000),
+        'CloudWatchMetrics': [{
+            'Namespace': METRICS_NAMESPACE,
+            'Dimensions': [['Service']],
+            'Metrics': metrics,
+        }],
+    }
+    print(json.dumps(document, separators=(',', ':')))
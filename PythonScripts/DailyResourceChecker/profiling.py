@@ -0,0 +1,167 @@
+# On-demand profiling of a single handler invocation.
+# An event with {"profile": true} (or {"profile": "s3://bucket/prefix"}) runs
+# that invocation under cProfile and tracemalloc and writes the hottest
+# functions and the top allocation sites to the log, in one line each; with
+# an S3 destination the raw pstats file and the full summary are uploaded
+# as well, for snakeviz or pstats. Nothing here is imported or enabled
+# unless the flag is set, so normal invocations pay nothing for it.
+import io
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+from clients import get_client
+
+# Where {"profile": true} writes the raw profile; log only when empty
+PROFILE_PATH = os.environ.get('PROFILE_PATH', '')
+PROFILE_TOP = int(os.environ.get('PROFILE_TOP', '25'))
+PROFILE_SORT = os.environ.get('PROFILE_SORT', 'cumulative')
+# Stack depth tracemalloc records per allocation; deeper costs more memory
+PROFILE_TRACE_FRAMES = int(os.environ.get('PROFILE_TRACE_FRAMES', '1'))
+
+
+class _Profiler:
+    # cProfile only sees the thread that enables it before Python 3.12, so
+    # every thread started during the run (the check and region pools) gets
+    # its own profiler and all of them are merged at the end. From 3.12 on
+    # cProfile is built on sys.monitoring and one profiler sees every thread.
+    def __init__(self):
+        import cProfile
+        self._new_profile = cProfile.Profile
+        self.profiles = [cProfile.Profile()]
+        self._lock = threading.Lock()
+        self._per_thread = sys.version_info < (3, 12)
+
+    def _start_thread(self, *args):
+        sys.setprofile(None)
+        profile = self._new_profile()
+        with self._lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def start(self):
+        if self._per_thread:
+            threading.setprofile(self._start_thread)
+        self.profiles[0].enable()
+
+    def stop(self):
+        self.profiles[0].disable()
+        if self._per_thread:
+            threading.setprofile(None)
+
+    def stats(self):
+        import pstats
+        with self._lock:
+            profiles = list(self.profiles)
+        # Worker threads still running past the deadline are left out
+        stats = pstats.Stats(profiles[0], stream=io.StringIO())
+        for profile in profiles[1:]:
+            try:
+                stats.add(profile)
+            except TypeError:
+                pass
+        return stats
+
+
+def _profile_destination(flag):
+    # True uses PROFILE_PATH, a string names the destination itself
+    return flag if isinstance(flag, str) else PROFILE_PATH
+
+
+def _short_path(filename):
+    # Last two path parts are enough to find the code and keep lines short
+    return '/'.join(filename.split(os.sep)[-2:])
+
+
+def top_functions(stats, sort=PROFILE_SORT, limit=PROFILE_TOP):
+    # Returns [(cumulative s, own s, calls, 'file:line(function)')]
+    stats.sort_stats(sort)
+    rows = []
+    for func in stats.fcn_list[:limit]:
+        _, calls, own, cumulative, _ = stats.stats[func]
+        filename, line, name = func
+        rows.append((cumulative, own, calls, f"{_short_path(filename)}:{line}({name})"))
+    return rows
+
+
+def top_allocations(snapshot, limit=PROFILE_TOP):
+    # Returns [(KiB, blocks, 'file:line')] for the biggest allocation sites
+    import tracemalloc
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    ])
+    return [
+        (stat.size / 1024, stat.count, f"{_short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}")
+        for stat in snapshot.statistics('lineno')[:limit]
+    ]
+
+
+def render_profile(functions, allocations, wall, peak):
+    lines = [f"profile: wall_ms={wall * 1000:.1f} traced_peak_kib={peak / 1024:.0f}"]
+    lines.extend(
+        f"profile: cum_ms={cumulative * 1000:.1f} own_ms={own * 1000:.1f} calls={calls} {where}"
+        for cumulative, own, calls, where in functions
+    )
+    lines.extend(f"alloc: kib={kib:.1f} blocks={blocks} {where}" for kib, blocks, where in allocations)
+    return lines
+
+
+def save_profile(path, stats, summary, context, session):
+    # Writes <path>/<time>-<request id>.prof (pstats) and .txt (summary)
+    request_id = getattr(context, 'aws_request_id', None) or uuid.uuid4().hex[:8]
+    name = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{request_id}"
+    local = f"/tmp/{name}.prof"
+    stats.dump_stats(local)
+    try:
+        if path.startswith('s3://'):
+            bucket, _, prefix = path[len('s3://'):].partition('/')
+            key = f"{prefix.rstrip('/')}/{name}".lstrip('/')
+            s3 = get_client('s3', session=session)
+            s3.upload_file(local, bucket, f"{key}.prof")
+            s3.put_object(Bucket=bucket, Key=f"{key}.txt", Body='\n'.join(summary).encode())
+            return f"s3://{bucket}/{key}.prof"
+        os.makedirs(path, exist_ok=True)
+        os.replace(local, os.path.join(path, f"{name}.prof"))
+        with open(os.path.join(path, f"{name}.txt"), 'w') as f:
+            f.write('\n'.join(summary))
+        return os.path.join(path, f"{name}.prof")
+    finally:
+        if os.path.exists(local):
+            os.remove(local)
+
+
+def profile_invocation(handler, event, context, session):
+    # Runs handler(event, context) under cProfile and tracemalloc; results
+    # are written even when the handler fails, and writing them never does
+    import tracemalloc
+
+    profiler = _Profiler()
+    tracemalloc.start(PROFILE_TRACE_FRAMES)
+    profiler.start()
+    started = time.perf_counter()
+    try:
+        return handler(event, context)
+    finally:
+        wall = time.perf_counter() - started
+        profiler.stop()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stats = profiler.stats()
+        summary = render_profile(top_functions(stats), top_allocations(snapshot), wall, peak)
+        for line in summary:
+            print(line)
+        path = _profile_destination(event['profile'])
+        if path:
+            try:
+                print(f"profile: saved to {save_profile(path, stats, summary, context, session)}")
+            except (ClientError, OSError) as e:
+                print(f"⚠️ Could not save the profile to {path}: {e}")
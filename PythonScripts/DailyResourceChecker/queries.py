@@ -0,0 +1,203 @@
+# Query layer for the daily resource checks.
+# A query names the API call, the server-side Filters the service supports
+# and a client-side predicate for whatever it cannot filter itself. Every
+# query records how many items and bytes came back and how many the
+# client-side fallback had to throw away, which is what a push-down would
+# have saved.
+import json
+import threading
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import Future
+
+from hedge import hedged, hedging_enabled
+
+# token and limit_key name the request and response fields that hedged
+# queries page with (the same field carries the token both ways in these
+# APIs); None for calls that return everything at once. project cuts an
+# item down to the fields the collectors read, which is all a shared query
+# keeps in memory for its consumers
+Query = namedtuple(
+    'Query',
+    ['name', 'operation', 'result_key', 'filters', 'predicate', 'page_size', 'token', 'limit_key', 'project'],
+    defaults=(None, None, None),
+)
+
+
+def _keep(*fields):
+    return lambda item: {field: item[field] for field in fields if field in item}
+
+
+_instance_fields = _keep('InstanceId', 'InstanceType')
+
+# Running instances are filtered by EC2 itself
+RUNNING_INSTANCES = Query(
+    name='running_instances',
+    operation='describe_instances',
+    result_key='Reservations',
+    filters=[{'Name': 'instance-state-name', 'Values': ['running']}],
+    predicate=None,
+    page_size=1000,
+    token='NextToken',
+    limit_key='MaxResults',
+    project=lambda reservation: {'Instances': [_instance_fields(instance) for instance in reservation['Instances']]},
+)
+
+# describe_db_instances only filters on ids, engine and domain, not status
+AVAILABLE_DB_INSTANCES = Query(
+    name='available_db_instances',
+    operation='describe_db_instances',
+    result_key='DBInstances',
+    filters=None,
+    predicate=lambda db: db['DBInstanceStatus'] == 'available',
+    page_size=100,
+    token='Marker',
+    limit_key='MaxRecords',
+    project=_keep('DBInstanceIdentifier', 'DBInstanceClass', 'Engine', 'MultiAZ'),
+)
+
+# The EBS check reports total usage across every volume, so it has to list them all
+ALL_VOLUMES = Query(
+    name='all_volumes',
+    operation='describe_volumes',
+    result_key='Volumes',
+    filters=None,
+    predicate=None,
+    page_size=500,
+    token='NextToken',
+    limit_key='MaxResults',
+    project=_keep('VolumeId', 'VolumeType', 'Size', 'State'),
+)
+
+# EC2 filters can only match a value, not its absence, and the EIP check
+# also looks at addresses on instances that are not running, so every
+# address is listed
+ALL_ADDRESSES = Query(
+    name='all_addresses',
+    operation='describe_addresses',
+    result_key='Addresses',
+    filters=None,
+    predicate=None,
+    page_size=None,
+    project=_keep('PublicIp', 'InstanceId'),
+)
+
+_stats = defaultdict(Counter)
+_stats_lock = threading.Lock()
+
+
+def record(name, **counts):
+    with _stats_lock:
+        _stats[name].update(counts)
+
+
+def query_stats():
+    with _stats_lock:
+        return {name: dict(counts) for name, counts in _stats.items()}
+
+
+def reset_query_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def log_query_stats():
+    for name, counts in sorted(query_stats().items()):
+        print(
+            f"query {name}: calls={counts.get('calls', 0)} items={counts.get('items', 0)} "
+            f"bytes={counts.get('bytes', 0)} dropped_items={counts.get('dropped_items', 0)} "
+            f"dropped_bytes={counts.get('dropped_bytes', 0)} shared_hits={counts.get('shared_hits', 0)}"
+        )
+
+
+def _pages(client, query):
+    kwargs = {}
+    if query.filters:
+        kwargs['Filters'] = query.filters
+    if hedging_enabled():
+        yield from _hedged_pages(client, query, kwargs)
+    elif client.can_paginate(query.operation):
+        paginator = client.get_paginator(query.operation)
+        yield from paginator.paginate(PaginationConfig={'PageSize': query.page_size}, **kwargs)
+    else:
+        yield getattr(client, query.operation)(**kwargs)
+
+
+def _hedged_pages(client, query, kwargs):
+    # A botocore paginator calls the plain client method, so hedged queries
+    # follow the page token themselves and every slow page gets its own
+    # duplicate (see hedge.py)
+    call = hedged(client, query.operation)
+    if query.token is None:
+        yield call(**kwargs)
+        return
+    if query.page_size:
+        kwargs[query.limit_key] = query.page_size
+    while True:
+        page = call(**kwargs)
+        yield page
+        token = page.get(query.token)
+        # An unchanged token would page forever
+        if not token or token == kwargs.get(query.token):
+            return
+        kwargs[query.token] = token
+
+
+def run_query(client, query):
+    for page in _pages(client, query):
+        headers = page.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+        items = page[query.result_key]
+        record(query.name, calls=1, items=len(items), bytes=int(headers.get('content-length', 0)))
+        for item in items:
+            if query.predicate is None or query.predicate(item):
+                yield item
+            else:
+                # Size of the item as JSON, close to what it cost on the wire
+                record(query.name, dropped_items=1, dropped_bytes=len(json.dumps(item, default=str)))
+
+
+class RequestCache:
+    # Per-scan cache for queries that more than one check needs. The first
+    # check to ask runs the query, any check asking at the same time waits
+    # for it, and everyone gets the same items, cut down to the fields the
+    # collectors read. Queries with a single consumer are streamed straight
+    # through, so they stay memory-flat.
+    def __init__(self, shared_names=()):
+        self._shared = set(shared_names)
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def run(self, client, query):
+        if query.name not in self._shared:
+            return run_query(client, query)
+
+        key = (
+            client.meta.service_model.service_name,
+            client.meta.region_name,
+            query.operation,
+            json.dumps(query.filters, sort_keys=True),
+        )
+        with self._lock:
+            future = self._results.get(key)
+            owner = future is None
+            if owner:
+                future = self._results[key] = Future()
+
+        if owner:
+            try:
+                project = query.project or (lambda item: item)
+                future.set_result([project(item) for item in run_query(client, query)])
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            record(query.name, shared_hits=1)
+        return iter(future.result())
+
+
+def shared_queries(check_queries):
+    # Names of the queries declared by more than one check
+    consumers = Counter(name for queries in check_queries.values() for name in {query.name for query in queries})
+    return {name for name, count in consumers.items() if count > 1}
+
+
+# Pass-through for callers that do not share a scan with other checks
+DIRECT = RequestCache()
@@ -0,0 +1,232 @@
+# Process-wide adaptive rate limiting for every client the checker creates.
+# botocore's 'adaptive' retry mode gives each client its own token bucket, so
+# when dozens of region and account clients call the same API at once, each
+# one has to be throttled before it slows down and they keep retrying into
+# each other. Here one botocore ClientRateLimiter (CUBIC rate adjustment over
+# a TokenBucket) is shared per API by all clients: the first throttle any
+# worker sees lowers the send rate for every worker. Like botocore's own, a
+# limiter only starts metering after its API has been throttled, so calls
+# cost nothing extra until then.
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from botocore.retries import adaptive, bucket, standard, throttling
+
+SHARED_RATE_LIMIT = os.environ.get('CLIENT_SHARED_RATE_LIMIT', 'true').lower() == 'true'
+# By default an API shares one limiter across regions and accounts; set to
+# true to give every region its own (EC2 limits are per account and region)
+RATE_LIMIT_PER_REGION = os.environ.get('RATE_LIMIT_PER_REGION', 'false').lower() == 'true'
+
+_limiters = {}
+_lock = threading.Lock()
+
+
+class _CountingDetector:
+    # Botocore's throttling detector, counting what it detects for the logs
+    def __init__(self):
+        self.detector = standard.ThrottlingErrorDetector(retry_event_adapter=standard.RetryEventAdapter())
+        self.throttles = 0
+
+    def is_throttling_error(self, **kwargs):
+        throttled = self.detector.is_throttling_error(**kwargs)
+        if throttled:
+            self.throttles += 1
+        return throttled
+
+
+class SharedLimiter:
+    def __init__(self):
+        # Same parts botocore's adaptive.register_retry_handler wires up per client
+        clock = bucket.Clock()
+        self.token_bucket = bucket.TokenBucket(max_rate=1, clock=clock)
+        self.detector = _CountingDetector()
+        self.limiter = adaptive.ClientRateLimiter(
+            rate_adjustor=throttling.CubicCalculator(starting_max_rate=0, start_time=clock.current_time()),
+            rate_clocker=adaptive.RateClocker(clock),
+            token_bucket=self.token_bucket,
+            throttling_detector=self.detector,
+            clock=clock,
+        )
+        self.waited = 0.0
+        self._waited_lock = threading.Lock()
+
+    def on_sending_request(self, **kwargs):
+        started = time.perf_counter()
+        self.limiter.on_sending_request(**kwargs)
+        with self._waited_lock:
+            self.waited += time.perf_counter() - started
+
+    def on_receiving_response(self, **kwargs):
+        self.limiter.on_receiving_response(**kwargs)
+
+
+def get_limiter(api):
+    with _lock:
+        if api not in _limiters:
+            _limiters[api] = SharedLimiter()
+        return _limiters[api]
+
+
+def reset_limiters():
+    with _lock:
+        _limiters.clear()
+
+
+def share_rate_limits(client):
+    # Routes every request the client sends through the limiter of its API
+    region = client.meta.region_name if RATE_LIMIT_PER_REGION else None
+
+    def limiter_for(event_name):
+        # 'before-send.ec2.DescribeInstances' -> ('ec2', region, 'DescribeInstances')
+        _, service, operation = event_name.split('.', 2)
+        return get_limiter((service, region, operation))
+
+    def before_send(event_name, **kwargs):
+        limiter_for(event_name).on_sending_request(**kwargs)
+
+    def needs_retry(event_name, **kwargs):
+        limiter_for(event_name).on_receiving_response(**kwargs)
+
+    client.meta.events.register('before-send', before_send)
+    client.meta.events.register('needs-retry', needs_retry)
+    return client
+
+
+def log_rate_limits():
+    # One line per API throttled at least once; limiters live as long as the
+    # container, so warm invocations start at the rate the last one learned
+    with _lock:
+        limiters = sorted(_limiters.items(), key=lambda item: tuple(str(part) for part in item[0]))
+    for (service, region, operation), shared in limiters:
+        if shared.detector.throttles:
+            scope = f"{service}.{operation}" + (f" in {region}" if region else '')
+            print(
+                f"rate_limit {scope}: throttles={shared.detector.throttles} "
+                f"send_rate={shared.token_bucket.max_rate:.1f}/s waited_s={shared.waited:.1f}"
+            )
+
+
+# -----------------------------
+# Throughput Comparison
+# -----------------------------
+class _ThrottlingServer(ThreadingHTTPServer):
+    # Answers DescribeRegions like EC2 does, throttling above `rate` calls per
+    # second across all callers (a token bucket with one second of burst)
+    daemon_threads = True
+
+    def __init__(self, rate):
+        super().__init__(('127.0.0.1', 0), _ThrottlingHandler)
+        self.rate = rate
+        self.tokens = rate
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+        self.accepted = 0
+        self.throttled = 0
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.accepted += 1
+                return True
+            self.throttled += 1
+            return False
+
+
+class _ThrottlingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        if self.server.take():
+            status = 200
+            body = (b'<DescribeRegionsResponse xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">'
+                    b'<requestId>1</requestId><regionInfo/></DescribeRegionsResponse>')
+        else:
+            status = 503
+            body = (b'<Response><Errors><Error><Code>RequestLimitExceeded</Code>'
+                    b'<Message>Request limit exceeded.</Message></Error></Errors><RequestID>1</RequestID></Response>')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def compare(mode, workers, server_rate, seconds, max_attempts):
+    # Runs `workers` clients (one per simulated region or account) calling one
+    # API as fast as they can for `seconds`, and counts what got through
+    import boto3
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+
+    server = _ThrottlingServer(server_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    reset_limiters()
+    config = Config(retries={'mode': 'adaptive' if mode == 'adaptive' else 'standard', 'max_attempts': max_attempts})
+    session = boto3.session.Session(aws_access_key_id='compare', aws_secret_access_key='compare', region_name='us-east-1')
+    clients = []
+    for _ in range(workers):
+        client = session.client('ec2', endpoint_url=f"http://127.0.0.1:{server.server_port}", config=config)
+        clients.append(share_rate_limits(client) if mode == 'shared' else client)
+
+    stop_at = time.monotonic() + seconds
+    counts = {'succeeded': 0, 'failed': 0}
+    counts_lock = threading.Lock()
+
+    def work(client):
+        while time.monotonic() < stop_at:
+            try:
+                client.describe_regions()
+                outcome = 'succeeded'
+            except ClientError:
+                outcome = 'failed'
+            with counts_lock:
+                counts[outcome] += 1
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(work, clients))
+    server.shutdown()
+    server.server_close()
+    return {
+        'mode': mode,
+        'calls_per_s': round(counts['succeeded'] / seconds, 1),
+        'failed_calls': counts['failed'],
+        'throttled_requests': server.throttled,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare per-client retries with the shared rate limiter against a local throttling endpoint.')
+    parser.add_argument('--workers', type=int, default=32, help='Concurrent clients (default: 32)')
+    parser.add_argument('--server-rate', type=float, default=50, help='Calls per second the endpoint allows (default: 50)')
+    parser.add_argument('--seconds', type=float, default=10, help='Duration of each run (default: 10)')
+    parser.add_argument('--max-attempts', type=int, default=5, help='Client max_attempts (default: 5)')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'mode':<10} {'calls/s':>8} {'failed calls':>13} {'throttled requests':>19}")
+    for mode in ('standard', 'adaptive', 'shared'):
+        result = compare(mode, args.workers, args.server_rate, args.seconds, args.max_attempts)
+        results.append(result)
+        print(f"{mode:<10} {result['calls_per_s']:>8.1f} {result['failed_calls']:>13} {result['throttled_requests']:>19}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
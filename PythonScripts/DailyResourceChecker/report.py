@@ -0,0 +1,115 @@
+# Report delivery for the daily resource checks.
+# The report is consumed line by line and gzipped into a spooled temp file as
+# it streams past, so memory stays bounded however large the inventory is.
+# Reports that fit in one SNS message are sent as before; larger ones go to
+# S3 through s3transfer and SNS gets a headline plus a link.
+import gzip
+import os
+import tempfile
+from datetime import datetime, timezone
+
+from s3transfer.manager import TransferConfig, TransferManager
+
+from clients import get_client, get_session
+
+# SNS allows 256 KB per message; leave room for the subject and the S3 link
+INLINE_LIMIT = int(os.environ.get('REPORT_INLINE_LIMIT', str(240 * 1024)))
+HEADLINE_LIMIT = int(os.environ.get('REPORT_HEADLINE_LIMIT', str(32 * 1024)))
+
+REPORT_BUCKET = os.environ.get('REPORT_BUCKET', '')
+REPORT_PREFIX = os.environ.get('REPORT_PREFIX', 'daily-resource-reports/')
+# A presigned URL stops working when the credentials that signed it expire,
+# and a role's temporary credentials last 12 hours at most, so the link is
+# capped at whatever the signing credentials have left; the S3 path is the
+# lasting reference
+REPORT_URL_EXPIRY = int(os.environ.get('REPORT_URL_EXPIRY', str(12 * 3600)))
+
+# Compressed report is kept in memory up to this size, then spills to /tmp
+SPOOL_MEMORY = 8 * 1024 * 1024
+
+
+def _clip(lines, limit):
+    # A single section can be one long line, so the last line kept is cut short
+    kept = []
+    size = 0
+    for line in lines:
+        data = line.encode() + b"\n"
+        if size + len(data) > limit:
+            kept.append(data[:limit - size].decode(errors='ignore') + " …")
+            break
+        kept.append(line)
+        size += len(data)
+    return kept
+
+
+def credentials_seconds_left(session):
+    # None when botocore does not know when the credentials expire (e.g. the
+    # Lambda role's credentials, which come from the environment)
+    expiry = getattr((session or get_session()).get_credentials(), '_expiry_time', None)
+    if expiry is None:
+        return None
+    return max(0, int((expiry - datetime.now(timezone.utc)).total_seconds()))
+
+
+def url_expiry(session, expiry=REPORT_URL_EXPIRY):
+    left = credentials_seconds_left(session)
+    return expiry if left is None else min(expiry, left)
+
+
+def upload_report(session, spool, bucket, key):
+    # Returns the presigned URL and the seconds it is valid for
+    spool.seek(0)
+    s3 = get_client('s3', session=session)
+    manager = TransferManager(s3, TransferConfig())
+    try:
+        manager.upload(
+            spool, bucket, key,
+            extra_args={'ContentType': 'text/plain; charset=utf-8', 'ContentEncoding': 'gzip'},
+        ).result()
+    finally:
+        manager.shutdown()
+    expires_in = url_expiry(session)
+    url = s3.generate_presigned_url('get_object', Params={'Bucket': bucket, 'Key': key}, ExpiresIn=expires_in)
+    return url, expires_in
+
+
+def publish_report(session, lines, topic_arn, subject, bucket=REPORT_BUCKET):
+    # Returns the message that was published
+    inline = []
+    inline_size = 0
+    line_count = 0
+    overflow = False
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY) as spool:
+        with gzip.GzipFile(fileobj=spool, mode='wb') as gz:
+            for line in lines:
+                data = line.encode() + b"\n"
+                gz.write(data)
+                line_count += 1
+                if not overflow:
+                    inline.append(line)
+                    inline_size += len(data)
+                    overflow = inline_size > INLINE_LIMIT
+
+        if not overflow:
+            message = "\n".join(inline)
+        elif bucket:
+            key = f"{REPORT_PREFIX}{datetime.utcnow().strftime('%Y-%m-%d/%H%M%S')}.txt.gz"
+            url, expires_in = upload_report(session, spool, bucket, key)
+            message = "\n".join(_clip(inline, HEADLINE_LIMIT) + [
+                f"\n📄 Report too large for email ({line_count} lines). Full report: s3://{bucket}/{key}",
+                f"Download link (works for up to {expires_in // 3600} h {expires_in % 3600 // 60} min, "
+                "or until the function's credentials expire; use the S3 path after that):",
+                url,
+            ])
+        else:
+            message = "\n".join(_clip(inline, INLINE_LIMIT - 200) + [
+                f"\n✂️ Report truncated ({line_count} lines). Set REPORT_BUCKET to receive the full report in S3.",
+            ])
+
+    get_client('sns', session=session).publish(
+        TopicArn=topic_arn,
+        Subject=subject,
+        Message=message
+    )
+    return message
@@ -0,0 +1,256 @@
+# Declarative finding rules for the daily resource checks.
+# Rules live in a JSON file (rules.json, or RULES_PATH) and name a resource
+# type, a condition, a severity and a message template. They are compiled
+# once per container into plain closures and indexed by resource type, and
+# rules whose condition is a single equality test are further indexed by the
+# value they test, so each resource costs one dict lookup per tested field
+# plus the remaining rules, however many rules there are. Aggregate rules
+# (e.g. total EBS size) are folded in the same single pass over a stream.
+# A rule with a "section" is evaluated by that check and reported in its
+# section (the EBS Free Tier limit); the rest make up the Findings section.
+import argparse
+import json
+import operator
+import os
+import time
+from collections import defaultdict
+
+RULES_PATH = os.environ.get(
+    'RULES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json')
+)
+# Opt-in example rules (RULES_PATH=rules.example.json); also what the benchmark times
+EXAMPLE_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.example.json')
+
+# Report order, most severe first; 'ok' is only reported by an aggregate
+# rule's "otherwise" message and cannot be given as a rule's severity
+SEVERITIES = ['critical', 'warning', 'info']
+REPORT_ORDER = SEVERITIES + ['ok']
+
+# Checks that evaluate rules with a "section"; the rest are findings
+SECTIONS = ('ebs', 'findings')
+
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    'in': lambda value, expected: value in expected,
+    'not in': lambda value, expected: value not in expected,
+    'startswith': lambda value, expected: isinstance(value, str) and value.startswith(expected),
+}
+
+# Aggregates are (initial value, fold(total, record value)) pairs
+AGGREGATES = {
+    'sum': (0, lambda total, value: total + (value or 0)),
+    'count': (0, lambda total, value: total + 1),
+    'max': (None, lambda total, value: value if total is None or (value is not None and value > total) else total),
+}
+
+# Used for a section the rule file has no rules for, so the EBS check keeps
+# its Free Tier line with any RULES_PATH; same as the shipped rules.json
+DEFAULT_RULES = [
+    {
+        'name': 'ebs-free-tier',
+        'resource': 'ebs',
+        'section': 'ebs',
+        'aggregate': 'sum',
+        'field': 'size',
+        'when': {'op': '>', 'value': 30},
+        'severity': 'critical',
+        'message': 'EBS usage exceeds the 30 GiB Free Tier limit. Charges will apply.',
+        'otherwise': 'EBS usage is within the 30 GiB Free Tier limit.',
+    },
+]
+
+# Compiled once per container
+_rule_sets = {}
+
+
+class RulesError(ValueError):
+    # A rule file that cannot be read or compiled
+    pass
+
+
+def compile_condition(condition):
+    # Turns {'field': ..., 'op': ..., 'value': ...} or {'all'|'any': [...]} or
+    # {'not': {...}} into a function of one record
+    if 'all' in condition:
+        parts = [compile_condition(part) for part in condition['all']]
+        return lambda record: all(part(record) for part in parts)
+    if 'any' in condition:
+        parts = [compile_condition(part) for part in condition['any']]
+        return lambda record: any(part(record) for part in parts)
+    if 'not' in condition:
+        inner = compile_condition(condition['not'])
+        return lambda record: not inner(record)
+
+    field, expected = condition['field'], condition.get('value')
+    if condition['op'] == 'missing':
+        return lambda record: record.get(field) is None
+    if condition['op'] == 'exists':
+        return lambda record: record.get(field) is not None
+    op = condition['op']
+    test = OPERATORS[op]
+    if op in ('in', 'not in'):
+        expected = frozenset(expected)
+    elif op == 'startswith':
+        expected = tuple(expected)
+    if op in ('==', '!=', 'not in'):
+        return lambda record: test(record.get(field), expected)
+
+    def check(record):
+        # Other comparisons against a missing field are false, not an error
+        value = record.get(field)
+        return value is not None and test(value, expected)
+    return check
+
+
+class RuleSet:
+    def __init__(self, rules):
+        # per resource type: {field: {value: [rule]}} for equality rules,
+        # [rule] for every other rule and [aggregate rule]
+        self.indexed = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+        self.scanned = defaultdict(list)
+        self.aggregates = defaultdict(list)
+        self.count = len(rules)
+        for rule in rules:
+            self._add(rule)
+
+    def _add(self, rule):
+        compiled = {
+            'name': rule['name'],
+            'severity': rule['severity'],
+            'format': rule['message'].format_map,
+            # Aggregate rules only: reported with severity 'ok' when the rule does not fire
+            'otherwise': rule.get('otherwise'),
+        }
+        resource_type = rule['resource']
+        if 'aggregate' in rule:
+            initial, fold = AGGREGATES[rule['aggregate']]
+            field = rule.get('field')
+            compiled.update(initial=initial, fold=fold, field=field, test=compile_condition(dict(rule['when'], field='value')))
+            self.aggregates[resource_type].append(compiled)
+            return
+
+        condition = rule['when']
+        if condition.get('op') == '==' and isinstance(condition.get('value'), (str, int, float, bool)):
+            self.indexed[resource_type][condition['field']][condition['value']].append(compiled)
+        else:
+            compiled['test'] = compile_condition(condition)
+            self.scanned[resource_type].append(compiled)
+
+    def evaluate(self, resource_type, records):
+        # Returns [(severity, rule name, resource id, message)] for one stream
+        # of records, walking the stream exactly once; aggregate findings are
+        # reported against the resource type
+        findings = []
+        indexed = [(field, dict(by_value)) for field, by_value in self.indexed.get(resource_type, {}).items()]
+        scanned = self.scanned.get(resource_type, [])
+        aggregates = self.aggregates.get(resource_type, [])
+        totals = [rule['initial'] for rule in aggregates]
+
+        for record in records:
+            for field, by_value in indexed:
+                for rule in by_value.get(record.get(field), ()):
+                    findings.append((rule['severity'], rule['name'], record['id'], rule['format'](record)))
+            for rule in scanned:
+                if rule['test'](record):
+                    findings.append((rule['severity'], rule['name'], record['id'], rule['format'](record)))
+            for i, rule in enumerate(aggregates):
+                totals[i] = rule['fold'](totals[i], record.get(rule['field']))
+
+        for rule, total in zip(aggregates, totals):
+            if total is not None and rule['test']({'value': total}):
+                findings.append((rule['severity'], rule['name'], resource_type, rule['format']({'value': total})))
+            elif rule['otherwise']:
+                findings.append(('ok', rule['name'], resource_type, rule['otherwise'].format_map({'value': total})))
+        return findings
+
+
+def validate_rule(rule):
+    # Fail when the rules load rather than when a check reports them
+    name = rule.get('name')
+    if rule.get('severity') not in SEVERITIES:
+        raise ValueError(f"Rule {name}: severity must be one of {', '.join(SEVERITIES)}, not {rule.get('severity')!r}")
+    if rule.get('section', 'findings') not in SECTIONS:
+        raise ValueError(f"Rule {name}: section must be one of {', '.join(SECTIONS)}, not {rule.get('section')!r}")
+    if 'otherwise' in rule and 'aggregate' not in rule:
+        raise ValueError(f"Rule {name}: only aggregate rules can have an otherwise message")
+
+
+def _by_section(rules):
+    by_section = defaultdict(list)
+    for rule in rules:
+        validate_rule(rule)
+        by_section[rule.get('section', 'findings')].append(rule)
+    return {name: RuleSet(section_rules) for name, section_rules in by_section.items()}
+
+
+def default_rules(section):
+    if None not in _rule_sets:
+        _rule_sets[None] = _by_section(DEFAULT_RULES)
+    return _rule_sets[None].get(section) or RuleSet([])
+
+
+def load_rules(path=RULES_PATH, section='findings'):
+    # Raises RulesError for a file that cannot be read or compiled
+    if path not in _rule_sets:
+        try:
+            with open(path) as f:
+                _rule_sets[path] = _by_section(json.load(f)['rules'])
+        except (OSError, KeyError, TypeError, ValueError) as e:
+            raise RulesError(f"Could not load rules from {path}: {e!r}") from e
+    rule_set = _rule_sets[path].get(section)
+    return rule_set or default_rules(section)
+
+
+def sort_findings(findings):
+    return sorted(findings, key=lambda finding: (REPORT_ORDER.index(finding[0]), finding[1], finding[2]))
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+def synthetic_records(resource_type, count):
+    # Enough variety for every example rule to fire on some records
+    if resource_type == 'ec2':
+        types = ['t2.micro', 't3.micro', 'm4.large', 'm5.large', 'c5.large']
+        return [{'id': f"i-{i:017x}", 'type': types[i % len(types)]} for i in range(count)]
+    if resource_type == 'rds':
+        classes = ['db.t2.micro', 'db.t3.micro', 'db.m5.large']
+        return [{'id': f"db-{i}", 'class': classes[i % len(classes)], 'multi_az': i % 2 == 0} for i in range(count)]
+    if resource_type == 'ebs':
+        types = ['gp2', 'gp3', 'io1', 'st1']
+        return [{'id': f"vol-{i:017x}", 'type': types[i % len(types)], 'size': 8 + (i % 64) * 16,
+                 'state': 'available' if i % 10 == 0 else 'in-use'} for i in range(count)]
+    return [{'id': f"198.51.{i >> 8 & 255}.{i & 255}", 'instance_id': None if i % 3 == 0 else f"i-{i:017x}",
+             'instance_running': i % 3 == 1} for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the finding rules, separately from collection.')
+    parser.add_argument('--rules', default=EXAMPLE_RULES_PATH, help='Rule file (default: rules.example.json)')
+    parser.add_argument('--resources', type=int, default=100000, help='Synthetic resources per type')
+    parser.add_argument('--copies', type=int, default=1, help='Load every rule this many times, to see how rule count scales')
+    args = parser.parse_args()
+
+    with open(args.rules) as f:
+        rules = json.load(f)['rules']
+    rules = [dict(rule, name=f"{rule['name']}-{n}") for n in range(args.copies) for rule in rules]
+
+    started = time.perf_counter()
+    rule_set = RuleSet(rules)
+    print(f"compiled {rule_set.count} rules in {(time.perf_counter() - started) * 1000:.1f} ms")
+    for resource_type in ('ec2', 'rds', 'ebs', 'eip'):
+        records = synthetic_records(resource_type, args.resources)
+        started = time.perf_counter()
+        findings = rule_set.evaluate(resource_type, records)
+        elapsed = time.perf_counter() - started
+        print(f"{resource_type:<4} {len(records):>8} resources {len(findings):>8} findings "
+              f"{elapsed * 1000:>8.1f} ms ({elapsed / len(records) * 1e6:.2f} µs/resource)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Deadline-aware scheduling for the daily resource checks.
+# The deadline comes from the Lambda context, minus a reserve for building
+# and publishing the report, so there is always time left to send at least
+# a partial report. Checks are ranked by cost impact: the most expensive
+# resources are checked first and low-priority checks are skipped once the
+# time left gets short.
+import os
+import time
+
+REPORT_RESERVE_SECONDS = float(os.environ.get('REPORT_RESERVE_SECONDS', '15'))
+# Most of the remaining time the reserve may take, for short function timeouts
+REPORT_RESERVE_MAX_SHARE = float(os.environ.get('REPORT_RESERVE_MAX_SHARE', '0.25'))
+
+# Seconds that must be left for the lowest-priority check to start; checks
+# ranked higher need proportionally less, and the top one always starts
+LOW_PRIORITY_CUTOFF_SECONDS = float(os.environ.get('LOW_PRIORITY_CUTOFF_SECONDS', '60'))
+
+# Ranked by cost impact, most expensive first
+CHECK_PRIORITY = ['ec2', 'rds', 'ebs', 'eip', 'ecs']
+
+
+class Deadline:
+    def __init__(self, context=None, reserve=REPORT_RESERVE_SECONDS):
+        # Without a Lambda context (local runs) there is no deadline
+        self.cutoff = LOW_PRIORITY_CUTOFF_SECONDS
+        if context is None:
+            self.at = None
+        else:
+            remaining = context.get_remaining_time_in_millis() / 1000
+            # A short function timeout cannot spare the full reserve or the
+            # cutoff, so both are capped at a share of the time left and every
+            # check can still start at the beginning of the run
+            budget = remaining - min(reserve, remaining * REPORT_RESERVE_MAX_SHARE)
+            self.at = time.monotonic() + budget
+            self.cutoff = min(LOW_PRIORITY_CUTOFF_SECONDS, budget / 2)
+
+    def remaining(self):
+        if self.at is None:
+            return None
+        return max(0.0, self.at - time.monotonic())
+
+    def timeout(self, budget=None):
+        # Shorter of the given budget and the time left before the deadline
+        remaining = self.remaining()
+        if remaining is None:
+            return budget
+        if budget is None:
+            return remaining
+        return min(budget, remaining)
+
+    def expired(self):
+        return self.remaining() == 0.0
+
+    def should_start(self, check_name):
+        remaining = self.remaining()
+        if remaining is None:
+            return True
+        rank = CHECK_PRIORITY.index(check_name) if check_name in CHECK_PRIORITY else len(CHECK_PRIORITY) - 1
+        return remaining > self.cutoff * rank / (len(CHECK_PRIORITY) - 1)
+
+
+# Shared by everything that has no Lambda deadline to respect
+NO_DEADLINE = Deadline()
+
+
+def by_priority(checks):
+    # Highest-priority checks are submitted first, so they get workers first
+    def rank(check):
+        name = check[0]
+        return CHECK_PRIORITY.index(name) if name in CHECK_PRIORITY else len(CHECK_PRIORITY)
+    return sorted(checks, key=rank)
@@ -1,108 +1,1027 @@
+import time
+
+# Everything from here to the end of the module counts as Lambda init time
+_init_started = time.perf_counter()
+
+import asyncio
+import os
+import threading
 import boto3
+import botocore.session
+from botocore.credentials import AssumeRoleCredentialFetcher, DeferredRefreshableCredentials
+from botocore.exceptions import BotoCoreError, ClientError
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
+from functools import partial
+from itertools import chain
 
-def lambda_handler(event, context):
-    ec2 = boto3.client('ec2')
-    rds = boto3.client('rds')
-    ecs = boto3.client('ecs')
-    sns = boto3.client('sns')
+from aggregator import CONFIG_AGGREGATOR_NAME, fetch_inventory
+from cache import cached_results, clear_cache, log_cache_stats, reset_cache_stats, store_results
+from clients import clients_created, get_client, get_session
+from collectors import (
+    iter_addresses,
+    iter_available_db_classes,
+    iter_available_db_ids,
+    iter_db_records,
+    iter_instance_records,
+    iter_running_instance_ids,
+    iter_running_instance_types,
+    iter_running_services,
+    iter_volume_records,
+    iter_volume_types,
+    iter_volumes,
+)
+from engine import Engine, run_jobs
+from cost import add_resource, estimate, load_price_table, new_columns, top_offenders, top_offenders_across
+from hedge import HEDGED_REQUESTS, hedging_enabled, log_hedge_stats, render_hedge_summary, set_hedging
+from history import HISTORY_PATH, record_history
+from idle import IDLE_LOOKBACK_DAYS, find_idle_resources
+from metrics import emit_metrics, reset_metrics, timed_check
+from queries import (
+    ALL_ADDRESSES,
+    ALL_VOLUMES,
+    AVAILABLE_DB_INSTANCES,
+    RUNNING_INSTANCES,
+    RequestCache,
+    log_query_stats,
+    reset_query_stats,
+    shared_queries,
+)
+from profiling import profile_invocation
+from ratelimit import log_rate_limits
+from report import publish_report
+from rules import RulesError, default_rules, load_rules, sort_findings
+from scheduler import NO_DEADLINE, Deadline, by_priority
+from shards import (
+    SHARD_WAIT_SECONDS,
+    LambdaInvoker,
+    LocalInvoker,
+    encode_results,
+    merge_shards,
+    new_run_id,
+    plan_shards,
+    save_shard_result,
+    wait_for_shards,
+)
+from snapshot import build_inventory, carry_forward, diff_inventory, load_snapshot, render_delta, save_snapshot
 
-    message_lines = []
+SNS_TOPIC_ARN = 'arn:aws:sns:us-west-2:798278983508:daily-resource-alerts'
+
+# Upper bound on checks running at the same time
+MAX_WORKERS = int(os.environ.get('CHECK_MAX_WORKERS', '5'))
+
+# Multi-region mode: regions scanned at once and seconds allowed per region
+SCAN_ALL_REGIONS = os.environ.get('SCAN_ALL_REGIONS', 'false').lower() == 'true'
+REGION_MAX_WORKERS = int(os.environ.get('REGION_MAX_WORKERS', '8'))
+REGION_TIME_BUDGET = float(os.environ.get('REGION_TIME_BUDGET', '60'))
+
+# Organization mode: read-only role assumed in every target account
+SCAN_ALL_ACCOUNTS = os.environ.get('SCAN_ALL_ACCOUNTS', 'false').lower() == 'true'
+TARGET_ACCOUNTS = [a for a in os.environ.get('TARGET_ACCOUNTS', '').split(',') if a]
+CHECKER_ROLE_NAME = os.environ.get('CHECKER_ROLE_NAME', 'DailyResourceCheckerReadOnly')
+ACCOUNT_MAX_WORKERS = int(os.environ.get('ACCOUNT_MAX_WORKERS', '4'))
+
+# Sharded mode: every account x region is scanned by its own Lambda
+# invocation ('lambda'), or by the handler in this process ('local', for testing)
+SHARDED = os.environ.get('SHARDED', 'false').lower() == 'true'
+SHARD_INVOKER = os.environ.get('SHARD_INVOKER', 'lambda')
+
+# Collection backend: 'describe' calls each service's Describe APIs per
+# account and region, 'config' answers what it can from one AWS Config
+# aggregator query per resource type and falls back to 'describe' for the rest
+COLLECTION_BACKEND = os.environ.get('COLLECTION_BACKEND', 'describe')
+
+# Collection engine: 'threads' nests a thread pool per account, region and
+# scan; 'asyncio' schedules every check in every scope on one event loop
+# with per-service and per-region limits (see engine.py)
+COLLECTION_ENGINE = os.environ.get('COLLECTION_ENGINE', 'threads')
+
+# Delta reporting: where the last run's snapshot lives and which report to send
+SNAPSHOT_PATH = os.environ.get('SNAPSHOT_PATH', '/tmp/daily-resource-snapshot.json.gz')
+REPORT_MODE = os.environ.get('REPORT_MODE', 'delta')
+
+# Idle detection reads CloudWatch metrics, which is billed per metric, so it is opt-in
+IDLE_DETECTION = os.environ.get('IDLE_DETECTION', 'false').lower() == 'true'
+
+# Cost estimates hold every running instance, volume and idle address in
+# memory, so they are opt-in as well
+COST_ESTIMATION = os.environ.get('COST_ESTIMATION', 'false').lower() == 'true'
+
+# Marks a check that did not finish within its time budget
+INCOMPLETE = object()
+# Marks a check that was not started because the Lambda deadline was near
+SKIPPED = object()
+
+
+class CheckFailed(str):
+    # Marks a check whose API calls failed (e.g. AccessDenied for one service
+    # or region) or whose rules could not be loaded; the text is the error,
+    # reported in place of that section
+    pass
+
+
+# Errors that cost a check its section rather than the whole report
+CHECK_ERRORS = (BotoCoreError, ClientError, RulesError)
+
+
+# How the markers travel in shard results
+SHARD_MARKERS = {'incomplete': INCOMPLETE, 'skipped': SKIPPED, 'failed': CheckFailed}
+
+
+def unfinished(result):
+    return result is INCOMPLETE or result is SKIPPED or isinstance(result, CheckFailed)
 
-    # -----------------------------
-    # Check EC2 Running Instances
-    # -----------------------------
-    ec2_response = ec2.describe_instances(Filters=[{'Name': 'instance-state-name', 'Values': ['running']}])
-    running_ec2 = []
-    for reservation in ec2_response['Reservations']:
-        for instance in reservation['Instances']:
-            running_ec2.append(instance['InstanceId'])
 
+# -----------------------------
+# Check EC2 Running Instances
+# -----------------------------
+def collect_ec2(clients):
+    return list(iter_running_instance_ids(clients['ec2'], clients['requests']))
+
+
+def inventory_ec2(running_ec2):
+    return {instance_id: 'running' for instance_id in running_ec2}
+
+
+def render_ec2(running_ec2):
     if running_ec2:
-        message_lines.append(f"🔶 Running EC2 Instances:\n - " + "\n - ".join(running_ec2))
-    else:
-        message_lines.append("✅ No EC2 instances are running.")
+        return [f"🔶 Running EC2 Instances:\n - " + "\n - ".join(running_ec2)]
+    return ["✅ No EC2 instances are running."]
+
+
+# -----------------------------
+# Check RDS Instances
+# -----------------------------
+def collect_rds(clients):
+    return list(iter_available_db_ids(clients['rds'], clients['requests']))
 
-    # -----------------------------
-    # Check RDS Instances
-    # -----------------------------
-    rds_response = rds.describe_db_instances()
-    running_rds = [db['DBInstanceIdentifier'] for db in rds_response['DBInstances'] if db['DBInstanceStatus'] == 'available']
 
+def inventory_rds(running_rds):
+    return {db_id: 'available' for db_id in running_rds}
+
+
+def render_rds(running_rds):
     if running_rds:
-        message_lines.append(f"\n🔶 Running RDS Instances:\n - " + "\n - ".join(running_rds))
-    else:
-        message_lines.append("\n✅ No RDS instances are running.")
+        return [f"\n🔶 Running RDS Instances:\n - " + "\n - ".join(running_rds)]
+    return ["\n✅ No RDS instances are running."]
 
-    # -----------------------------
-    # Check ECS Running Services
-    # -----------------------------
-    ecs_clusters = ecs.list_clusters()['clusterArns']
+
+# -----------------------------
+# Check ECS Running Services
+# -----------------------------
+def collect_ecs(clients):
+    ecs = clients['ecs']
     running_ecs_services = []
+    for service_name, cluster_arn in iter_running_services(ecs):
+        running_ecs_services.append(f"{service_name} in {cluster_arn}")
+    return running_ecs_services
 
-    for cluster_arn in ecs_clusters:
-        services = ecs.list_services(cluster=cluster_arn)['serviceArns']
-        if services:
-            described = ecs.describe_services(cluster=cluster_arn, services=services)['services']
-            for svc in described:
-                if svc['runningCount'] > 0:
-                    running_ecs_services.append(f"{svc['serviceName']} in {cluster_arn}")
 
+def inventory_ecs(running_ecs_services):
+    return {service: 'running' for service in running_ecs_services}
+
+
+def render_ecs(running_ecs_services):
     if running_ecs_services:
-        message_lines.append(f"\n🔶 Running ECS Services:\n - " + "\n - ".join(running_ecs_services))
-    else:
-        message_lines.append("\n✅ No ECS services are running.")
+        return [f"\n🔶 Running ECS Services:\n - " + "\n - ".join(running_ecs_services)]
+    return ["\n✅ No ECS services are running."]
 
-    # -----------------------------
-    # Check EBS Volumes
-    # -----------------------------
-    ebs_response = ec2.describe_volumes()
-    all_volumes = ebs_response['Volumes']
-    
-    unattached_ebs = [vol['VolumeId'] for vol in all_volumes if vol['State'] == 'available']
-    total_ebs_gb = sum(vol['Size'] for vol in all_volumes)  # Size is in GiB
-
-    if unattached_ebs:
-        message_lines.append(f"\n⚠️ Unattached EBS Volumes (incur cost):\n - " + "\n - ".join(unattached_ebs))
+
+# -----------------------------
+# Check EBS Volumes
+# -----------------------------
+SEVERITY_ICONS = {'critical': '❌', 'warning': '⚠️', 'info': '💡', 'ok': '✅'}
+
+
+def collect_ebs(clients):
+    unattached_ebs = []
+    total_ebs_gb = 0  # Size is in GiB
+
+    def volumes():
+        nonlocal total_ebs_gb
+        for volume_id, state, size in iter_volumes(clients['ec2'], clients['requests']):
+            total_ebs_gb += size
+            if state == 'available':
+                unattached_ebs.append(volume_id)
+            yield {'id': volume_id, 'state': state, 'size': size}
+
+    # The rules in rules.json with "section": "ebs" (the 30 GiB Free Tier
+    # limit). A rule file that cannot be loaded is reported by the findings
+    # check, so this one keeps the built-in limit
+    try:
+        rule_set = load_rules(section='ebs')
+    except RulesError:
+        rule_set = default_rules('ebs')
+    limits = rule_set.evaluate('ebs', volumes())
+    return {'unattached': unattached_ebs, 'total_gb': total_ebs_gb, 'limits': limits}
+
+
+def inventory_ebs(ebs):
+    inventory = {volume_id: 'unattached' for volume_id in ebs['unattached']}
+    inventory['total GiB'] = ebs['total_gb']
+    return inventory
+
+
+def render_ebs(ebs):
+    message_lines = []
+    if ebs['unattached']:
+        message_lines.append(f"\n⚠️ Unattached EBS Volumes (incur cost):\n - " + "\n - ".join(ebs['unattached']))
         message_lines.append("💡 Note: Unattached volumes are not covered by the Free Tier and WILL incur charges.")
     else:
         message_lines.append("\n✅ No unattached EBS volumes found.")
 
-    message_lines.append(f"\n📦 Total EBS Volume Usage: {total_ebs_gb} GiB")
-    if total_ebs_gb > 30:
-        message_lines.append("❌ EBS usage exceeds the 30 GiB Free Tier limit. Charges will apply.")
+    message_lines.append(f"\n📦 Total EBS Volume Usage: {ebs['total_gb']} GiB")
+    for severity, _, _, message in ebs.get('limits', []):
+        message_lines.append(f"{SEVERITY_ICONS.get(severity, '•')} {message}")
+    return message_lines
+
+
+# -----------------------------
+# Check Unassociated Elastic IPs
+# -----------------------------
+def collect_eip(clients):
+    # An address on an instance that is not running is billed like an
+    # unassociated one. Returns (public ip, instance id or None) pairs.
+    running = set(iter_running_instance_ids(clients['ec2'], clients['requests']))
+    return [
+        (public_ip, instance_id)
+        for public_ip, instance_id in iter_addresses(clients['ec2'], clients['requests'])
+        if instance_id is None or instance_id not in running
+    ]
+
+
+def inventory_eip(unused_ips):
+    return {
+        public_ip: f"on {instance_id} (not running)" if instance_id else 'unassociated'
+        for public_ip, instance_id in unused_ips
+    }
+
+
+def render_eip(unused_ips):
+    if unused_ips:
+        described = [
+            f"{public_ip} (on {instance_id}, not running)" if instance_id else public_ip
+            for public_ip, instance_id in unused_ips
+        ]
+        return [
+            f"\n⚠️ Unassociated Elastic IPs (incur cost):\n - " + "\n - ".join(described),
+            "💡 Note: Elastic IPs are free **only when attached to a running instance**. These WILL incur hourly charges.",
+        ]
+    return ["\n✅ No unused Elastic IPs found."]
+
+
+# -----------------------------
+# Evaluate Finding Rules
+# -----------------------------
+def collect_findings(clients):
+    # Every rule for a resource type is checked in one pass over its stream
+    rule_set = load_rules()
+    ec2, requests = clients['ec2'], clients['requests']
+    running = set(iter_running_instance_ids(ec2, requests))
+    addresses = (
+        {'id': public_ip, 'instance_id': instance_id, 'instance_running': instance_id in running}
+        for public_ip, instance_id in iter_addresses(ec2, requests)
+    )
+    findings = []
+    findings.extend(rule_set.evaluate('ec2', iter_instance_records(ec2, requests)))
+    findings.extend(rule_set.evaluate('rds', iter_db_records(clients['rds'], requests)))
+    findings.extend(rule_set.evaluate('ebs', iter_volume_records(ec2, requests)))
+    findings.extend(rule_set.evaluate('eip', addresses))
+    return sort_findings(findings)
+
+
+def inventory_findings(findings):
+    return {f"{rule} {resource_id}": severity for severity, rule, resource_id, _ in findings}
+
+
+def render_findings(findings):
+    if findings:
+        return ["\n📋 Findings:\n - " + "\n - ".join(
+            f"{SEVERITY_ICONS.get(severity, '•')} {message}" for severity, _, _, message in findings
+        )]
+    return ["\n✅ No findings from the configured rules."]
+
+
+# -----------------------------
+# Check Idle EC2 and RDS Instances
+# -----------------------------
+def collect_idle(clients):
+    resources = {
+        'EC2': list(iter_running_instance_ids(clients['ec2'], clients['requests'])),
+        'RDS': list(iter_available_db_ids(clients['rds'], clients['requests'])),
+    }
+    return find_idle_resources(clients['cloudwatch'], resources)
+
+
+def inventory_idle(idle_resources):
+    return {f"{kind} {resource_id}": 'idle' for kind, resource_id, _ in idle_resources}
+
+
+def render_idle(idle_resources):
+    if idle_resources:
+        described = [
+            f"{kind} {resource_id} (peak " + ", ".join(f"{metric} {peak:g}" for metric, peak in metrics.items()) + ")"
+            for kind, resource_id, metrics in idle_resources
+        ]
+        return [f"\n💤 Idle Instances (last {IDLE_LOOKBACK_DAYS} days):\n - " + "\n - ".join(described)]
+    return [f"\n✅ No idle EC2 or RDS instances in the last {IDLE_LOOKBACK_DAYS} days."]
+
+
+# -----------------------------
+# Estimate Monthly Cost
+# -----------------------------
+def collect_cost(clients):
+    ec2, rds, requests = clients['ec2'], clients['rds'], clients['requests']
+    hours = load_price_table()['hours_per_month']
+    columns = new_columns()
+    for instance_id, instance_type in iter_running_instance_types(ec2, requests):
+        add_resource(columns, 'EC2', instance_id, instance_type, hours)
+    for db_id, db_class in iter_available_db_classes(rds, requests):
+        add_resource(columns, 'RDS', db_id, db_class, hours)
+    for volume_id, volume_type, size in iter_volume_types(ec2, requests):
+        add_resource(columns, 'EBS', volume_id, volume_type, size)
+    for public_ip, _ in collect_eip(clients):
+        add_resource(columns, 'EIP', public_ip, 'idle', hours)
+
+    region = ec2.meta.region_name
+    costs, unpriced, priced_as = estimate(columns, region)
+    if priced_as != region:
+        print(f"⚠️ No prices for {region} in the price table; estimating with {priced_as} prices")
+    return {'columns': columns, 'costs': costs, 'total': sum(costs), 'unpriced': unpriced,
+            'region': region, 'priced_as': priced_as}
+
+
+def _approximate(cost):
+    # True when the region had no prices of its own and another region's were used
+    return cost.get('priced_as', cost.get('region')) != cost.get('region')
+
+
+def inventory_cost(cost):
+    return {'estimated USD/month': round(cost['total'], 2)}
+
+
+def render_cost(cost):
+    mark = '~' if _approximate(cost) else ''
+    message_lines = [f"\n💰 Estimated Monthly Cost: {mark}${cost['total']:,.2f}"]
+    offenders = top_offenders(cost['columns'], cost['costs'])
+    if offenders:
+        message_lines.append("Top offenders:\n - " + "\n - ".join(
+            f"{kind} {resource_id} ({resource_type}): {mark}${amount:,.2f}"
+            for amount, kind, resource_id, resource_type in offenders
+        ))
+    if mark:
+        message_lines.append(
+            f"💡 Note: the price table has no prices for {cost['region']}; "
+            f"amounts marked ~ use {cost['priced_as']} prices."
+        )
+    if cost['unpriced']:
+        message_lines.append(f"💡 Note: {cost['unpriced']} resource(s) have no entry in the price table and count as $0.")
+    return message_lines
+
+
+def render_cost_summary(scoped_results):
+    # Ranks the most expensive resources across every account and region
+    costs_by_scope = {
+        scope: results['cost']
+        for scope, results in scoped_results.items()
+        if isinstance(results.get('cost'), dict)
+    }
+    if len(costs_by_scope) < 2:
+        return []
+    scoped_estimates = {scope: (cost['columns'], cost['costs']) for scope, cost in costs_by_scope.items()}
+    approximate = sorted(scope for scope, cost in costs_by_scope.items() if _approximate(cost))
+    total = sum(sum(costs) for _, costs in scoped_estimates.values())
+    offenders = top_offenders_across(scoped_estimates)
+    summary = (
+        f"💰 Estimated Monthly Cost, all scopes: {'~' if approximate else ''}${total:,.2f}\nTop offenders:\n - "
+        + "\n - ".join(
+            f"{kind} {resource_id} ({resource_type}) in {scope}: {'~' if scope in approximate else ''}${amount:,.2f}"
+            for amount, scope, kind, resource_id, resource_type in offenders
+        )
+    )
+    if approximate:
+        summary += (
+            f"\n💡 Note: the price table has no prices for {', '.join(approximate)}; "
+            f"amounts marked ~ use another region's prices."
+        )
+    return [summary + "\n"]
+
+
+def has_findings_rules():
+    # Only with rules outside the check sections; the shipped rules.json has
+    # none, and the check would otherwise make every query it reads shared.
+    # A rule file that cannot be loaded keeps the check, which then reports
+    # the error as failed instead of the function failing to start
+    try:
+        return load_rules().count > 0
+    except RulesError as e:
+        print(f"⚠️ {e}")
+        return True
+
+
+# Report order is fixed here, whatever order the checks finish in
+CHECKS = [
+    ('ec2', collect_ec2, render_ec2),
+    ('rds', collect_rds, render_rds),
+    ('ecs', collect_ecs, render_ecs),
+    ('ebs', collect_ebs, render_ebs),
+    ('eip', collect_eip, render_eip),
+]
+if has_findings_rules():
+    CHECKS.append(('findings', collect_findings, render_findings))
+if IDLE_DETECTION:
+    CHECKS.append(('idle', collect_idle, render_idle))
+if COST_ESTIMATION:
+    CHECKS.append(('cost', collect_cost, render_cost))
+
+# API calls each check needs; calls declared by more than one check run
+# once per scan and are shared between them
+CHECK_QUERIES = {
+    'ec2': [RUNNING_INSTANCES],
+    'rds': [AVAILABLE_DB_INSTANCES],
+    'ecs': [],
+    'ebs': [ALL_VOLUMES],
+    'eip': [RUNNING_INSTANCES, ALL_ADDRESSES],
+    'findings': [RUNNING_INSTANCES, AVAILABLE_DB_INSTANCES, ALL_VOLUMES, ALL_ADDRESSES],
+    'idle': [RUNNING_INSTANCES, AVAILABLE_DB_INSTANCES],
+    'cost': [RUNNING_INSTANCES, AVAILABLE_DB_INSTANCES, ALL_VOLUMES, ALL_ADDRESSES],
+}
+
+# Services each check calls, for the asyncio engine's per-service limits
+CHECK_SERVICES = {
+    'ec2': ['ec2'],
+    'rds': ['rds'],
+    'ecs': ['ecs'],
+    'ebs': ['ec2'],
+    'eip': ['ec2'],
+    'findings': ['ec2', 'rds'],
+    'idle': ['ec2', 'rds', 'cloudwatch'],
+    'cost': ['ec2', 'rds'],
+}
+
+# Clients each scope builds: only the services the active checks call (so
+# CloudWatch only with idle detection), and always EC2, which scans read
+# their region from
+SCAN_SERVICES = tuple(sorted({'ec2'} | {service for name, _, _ in CHECKS for service in CHECK_SERVICES[name]}))
+
+# Compact {resource: state} form of each check's result, used for snapshots
+INVENTORIES = {
+    'ec2': inventory_ec2,
+    'rds': inventory_rds,
+    'ecs': inventory_ecs,
+    'ebs': inventory_ebs,
+    'eip': inventory_eip,
+    'findings': inventory_findings,
+    'idle': inventory_idle,
+    'cost': inventory_cost,
+}
+
+
+# -----------------------------
+# Collection Engine
+# -----------------------------
+def create_clients(session, services=SCAN_SERVICES, region_name=None):
+    # Sessions are not thread-safe but clients are, so build them up front
+    return {name: get_client(name, region_name=region_name, session=session) for name in services}
+
+
+def _collect_if_time_left(name, collect, clients, deadline):
+    # An AWS error costs this check its section, not the whole report
+    if not deadline.should_start(name):
+        return SKIPPED
+    try:
+        with timed_check(name):
+            return collect(clients)
+    except CHECK_ERRORS as e:
+        print(f"⚠️ The {name} check failed: {e}")
+        return CheckFailed(e)
+
+
+def _prepare_scan(clients, checks, config_inventory, account_id):
+    # Returns the clients with this scan's request cache, the results still
+    # cached for this account and region, and the checks that must run
+    region = clients['ec2'].meta.region_name
+    cached = cached_results(account_id, region, [name for name, _, _ in checks])
+    stale = [check for check in checks if check[0] not in cached]
+    queries = {name: CHECK_QUERIES.get(name, []) for name, _, _ in stale}
+    if config_inventory is None:
+        requests = RequestCache(shared_queries(queries))
     else:
-        message_lines.append("✅ EBS usage is within the 30 GiB Free Tier limit.")
+        requests = config_inventory.requests(account_id, region, shared_queries(queries))
+    return dict(clients, requests=requests), cached, stale
+
+
+def _finish_scan(clients, checks, cached, outcomes, account_id):
+    # outcomes: {check: results, INCOMPLETE, SKIPPED or CheckFailed} for the checks that ran
+    results = {name: cached[name] if name in cached else outcomes[name] for name, _, _ in checks}
+    store_results(account_id, clients['ec2'].meta.region_name, {
+        name: result for name, result in outcomes.items() if not unfinished(result)
+    })
+    return results
+
+
+def collect_results(clients, checks=CHECKS, max_workers=MAX_WORKERS, timeout=None, deadline=NO_DEADLINE,
+                    config_inventory=None, account_id=None):
+    # Checks still running after the timeout or the deadline are reported as
+    # INCOMPLETE; checks that would start too close to the deadline as SKIPPED;
+    # checks whose API calls failed as CheckFailed. Checks collected for this account and region within the cache TTL are
+    # not run again.
+    clients, cached, stale = _prepare_scan(clients, checks, config_inventory, account_id)
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {
+        name: pool.submit(_collect_if_time_left, name, collect, clients, deadline)
+        for name, collect, _ in by_priority(stale)
+    }
+    wait(futures.values(), timeout=deadline.timeout(timeout))
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    outcomes = {}
+    for name, future in futures.items():
+        if future.cancelled():
+            outcomes[name] = SKIPPED
+        elif future.done():
+            outcomes[name] = future.result()
+        else:
+            outcomes[name] = INCOMPLETE
+    return _finish_scan(clients, checks, cached, outcomes, account_id)
+
+
+# The render_* functions below are generators, so the report can be streamed
+# out without holding every line in memory at once
+def render_results(results, checks=CHECKS):
+    for name, _, render in checks:
+        if results[name] is INCOMPLETE:
+            yield f"\n⏱️ The {name.upper()} check did not finish in time."
+        elif results[name] is SKIPPED:
+            yield f"\n⏭️ The {name.upper()} check was skipped to finish before the Lambda timeout."
+        elif isinstance(results[name], CheckFailed):
+            yield f"\n❌ The {name.upper()} check failed: {results[name]}"
+        else:
+            yield from render(results[name])
+
+
+# -----------------------------
+# Multi-Region Fan-Out
+# -----------------------------
+def discover_regions(session):
+    # Without AllRegions, only regions enabled for the account are returned
+    ec2 = get_client('ec2', session=session)
+    return sorted(region['RegionName'] for region in ec2.describe_regions()['Regions'])
+
+
+def scan_region(session, region, **kwargs):
+    # get_client builds clients under its lock, so this is safe from any thread
+    return collect_results(create_clients(session, region_name=region), **kwargs)
+
+
+def scan_regions(session, regions, region_workers=REGION_MAX_WORKERS, region_budget=REGION_TIME_BUDGET,
+                 deadline=NO_DEADLINE, config_inventory=None, account_id=None):
+    # Each region gets its own client pool and its own time budget; a region
+    # that fails is returned as error text, like an account in scan_account
+    with ThreadPoolExecutor(max_workers=region_workers) as pool:
+        futures = {
+            region: pool.submit(scan_region, session, region, timeout=region_budget, deadline=deadline,
+                                config_inventory=config_inventory, account_id=account_id)
+            for region in regions
+        }
+        region_results = {}
+        for region, future in futures.items():
+            try:
+                region_results[region] = future.result()
+            except (BotoCoreError, ClientError) as e:
+                region_results[region] = str(e)
+        return region_results
+
+
+def render_regions(region_results):
+    for region in sorted(region_results):
+        yield f"\n🌍 Region: {region}\n=============================="
+        if isinstance(region_results[region], str):
+            yield f"❌ Could not scan region {region}: {region_results[region]}"
+        else:
+            yield from render_results(region_results[region])
+
+
+def scanned_regions(region_results, account_id=None):
+    # {scope: results} for the regions that were scanned, leaving out failed ones
+    return {
+        f"{account_id}/{region}" if account_id else region: results
+        for region, results in region_results.items()
+        if not isinstance(results, str)
+    }
+
+
+# -----------------------------
+# Cross-Account Fan-Out
+# -----------------------------
+# Module scope, so warm invocations reuse assumed-role credentials
+# instead of calling STS again
+_credential_cache = {}
+_account_sessions = {}
+_account_sessions_lock = threading.Lock()
+
+
+def discover_accounts(session):
+    organizations = get_client('organizations', session=session)
+    accounts = []
+    for page in organizations.get_paginator('list_accounts').paginate():
+        accounts.extend(acct['Id'] for acct in page['Accounts'] if acct['Status'] == 'ACTIVE')
+    return sorted(accounts)
+
+
+def assume_role_session(base_session, account_id, role_name=CHECKER_ROLE_NAME):
+    with _account_sessions_lock:
+        if account_id in _account_sessions:
+            return _account_sessions[account_id]
+
+        fetcher = AssumeRoleCredentialFetcher(
+            # Called on first use, from account worker threads, so STS
+            # clients are built through get_client under its lock
+            client_creator=lambda service, **_: get_client(service, session=base_session),
+            source_credentials=base_session.get_credentials(),
+            role_arn=f"arn:aws:iam::{account_id}:role/{role_name}",
+            extra_args={'RoleSessionName': 'daily-resource-checker'},
+            cache=_credential_cache,
+        )
+        # STS is only called on first use and again shortly before expiry
+        botocore_session = botocore.session.Session()
+        botocore_session._credentials = DeferredRefreshableCredentials(
+            method='assume-role',
+            refresh_using=fetcher.fetch_credentials,
+        )
+        session = boto3.session.Session(botocore_session=botocore_session, region_name=base_session.region_name)
+        _account_sessions[account_id] = session
+        return session
+
+
+def account_session(base_session, account_id):
+    # Assumes the role now rather than on first use, so a role that cannot be
+    # assumed fails the account once instead of every check in every region
+    session = assume_role_session(base_session, account_id)
+    session.get_credentials().get_frozen_credentials()
+    return session
+
+
+def scan_account(base_session, account_id, all_regions, regions=None, deadline=NO_DEADLINE, config_inventory=None):
+    if deadline.expired():
+        return "skipped to finish before the Lambda timeout"
+    try:
+        session = account_session(base_session, account_id)
+        if all_regions:
+            regions = regions or discover_regions(session)
+        return scan_regions(session, regions or [session.region_name], deadline=deadline,
+                            config_inventory=config_inventory, account_id=account_id)
+    except (BotoCoreError, ClientError) as e:
+        return str(e)
+
+
+def scan_accounts(base_session, accounts, all_regions, regions=None, account_workers=ACCOUNT_MAX_WORKERS,
+                  deadline=NO_DEADLINE, config_inventory=None):
+    with ThreadPoolExecutor(max_workers=account_workers) as pool:
+        futures = {
+            account_id: pool.submit(scan_account, base_session, account_id, all_regions, regions, deadline,
+                                    config_inventory)
+            for account_id in accounts
+        }
+        return {account_id: future.result() for account_id, future in futures.items()}
+
+
+def render_accounts(account_results):
+    for account_id in sorted(account_results):
+        yield f"\n🏢 Account: {account_id}\n##############################"
+        region_results = account_results[account_id]
+        if isinstance(region_results, str):
+            yield f"❌ Could not scan account {account_id}: {region_results}"
+        else:
+            yield from render_regions(region_results)
+
+
+# -----------------------------
+# Asyncio Engine
+# -----------------------------
+async def collect_results_async(engine, clients, checks=CHECKS, budget=None, deadline=NO_DEADLINE,
+                                config_inventory=None, account_id=None):
+    # Same results as collect_results, with every check run as an engine job;
+    # `budget` is the time each check may run once it has its slots
+    clients, cached, stale = _prepare_scan(clients, checks, config_inventory, account_id)
+    started = set()
+    jobs = {
+        name: engine.submit(_collect_if_time_left, name, collect, clients, deadline,
+                            services=CHECK_SERVICES.get(name, ()), region=clients['ec2'].meta.region_name,
+                            timeout=budget, on_start=lambda name=name: started.add(name))
+        for name, collect, _ in by_priority(stale)
+    }
+    done, errors = await run_jobs(engine, jobs, timeout=deadline.timeout())
+
+    outcomes = {}
+    for name in jobs:
+        if name in done:
+            outcomes[name] = done[name]
+        elif isinstance(errors.get(name), CHECK_ERRORS):
+            outcomes[name] = CheckFailed(errors[name])
+        elif name in errors and not isinstance(errors[name], asyncio.TimeoutError):
+            raise errors[name]
+        else:
+            outcomes[name] = INCOMPLETE if name in started else SKIPPED
+    return _finish_scan(clients, checks, cached, outcomes, account_id)
+
+
+async def scan_region_async(engine, session, region, **kwargs):
+    clients = await engine.submit(partial(create_clients, session, region_name=region))
+    return await collect_results_async(engine, clients, **kwargs)
+
+
+async def scan_account_async(engine, session, account_id, all_regions, regions, budget, deadline,
+                             config_inventory=None, config_account_id=None):
+    # account_id None scans the current account (config_account_id is its id
+    # for the Config backend); failed accounts and regions are returned as text
+    try:
+        if account_id is not None:
+            if deadline.expired():
+                return "skipped to finish before the Lambda timeout"
+            session = await engine.submit(account_session, session, account_id)
+        if all_regions and not regions:
+            regions = await engine.submit(discover_regions, session, services=['ec2'])
+        regions = regions or [session.region_name]
+        scans = {
+            region: scan_region_async(engine, session, region, budget=budget, deadline=deadline,
+                                      config_inventory=config_inventory, account_id=account_id or config_account_id)
+            for region in regions
+        }
+        results, errors = await run_jobs(engine, scans)
+        for region, error in errors.items():
+            if not isinstance(error, (BotoCoreError, ClientError)):
+                raise error
+            results[region] = str(error)
+        # In the order asked for, not the order the regions finished in
+        return {region: results[region] for region in regions}
+    except (BotoCoreError, ClientError) as e:
+        if account_id is None:
+            raise
+        return str(e)
+
+
+def scan_with_engine(session, accounts, all_regions, regions=None, budget=REGION_TIME_BUDGET, deadline=NO_DEADLINE,
+                     config_inventory=None, config_account_id=None):
+    # Returns {account id: {region: results} or error text}, with the
+    # current account under None
+    engine = Engine()
+
+    async def scan():
+        scans = {
+            account_id: scan_account_async(engine, session, account_id, all_regions, regions, budget, deadline,
+                                           config_inventory, config_account_id)
+            for account_id in accounts
+        }
+        results, errors = await run_jobs(engine, scans)
+        for error in errors.values():
+            raise error
+        return {account_id: results[account_id] for account_id in accounts}
+
+    try:
+        return asyncio.run(scan())
+    finally:
+        engine.shutdown()
+        engine.log_stats()
+
+
+# -----------------------------
+# AWS Config Backend
+# -----------------------------
+def load_config_inventory(session, aggregator_name=CONFIG_AGGREGATOR_NAME):
+    # Returns None, and the Describe APIs are used, when the aggregator cannot be queried
+    if not aggregator_name:
+        print("⚠️ COLLECTION_BACKEND=config needs CONFIG_AGGREGATOR_NAME; using the Describe APIs.")
+        return None
+    try:
+        return fetch_inventory(get_client('config', session=session), aggregator_name)
+    except ClientError as e:
+        print(f"⚠️ Config aggregator query failed, using the Describe APIs: {e}")
+        return None
+
+
+def current_account_id(session):
+    return get_client('sts', session=session).get_caller_identity()['Account']
+
+
+# -----------------------------
+# Sharded Fan-Out
+# -----------------------------
+def create_invoker(kind, session):
+    if kind == 'local':
+        return LocalInvoker(lambda_handler)
+    return LambdaInvoker(session=session)
+
+
+def run_shard(event, deadline=NO_DEADLINE):
+    # Worker side: scans one account x region and stores the results for the coordinator
+    shard = event['shard']
+    session = get_session()
+    results, error = None, None
+    try:
+        scan_session = assume_role_session(session, shard['account']) if shard['account'] else session
+        clients = create_clients(scan_session, region_name=shard['region'])
+        results = encode_results(collect_results(clients, deadline=deadline, account_id=shard['account']),
+                                 SHARD_MARKERS)
+    except Exception as e:
+        # Reported to the coordinator rather than raised, so it does not wait
+        # for this shard and Lambda does not retry it
+        error = str(e)
+    save_shard_result(event['shard_results'], event['run_id'], shard, results, error, session)
+    return {'statusCode': 200, 'body': f"Shard {shard['id']}: {error or 'done'}"}
+
+
+def scan_shards(session, accounts, regions, invoker, deadline=NO_DEADLINE):
+    # Coordinator side: accounts is [None] to shard the current account by region
+    results_path = invoker.results_path
+    run_id = new_run_id()
+    shards = plan_shards(accounts, regions)
+    try:
+        for shard in shards:
+            invoker.invoke({'shard': shard, 'run_id': run_id, 'shard_results': results_path,
+                            'hedge': hedging_enabled()})
+        payloads = wait_for_shards(results_path, run_id, shards, session, deadline.timeout(SHARD_WAIT_SECONDS))
+    finally:
+        invoker.shutdown()
+    print(f"shards: run_id={run_id} planned={len(shards)} reported={len(payloads)}")
+    # Shards that never reported are shown as unfinished, like a check that timed out
+    missing = {name: INCOMPLETE for name, _, _ in CHECKS}
+    return merge_shards(shards, payloads, SHARD_MARKERS, missing)
+
+
+def log_timing(handler_started):
+    global _cold_start
+    print(
+        f"timing: cold_start={_cold_start} init_ms={INIT_SECONDS * 1000:.1f} "
+        f"handler_ms={(time.perf_counter() - handler_started) * 1000:.1f} clients={clients_created()}"
+    )
+    _cold_start = False
+
+
+def render_partial_notice(scoped_results, account_results=None, region_results=None):
+    # Lists every check, region and account that did not complete, if any
+    incomplete = [
+        f"{name.upper()} in {scope}" + (" (failed)" if isinstance(result, CheckFailed) else "")
+        for scope, results in sorted(scoped_results.items())
+        for name, result in results.items()
+        if unfinished(result)
+    ]
+    for account_id, account_regions in sorted((account_results or {}).items()):
+        if isinstance(account_regions, str):
+            incomplete.append(f"account {account_id}")
+        else:
+            incomplete.extend(
+                f"region {region} in account {account_id}"
+                for region, results in sorted(account_regions.items()) if isinstance(results, str)
+            )
+    incomplete.extend(
+        f"region {region}" for region, results in sorted((region_results or {}).items()) if isinstance(results, str)
+    )
+    if not incomplete:
+        return []
+    return [
+        f"⚠️ Partial report: {len(incomplete)} check(s) did not complete:\n - " + "\n - ".join(incomplete) + "\n"
+    ]
+
+
+def lambda_handler(event, context):
+    # {"profile": true} profiles this invocation only; without it the
+    # profiler is never imported or enabled
+    if event.get('profile'):
+        return profile_invocation(handle_event, event, context, get_session())
+    return handle_event(event, context)
+
+
+def handle_event(event, context):
+    handler_started = time.perf_counter()
+    reset_query_stats()
+    reset_metrics()
+    reset_cache_stats()
+    set_hedging(event.get('hedge', HEDGED_REQUESTS))
+    session = get_session()
+    deadline = Deadline(context)
+    if event.get('refresh'):
+        # Rescan everything, e.g. to confirm a clean-up right away
+        clear_cache()
+
+    if 'shard' in event:
+        response = run_shard(event, deadline)
+        emit_metrics((time.perf_counter() - handler_started) * 1000)
+        log_timing(handler_started)
+        return response
+
+    # Each mode yields results keyed by scope plus a renderer for the full report
+    all_regions = event.get('all_regions', SCAN_ALL_REGIONS)
+    sharded = event.get('sharded', SHARDED)
+    use_asyncio = event.get('engine', COLLECTION_ENGINE) == 'asyncio'
+    config_inventory = None
+    if event.get('backend', COLLECTION_BACKEND) == 'config' and not sharded:
+        config_inventory = load_config_inventory(session, event.get('aggregator', CONFIG_AGGREGATOR_NAME))
+    if event.get('all_accounts', SCAN_ALL_ACCOUNTS):
+        accounts = event.get('accounts') or TARGET_ACCOUNTS or discover_accounts(session)
+        if sharded:
+            # Every account is sharded over the coordinator's regions
+            regions = event.get('regions') or (discover_regions(session) if all_regions else [session.region_name])
+            invoker = create_invoker(event.get('shard_invoker', SHARD_INVOKER), session)
+            account_results = scan_shards(session, accounts, regions, invoker, deadline)
+        elif use_asyncio:
+            account_results = scan_with_engine(session, accounts, all_regions, event.get('regions'),
+                                               deadline=deadline, config_inventory=config_inventory)
+        else:
+            account_results = scan_accounts(session, accounts, all_regions, event.get('regions'),
+                                            deadline=deadline, config_inventory=config_inventory)
+        scoped_results = {
+            scope: results
+            for account_id, region_results in account_results.items()
+            if not isinstance(region_results, str)
+            for scope, results in scanned_regions(region_results, account_id).items()
+        }
+        region_results = None
+        render_full = lambda: render_accounts(account_results)
+    elif all_regions:
+        regions = event.get('regions') or discover_regions(session)
+        account_results = None
+        if sharded:
+            invoker = create_invoker(event.get('shard_invoker', SHARD_INVOKER), session)
+            region_results = scan_shards(session, [None], regions, invoker, deadline)[None]
+        else:
+            account_id = current_account_id(session) if config_inventory is not None else None
+            if use_asyncio:
+                region_results = scan_with_engine(session, [None], all_regions, regions, deadline=deadline,
+                                                  config_inventory=config_inventory, config_account_id=account_id)[None]
+            else:
+                region_results = scan_regions(session, regions, deadline=deadline, config_inventory=config_inventory,
+                                              account_id=account_id)
+        scoped_results = scanned_regions(region_results)
+        render_full = lambda: render_regions(region_results)
+    else:
+        account_results = region_results = None
+        account_id = current_account_id(session) if config_inventory is not None else None
+        if use_asyncio:
+            results = scan_with_engine(session, [None], False, [session.region_name], budget=None, deadline=deadline,
+                                       config_inventory=config_inventory, config_account_id=account_id)[None]
+            results = results[session.region_name]
+            if isinstance(results, str):
+                # The only region failed, so there is nothing to report
+                raise RuntimeError(f"Could not scan {session.region_name}: {results}")
+        else:
+            results = collect_results(create_clients(session), deadline=deadline, config_inventory=config_inventory,
+                                      account_id=account_id)
+        scoped_results = {session.region_name: results}
+        render_full = lambda: render_results(results)
+
+    log_query_stats()
+    log_rate_limits()
+    log_cache_stats()
+    log_hedge_stats()
 
     # -----------------------------
-    # Check Unassociated Elastic IPs
+    # Compare with the Last Snapshot
     # -----------------------------
-    addresses = ec2.describe_addresses()
-    unused_ips = [addr['PublicIp'] for addr in addresses['Addresses'] if 'InstanceId' not in addr]
+    snapshot_path = event.get('snapshot_path', SNAPSHOT_PATH)
+    previous = load_snapshot(snapshot_path, session)
+    inventory = build_inventory(scoped_results, INVENTORIES, unfinished)
 
-    if unused_ips:
-        message_lines.append(f"\n⚠️ Unassociated Elastic IPs (incur cost):\n - " + "\n - ".join(unused_ips))
-        message_lines.append("💡 Note: Elastic IPs are free **only when attached to a running instance**. These WILL incur hourly charges.")
+    if event.get('report_mode', REPORT_MODE) == 'delta' and previous is not None:
+        message_lines = render_delta(diff_inventory(previous['inventory'], inventory), previous['taken_at'])
     else:
-        message_lines.append("\n✅ No unused Elastic IPs found.")
+        message_lines = render_full()
+    message_lines = chain(
+        render_partial_notice(scoped_results, account_results, region_results),
+        render_cost_summary(scoped_results),
+        render_hedge_summary(),
+        message_lines,
+    )
 
     # -----------------------------
     # Send the Final Summary Email
     # -----------------------------
-    final_message = "\n".join(message_lines)
-
     # Format date as "8 August, 2025"
     today = datetime.utcnow().strftime("%-d %B, %Y")  # For AWS Lambda (Amazon Linux)
 
     subject_line = f"[AWS Alert] Daily Resource Usage Summary - {today}"
 
-    sns.publish(
-        TopicArn='arn:aws:sns:us-west-2:798278983508:daily-resource-alerts',
-        Subject=subject_line,
-        Message=final_message
-    )
+    # Large reports go to S3 and the email carries a headline and a link
+    final_message = publish_report(session, message_lines, SNS_TOPIC_ARN, subject_line)
+
+    # Only a sent report moves the baseline on, so a failed publish (and its
+    # retry) still reports everything new since the last sent report
+    save_snapshot(snapshot_path, carry_forward(previous['inventory'] if previous else {}, inventory), session)
+
+    # Optional long-term history, for questions like "how long has this been unattached?"
+    history_path = event.get('history_path', HISTORY_PATH)
+    if history_path:
+        record_history(history_path, inventory, session)
+
+    emit_metrics((time.perf_counter() - handler_started) * 1000)
+    log_timing(handler_started)
 
     return {
         'statusCode': 200,
         'body': final_message
     }
+
+
+_cold_start = True
+INIT_SECONDS = time.perf_counter() - _init_started
@@ -0,0 +1,210 @@
+# Sharded scans across parallel Lambda invocations.
+# A coordinator invocation splits the scan into one shard per account x
+# region and starts a worker invocation for each (asynchronously, so workers
+# run in parallel with their own memory and 15-minute limit). Every worker
+# writes its check results to SHARD_RESULTS_PATH; the coordinator waits for
+# them and merges them back into the same shape a single invocation produces,
+# so snapshots and reports work unchanged.
+import gzip
+import json
+import os
+import time
+import uuid
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+from clients import get_client
+
+# s3://bucket/prefix shared by the coordinator and its workers. Worker Lambdas
+# cannot see the coordinator's /tmp, so a local directory only works (and is
+# only the default) with the local invoker
+SHARD_RESULTS_PATH = os.environ.get('SHARD_RESULTS_PATH', '')
+LOCAL_SHARD_RESULTS_PATH = '/tmp/daily-resource-shards'
+# Function the workers run in; defaults to the coordinator's own function
+SHARD_FUNCTION_NAME = os.environ.get('SHARD_FUNCTION_NAME', os.environ.get('AWS_LAMBDA_FUNCTION_NAME', ''))
+SHARD_POLL_SECONDS = float(os.environ.get('SHARD_POLL_SECONDS', '5'))
+# Longest the coordinator waits for its workers when it has no Lambda deadline
+SHARD_WAIT_SECONDS = float(os.environ.get('SHARD_WAIT_SECONDS', '840'))
+
+
+def new_run_id():
+    return f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def plan_shards(accounts, regions):
+    # accounts is [None] to scan the coordinator's own account
+    return [
+        {'id': f"{account or 'local'}-{region}", 'account': account, 'region': region}
+        for account in accounts
+        for region in regions
+    ]
+
+
+# -----------------------------
+# Invokers
+# -----------------------------
+class LambdaInvoker:
+    def __init__(self, function_name=SHARD_FUNCTION_NAME, session=None, results_path=SHARD_RESULTS_PATH):
+        # Checked before any worker starts, instead of waiting out the
+        # deadline for results the coordinator could never read
+        if not results_path.startswith('s3://'):
+            raise ValueError(
+                f"Sharded scans on Lambda need SHARD_RESULTS_PATH=s3://bucket/prefix, not {results_path!r}; "
+                "worker invocations cannot write to the coordinator's /tmp"
+            )
+        self.function_name = function_name
+        self.session = session
+        self.results_path = results_path
+
+    def invoke(self, event):
+        # 'Event' invocations return as soon as Lambda has queued them
+        get_client('lambda', session=self.session).invoke(
+            FunctionName=self.function_name,
+            InvocationType='Event',
+            Payload=json.dumps(event).encode(),
+        )
+
+    def shutdown(self):
+        # Queued Lambda invocations run on their own
+        pass
+
+
+class LocalInvoker:
+    # Stands in for Lambda when testing: each worker event runs through the
+    # handler on a local thread pool. Query stats and metrics are process-wide,
+    # so they are only meaningful per real Lambda invocation.
+    def __init__(self, handler, max_workers=4, results_path=SHARD_RESULTS_PATH or LOCAL_SHARD_RESULTS_PATH):
+        self.handler = handler
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.results_path = results_path
+
+    def invoke(self, event):
+        self.pool.submit(self.handler, event, None)
+
+    def shutdown(self):
+        # Drops shards that have not started; the coordinator does not wait
+        # for running ones, whose late results land under their own run id
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+# -----------------------------
+# Result Encoding
+# -----------------------------
+def encode_results(results, markers):
+    # markers: {name: marker}, e.g. the INCOMPLETE and SKIPPED markers; a
+    # marker that is a str subclass (a failed check) travels with its text
+    names = {id(marker): name for name, marker in markers.items()}
+    kinds = {marker: name for name, marker in markers.items() if isinstance(marker, type)}
+
+    def encode(value):
+        if isinstance(value, array):
+            return {'__array__': value.typecode, 'values': value.tolist()}
+        raise TypeError(f"Cannot encode {type(value).__name__} in shard results")
+
+    def plain(result):
+        if id(result) in names:
+            return {'__marker__': names[id(result)]}
+        if type(result) in kinds:
+            return {'__marker__': kinds[type(result)], 'text': str(result)}
+        return result
+
+    return json.dumps({check: plain(result) for check, result in results.items()}, default=encode,
+                      separators=(',', ':'))
+
+
+def decode_results(text, markers):
+    def decode(obj):
+        if '__marker__' in obj:
+            marker = markers[obj['__marker__']]
+            return marker(obj['text']) if 'text' in obj else marker
+        if '__array__' in obj:
+            return array(obj['__array__'], obj['values'])
+        return obj
+    return json.loads(text, object_hook=decode)
+
+
+# -----------------------------
+# Result Store
+# -----------------------------
+def _split_s3_path(path):
+    bucket, _, prefix = path[len('s3://'):].partition('/')
+    return bucket, prefix.rstrip('/')
+
+
+def save_shard_result(path, run_id, shard, results, error, session):
+    # results is the encode_results() text, or None when the shard failed with error
+    payload = {'shard': shard, 'results': results, 'error': error}
+    body = gzip.compress(json.dumps(payload, separators=(',', ':')).encode())
+    name = f"{run_id}/{shard['id']}.json.gz"
+    if path.startswith('s3://'):
+        bucket, prefix = _split_s3_path(path)
+        get_client('s3', session=session).put_object(Bucket=bucket, Key=f"{prefix}/{name}".lstrip('/'), Body=body)
+    else:
+        os.makedirs(os.path.join(path, run_id), exist_ok=True)
+        with open(os.path.join(path, name), 'wb') as f:
+            f.write(body)
+
+
+def _load_new_results(path, run_id, known, session):
+    # Returns {shard id: payload} for results that appeared since the last poll
+    found = {}
+    if path.startswith('s3://'):
+        bucket, prefix = _split_s3_path(path)
+        s3 = get_client('s3', session=session)
+        run_prefix = f"{prefix}/{run_id}/".lstrip('/')
+        for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=run_prefix):
+            for obj in page.get('Contents', []):
+                shard_id = obj['Key'][len(run_prefix):-len('.json.gz')]
+                if shard_id not in known:
+                    body = s3.get_object(Bucket=bucket, Key=obj['Key'])['Body'].read()
+                    found[shard_id] = json.loads(gzip.decompress(body))
+    else:
+        run_dir = os.path.join(path, run_id)
+        for name in os.listdir(run_dir) if os.path.isdir(run_dir) else []:
+            shard_id = name[:-len('.json.gz')]
+            if shard_id not in known:
+                with open(os.path.join(run_dir, name), 'rb') as f:
+                    found[shard_id] = json.loads(gzip.decompress(f.read()))
+    return found
+
+
+def wait_for_shards(path, run_id, shards, session, timeout, poll=SHARD_POLL_SECONDS):
+    # Returns {shard id: payload} for every shard that reported within the timeout
+    expected = {shard['id'] for shard in shards}
+    payloads = {}
+    give_up_at = time.monotonic() + timeout
+    while True:
+        try:
+            payloads.update(_load_new_results(path, run_id, payloads, session))
+        except (ClientError, OSError) as e:
+            print(f"⚠️ Could not read shard results from {path}: {e}")
+        if expected <= payloads.keys() or time.monotonic() >= give_up_at:
+            return payloads
+        time.sleep(min(poll, max(0.0, give_up_at - time.monotonic())))
+
+
+def merge_shards(shards, payloads, markers, missing):
+    # Returns {account: {region: results}} (account None for the coordinator's
+    # own account), the shape scan_with_engine returns. Shards that never
+    # reported get the `missing` results; a failed shard's region is its error
+    # text, as in scan_regions, and an account is only its error text when
+    # every shard for it failed, as in scan_account
+    merged = {}
+    for shard in shards:
+        payload = payloads.get(shard['id'])
+        if payload is None:
+            results = dict(missing)
+        elif payload['error'] is not None:
+            print(f"⚠️ Shard {shard['id']}: {payload['error']}")
+            results = payload['error']
+        else:
+            results = decode_results(payload['results'], markers)
+        merged.setdefault(shard['account'], {})[shard['region']] = results
+
+    for account, region_results in merged.items():
+        if account is not None and all(isinstance(results, str) for results in region_results.values()):
+            merged[account] = next(iter(region_results.values()))
+    return merged
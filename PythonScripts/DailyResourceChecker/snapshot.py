@@ -0,0 +1,117 @@
+# Inventory snapshots and delta reports for the daily resource checks.
+# Each run saves a compact gzipped JSON snapshot of what it found, keyed by
+# scope (region or account/region), check and resource. The next run
+# compares against it and reports only what was added, removed or changed.
+import gzip
+import json
+import os
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+from clients import get_client
+
+
+def build_inventory(scoped_results, inventories, unfinished):
+    # Checks that did not finish (unfinished(result) is true) are left out so
+    # they are not seen as removals
+    inventory = {}
+    for scope, results in scoped_results.items():
+        inventory[scope] = {
+            name: inventories[name](result)
+            for name, result in results.items()
+            if not unfinished(result)
+        }
+    return inventory
+
+
+def carry_forward(previous, current):
+    # Keep the last known state of scopes and checks missing from this run
+    merged = {scope: dict(checks) for scope, checks in previous.items()}
+    for scope, checks in current.items():
+        merged.setdefault(scope, {}).update(checks)
+    return merged
+
+
+def diff_inventory(previous, current):
+    # Returns {scope: {check: {'new': [...], 'removed': [...], 'changed': [...]}}}
+    # for every check with at least one difference. A scope or check the last
+    # run did not have (a new account, region or check) counts as empty, so
+    # everything in it is reported as new
+    delta = {}
+    for scope, checks in current.items():
+        for name, resources in checks.items():
+            before = previous.get(scope, {}).get(name, {})
+            new = sorted(resources.keys() - before.keys())
+            removed = sorted(before.keys() - resources.keys())
+            changed = sorted(
+                (key, before[key], resources[key])
+                for key in resources.keys() & before.keys()
+                if before[key] != resources[key]
+            )
+            if new or removed or changed:
+                delta.setdefault(scope, {})[name] = {'new': new, 'removed': removed, 'changed': changed}
+    return delta
+
+
+def render_delta(delta, taken_at):
+    if not delta:
+        return [f"✅ No changes since the last run ({taken_at})."]
+
+    message_lines = [f"🔄 Changes since the last run ({taken_at}):"]
+    for scope in sorted(delta):
+        message_lines.append(f"\n🌍 {scope}")
+        for name, change in delta[scope].items():
+            if change['new']:
+                message_lines.append(f"🆕 New {name.upper()}:\n - " + "\n - ".join(change['new']))
+            if change['removed']:
+                message_lines.append(f"🗑️ Gone {name.upper()}:\n - " + "\n - ".join(change['removed']))
+            if change['changed']:
+                message_lines.append(
+                    f"🔁 Changed {name.upper()}:\n - "
+                    + "\n - ".join(f"{key}: {old} → {new}" for key, old, new in change['changed'])
+                )
+    return message_lines
+
+
+def _split_s3_path(path):
+    bucket, _, key = path[len('s3://'):].partition('/')
+    return bucket, key
+
+
+def load_snapshot(path, session):
+    # Returns None when there is no earlier snapshot to compare against, or
+    # it cannot be read (e.g. a truncated file from a run killed at timeout)
+    try:
+        if path.startswith('s3://'):
+            bucket, key = _split_s3_path(path)
+            body = get_client('s3', session=session).get_object(Bucket=bucket, Key=key)['Body'].read()
+        else:
+            with open(path, 'rb') as f:
+                body = f.read()
+    except (ClientError, OSError):
+        return None
+    try:
+        return json.loads(gzip.decompress(body))
+    except (EOFError, OSError, ValueError) as e:
+        print(f"⚠️ Ignoring unreadable inventory snapshot {path}: {e}")
+        return None
+
+
+def save_snapshot(path, inventory, session):
+    snapshot = {
+        'taken_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC'),
+        'inventory': inventory,
+    }
+    body = gzip.compress(json.dumps(snapshot, separators=(',', ':'), sort_keys=True).encode())
+    try:
+        if path.startswith('s3://'):
+            bucket, key = _split_s3_path(path)
+            get_client('s3', session=session).put_object(Bucket=bucket, Key=key, Body=body)
+        else:
+            # Written aside and swapped in, so a killed run leaves the old snapshot
+            with open(f"{path}.tmp", 'wb') as f:
+                f.write(body)
+            os.replace(f"{path}.tmp", path)
+    except (ClientError, OSError) as e:
+        print(f"⚠️ Could not save inventory snapshot to {path}: {e}")
@@ -0,0 +1,5 @@
+# The checker's modules import each other by name, as they do in the Lambda package
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
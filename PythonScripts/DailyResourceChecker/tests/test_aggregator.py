@@ -0,0 +1,36 @@
+from aggregator import Inventory, InventoryRequests
+from queries import ALL_VOLUMES, RequestCache
+
+VOLUMES = {('111111111111', 'us-east-1'): [{'VolumeId': 'vol-1', 'VolumeType': 'gp3', 'Size': 8, 'State': 'in-use'}]}
+
+
+def test_synced_scope_is_answered_from_config():
+    inventory = Inventory({ALL_VOLUMES.name: VOLUMES}, {('111111111111', 'us-east-1'): 'SUCCEEDED'})
+    requests = inventory.requests('111111111111', 'us-east-1')
+    assert isinstance(requests, InventoryRequests)
+    assert [item['VolumeId'] for item in requests.run(None, ALL_VOLUMES)] == ['vol-1']
+
+
+def test_synced_scope_without_resources_is_empty():
+    status = {('111111111111', 'us-east-1'): 'SUCCEEDED', ('111111111111', 'eu-west-1'): 'SUCCEEDED'}
+    inventory = Inventory({ALL_VOLUMES.name: VOLUMES}, status)
+    assert list(inventory.requests('111111111111', 'eu-west-1').run(None, ALL_VOLUMES)) == []
+
+
+def test_uncovered_or_unsynced_scope_falls_back_to_describe():
+    status = {('111111111111', 'us-east-1'): 'SUCCEEDED', ('111111111111', 'eu-west-1'): 'OUTDATED'}
+    inventory = Inventory({ALL_VOLUMES.name: VOLUMES}, status)
+    assert isinstance(inventory.requests('111111111111', 'eu-west-1'), RequestCache)
+    assert isinstance(inventory.requests('222222222222', 'us-east-1'), RequestCache)
+
+
+def test_organization_source_covers_every_account_in_its_region():
+    inventory = Inventory({ALL_VOLUMES.name: VOLUMES}, {('*', 'us-east-1'): 'SUCCEEDED'})
+    assert inventory.covers('222222222222', 'us-east-1')
+    assert not inventory.covers('222222222222', 'eu-west-1')
+
+
+def test_without_source_status_only_returned_scopes_are_trusted():
+    inventory = Inventory({ALL_VOLUMES.name: VOLUMES}, None)
+    assert inventory.covers('111111111111', 'us-east-1')
+    assert not inventory.covers('111111111111', 'eu-west-1')
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+import cache
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'INVENTORY_CACHE_PATH', str(tmp_path))
+    monkeypatch.setattr(cache, '_entries', {})
+    return tmp_path
+
+
+@pytest.mark.skipif('INVENTORY_CACHE_TTL' in os.environ, reason='cache configured in the environment')
+def test_off_by_default(cache_dir):
+    assert cache.INVENTORY_CACHE_TTL == 0
+    cache.store_results('111111111111', 'us-east-1', {'ec2': ['i-1']})
+    assert os.listdir(cache_dir) == []
+    assert cache.cached_results('111111111111', 'us-east-1', ['ec2']) == {}
+
+
+def test_results_are_served_within_the_ttl(cache_dir, monkeypatch):
+    monkeypatch.setattr(cache, 'INVENTORY_CACHE_TTL', 300)
+    cache.store_results('111111111111', 'us-east-1', {'ec2': ['i-1']})
+    monkeypatch.setattr(cache, '_entries', {})
+    assert cache.cached_results('111111111111', 'us-east-1', ['ec2', 'rds']) == {'ec2': ['i-1']}
+
+
+def test_clear_only_removes_cache_files(cache_dir, monkeypatch):
+    monkeypatch.setattr(cache, 'INVENTORY_CACHE_TTL', 300)
+    cache.store_results('111111111111', 'us-east-1', {'ec2': ['i-1']})
+    (cache_dir / 'notes.txt').write_text('keep me')
+    (cache_dir / 'inventory-subdir.json').mkdir()
+    cache.clear_cache()
+    assert sorted(os.listdir(cache_dir)) == ['inventory-subdir.json', 'notes.txt']
+    assert cache.cached_results('111111111111', 'us-east-1', ['ec2']) == {}
@@ -0,0 +1,32 @@
+from cost import add_resource, estimate, new_columns
+
+PRICES = {
+    'hours_per_month': 730,
+    'default_region': 'us-east-1',
+    'regions': {
+        'us-east-1': {'ec2': {'t3.micro': 0.01}, 'ebs': {'gp3': 0.08}},
+        'us-west-2': {'ec2': {'t3.micro': 0.02}, 'ebs': {'gp3': 0.08}},
+    },
+}
+
+
+def columns():
+    columns = new_columns()
+    add_resource(columns, 'EC2', 'i-1', 't3.micro', 100)
+    add_resource(columns, 'EBS', 'vol-1', 'gp3', 50)
+    add_resource(columns, 'EC2', 'i-2', 'x9.huge', 100)
+    return columns
+
+
+def test_region_in_table_uses_its_own_prices():
+    costs, unpriced, priced_as = estimate(columns(), 'us-west-2', PRICES)
+    assert list(costs) == [2.0, 4.0, 0.0]
+    assert unpriced == 1
+    assert priced_as == 'us-west-2'
+
+
+def test_region_missing_from_table_reports_the_fallback():
+    costs, unpriced, priced_as = estimate(columns(), 'eu-west-1', PRICES)
+    assert list(costs) == [1.0, 4.0, 0.0]
+    assert unpriced == 1
+    assert priced_as == 'us-east-1'
@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+from engine import Engine, run_jobs
+
+
+def test_results_and_errors_are_keyed_by_job():
+    async def main():
+        engine = Engine(max_threads=4)
+        jobs = {'ok': engine.submit(lambda: 42), 'fails': engine.submit(lambda: 1 / 0)}
+        try:
+            return await run_jobs(engine, jobs)
+        finally:
+            engine.shutdown()
+    results, errors = asyncio.run(main())
+    assert results == {'ok': 42}
+    assert isinstance(errors['fails'], ZeroDivisionError)
+
+
+def test_timed_out_job_keeps_its_slots_until_its_thread_finishes():
+    async def main():
+        engine = Engine(max_threads=1, service_limit=1)
+        try:
+            await engine.submit(time.sleep, 0.3, services=['ec2'], timeout=0.05)
+        except asyncio.TimeoutError:
+            pass
+        assert engine.in_flight == 1
+        started = time.perf_counter()
+        await engine.submit(lambda: None, services=['ec2'])
+        waited = time.perf_counter() - started
+        engine.shutdown()
+        return waited, engine.stats()
+    waited, stats = asyncio.run(main())
+    assert waited > 0.15
+    assert stats['timed_out'] == 1
+    assert stats['peak_in_flight'] == 1
@@ -0,0 +1,16 @@
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+
+from fakeaws import FakeAWS
+
+
+def test_unsupported_operation_fails_like_aws():
+    fake = FakeAWS()
+    session = fake.install(boto3.session.Session(aws_access_key_id='test', aws_secret_access_key='test',
+                                                 region_name='us-west-2'))
+    with pytest.raises(ClientError) as raised:
+        session.client('ec2').describe_snapshots(OwnerIds=['self'])
+    assert raised.value.response['Error']['Code'] == 'UnsupportedOperation'
+    assert 'DescribeVolumes' in raised.value.response['Error']['Message']
+    assert fake.calls['DescribeSnapshots'] == 1
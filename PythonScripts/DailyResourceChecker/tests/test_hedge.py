@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+from botocore.session import Session
+
+import hedge
+import metrics
+from hedge import HedgeCancelled, hedge_stats, hedged, set_hedging
+
+API = ('ec2', 'DescribeVolumes')
+
+
+@pytest.fixture
+def ec2(monkeypatch):
+    # Hedge after 20 ms, with room for two hedges
+    monkeypatch.setattr(hedge, 'HEDGE_INITIAL_DELAY_MS', 20)
+    monkeypatch.setattr(hedge, 'HEDGE_BUDGET_BURST', 2)
+    monkeypatch.setattr(hedge, '_latencies', type(hedge._latencies)(hedge._latencies.default_factory))
+    metrics.reset_metrics()
+    set_hedging(True)
+    yield Session().create_client('ec2', region_name='us-east-1', aws_access_key_id='test', aws_secret_access_key='test')
+    set_hedging(False)
+    metrics.reset_metrics()
+
+
+def answers(*delays):
+    # A describe_volumes stand-in: the n-th attempt takes delays[n] seconds,
+    # then stops at the same point botocore's before-parse hook would
+    attempts = iter(range(len(delays)))
+    lock = threading.Lock()
+    stopped = []
+
+    def method(**kwargs):
+        with lock:
+            n = next(attempts)
+        time.sleep(delays[n])
+        try:
+            hedge._stop_if_cancelled()
+        except HedgeCancelled:
+            stopped.append(n)
+            raise
+        return {'Volumes': [], 'attempt': n}
+    return method, stopped
+
+
+def test_fast_call_is_not_hedged(ec2):
+    method, _ = answers(0.0)
+    assert hedged(ec2, 'describe_volumes', method)()['attempt'] == 0
+    assert hedge_stats()[API] == {'calls': 1}
+
+
+def test_hedge_wins_and_the_primary_is_cancelled(ec2):
+    method, stopped = answers(0.3, 0.0)
+    assert hedged(ec2, 'describe_volumes', method)()['attempt'] == 1
+    assert hedge_stats()[API]['hedged'] == 1
+    assert hedge_stats()[API]['hedge_wins'] == 1
+    time.sleep(0.4)
+    assert stopped == [0]
+
+
+def test_primary_wins_and_the_hedge_is_cancelled(ec2):
+    method, stopped = answers(0.05, 0.3)
+    assert hedged(ec2, 'describe_volumes', method)()['attempt'] == 0
+    assert hedge_stats()[API]['hedged'] == 1
+    assert 'hedge_wins' not in hedge_stats()[API]
+    time.sleep(0.4)
+    assert stopped == [1]
+
+
+def test_failed_first_answer_defers_to_the_other(ec2):
+    calls = []
+
+    def method(**kwargs):
+        calls.append(None)
+        if len(calls) == 2:
+            raise RuntimeError('hedge failed')
+        time.sleep(0.1)
+        return {'Volumes': []}
+    assert hedged(ec2, 'describe_volumes', method)() == {'Volumes': []}
+
+
+def test_budget_runs_out(ec2):
+    method, _ = answers(0.05, 0.3, 0.05, 0.3, 0.05)
+    call = hedged(ec2, 'describe_volumes', method)
+    for _ in range(3):
+        call()
+    assert hedge_stats()[API]['hedged'] == 2
+    assert hedge_stats()[API]['budget_skips'] == 1
+
+
+def test_throttled_api_is_not_hedged_until_the_next_invocation(ec2):
+    operation = ec2.meta.service_model.operation_model('DescribeVolumes')
+    metrics._needs_retry(response=(None, {'Error': {'Code': 'RequestLimitExceeded'}}), operation=operation)
+    method, _ = answers(0.05)
+    hedged(ec2, 'describe_volumes', method)()
+    assert hedge_stats()[API]['throttled_skips'] == 1
+    assert 'hedged' not in hedge_stats()[API]
+
+    # A new invocation starts with a clean throttle count
+    metrics.reset_metrics()
+    set_hedging(True)
+    method, _ = answers(0.05, 0.3)
+    hedged(ec2, 'describe_volumes', method)()
+    assert hedge_stats()[API]['hedged'] == 1
@@ -0,0 +1,63 @@
+import pytest
+
+from history import append_run, connect, oldest, resource_age
+
+SCOPE = 'us-east-1'
+
+
+@pytest.fixture
+def db():
+    db = connect(':memory:')
+    yield db
+    db.close()
+
+
+def run(db, day, ebs=None, ec2=None):
+    # One daily run; a check left as None did not finish in that run
+    checks = {name: resources for name, resources in (('ebs', ebs), ('ec2', ec2)) if resources is not None}
+    return append_run(db, {SCOPE: checks}, f"2025-08-{day:02d} 06:00:00")
+
+
+def test_unfinished_check_does_not_reset_the_age(db):
+    run(db, 1, ebs={'vol-1': 'unattached'})
+    run(db, 2, ebs={'vol-1': 'unattached'})
+    run(db, 3, ec2={'i-1': 't3.micro'})
+    run(db, 4, ebs={'vol-1': 'unattached'})
+    assert resource_age(db, 'vol-1') == [(SCOPE, 'ebs', 'unattached', '2025-08-01 06:00:00', '2025-08-04 06:00:00', 3.0)]
+
+
+def test_age_restarts_after_the_resource_was_gone(db):
+    run(db, 1, ebs={'vol-1': 'unattached'})
+    run(db, 2, ebs={})
+    run(db, 3, ebs={'vol-1': 'unattached'})
+    run(db, 4, ec2={})
+    run(db, 5, ebs={'vol-1': 'unattached'})
+    assert resource_age(db, 'vol-1') == [(SCOPE, 'ebs', 'unattached', '2025-08-03 06:00:00', '2025-08-05 06:00:00', 2.0)]
+
+
+def test_age_restarts_when_the_state_changes(db):
+    run(db, 1, ebs={'vol-1': 'in-use'})
+    run(db, 2, ebs={'vol-1': 'unattached'})
+    run(db, 3, ebs={'vol-1': 'unattached'})
+    assert resource_age(db, 'vol-1') == [(SCOPE, 'ebs', 'unattached', '2025-08-02 06:00:00', '2025-08-03 06:00:00', 1.0)]
+
+
+def test_oldest_lists_the_latest_run_longest_first(db):
+    run(db, 1, ebs={'vol-1': 'unattached', 'vol-2': 'in-use'})
+    run(db, 2, ebs={'vol-1': 'unattached', 'vol-2': 'unattached', 'vol-3': 'unattached'})
+    run(db, 3, ebs={'vol-1': 'unattached', 'vol-2': 'unattached'})
+    assert oldest(db, 'ebs', 'unattached') == [
+        (SCOPE, 'vol-1', '2025-08-01 06:00:00', 2.0),
+        (SCOPE, 'vol-2', '2025-08-02 06:00:00', 1.0),
+    ]
+
+
+def test_large_run_maps_every_resource_to_its_key(db, monkeypatch):
+    import history
+
+    monkeypatch.setattr(history, 'KEY_LOOKUP_CHUNK', 3)
+    run(db, 1, ebs={f"vol-{i}": 'in-use' for i in range(10)})
+    run(db, 2, ebs={f"vol-{i}": 'unattached' for i in range(5, 12)})
+    assert db.execute("SELECT COUNT(*) FROM resources").fetchone()[0] == 12
+    assert db.execute("SELECT COUNT(*) FROM observations WHERE run_id = 2").fetchone()[0] == 7
+    assert [row[:3] for row in resource_age(db, 'vol-11')] == [(SCOPE, 'ebs', 'unattached')]
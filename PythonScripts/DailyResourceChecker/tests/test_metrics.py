@@ -0,0 +1,49 @@
+import pytest
+from botocore.exceptions import ClientError
+from botocore.session import Session
+from botocore.stub import Stubber
+
+import metrics
+from metrics import _counts, instrument, reset_metrics, timed_check
+
+
+@pytest.fixture
+def ec2():
+    reset_metrics()
+    client = Session().create_client('ec2', region_name='us-east-1', aws_access_key_id='test', aws_secret_access_key='test')
+    instrument(client)
+    with Stubber(client) as stubber:
+        yield client, stubber
+    reset_metrics()
+
+
+def test_successful_call_is_not_an_error(ec2):
+    client, stubber = ec2
+    stubber.add_response('describe_addresses', {'Addresses': []})
+    with timed_check('eip'):
+        client.describe_addresses()
+    assert _counts['eip']['ApiCalls'] == 1
+    assert _counts['eip']['Errors'] == 0
+
+
+def test_error_response_is_counted(ec2):
+    client, stubber = ec2
+    stubber.add_client_error('describe_addresses', 'UnauthorizedOperation', http_status_code=403)
+    with timed_check('eip'), pytest.raises(ClientError):
+        client.describe_addresses()
+    assert _counts['eip']['ApiCalls'] == 1
+    assert _counts['eip']['Errors'] == 1
+
+
+def test_abandoned_attempt_is_not_an_error():
+    reset_metrics()
+
+    class Abandoned(Exception):
+        abandoned = True
+
+    with timed_check('ec2'):
+        metrics._after_call_error(Abandoned())
+        metrics._after_call_error(ConnectionError())
+    assert _counts['ec2']['ApiCalls'] == 2
+    assert _counts['ec2']['Errors'] == 1
+    reset_metrics()
@@ -0,0 +1,85 @@
+import pytest
+from botocore.session import Session
+from botocore.stub import Stubber
+
+import queries
+from hedge import set_hedging
+from queries import (
+    ALL_ADDRESSES, ALL_VOLUMES, AVAILABLE_DB_INSTANCES, RUNNING_INSTANCES, RequestCache, query_stats, reset_query_stats,
+    run_query,
+)
+
+
+@pytest.fixture
+def ec2():
+    reset_query_stats()
+    client = Session().create_client('ec2', region_name='us-east-1', aws_access_key_id='test', aws_secret_access_key='test')
+    with Stubber(client) as stubber:
+        yield client, stubber
+    stubber.assert_no_pending_responses()
+
+
+def volume(volume_id):
+    return {'VolumeId': volume_id, 'Size': 8, 'State': 'in-use', 'VolumeType': 'gp3'}
+
+
+def test_paginator_reads_every_page(ec2):
+    client, stubber = ec2
+    stubber.add_response('describe_volumes', {'Volumes': [volume('vol-1')], 'NextToken': 'a'}, {'MaxResults': 500})
+    stubber.add_response('describe_volumes', {'Volumes': [volume('vol-2')]}, {'MaxResults': 500, 'NextToken': 'a'})
+    assert [item['VolumeId'] for item in run_query(client, ALL_VOLUMES)] == ['vol-1', 'vol-2']
+    assert query_stats()['all_volumes']['calls'] == 2
+
+
+def test_shared_query_keeps_only_the_fields_collectors_read(ec2):
+    client, stubber = ec2
+    instance = {'InstanceId': 'i-1', 'InstanceType': 't3.micro', 'NetworkInterfaces': [{}], 'Tags': [{}]}
+    stubber.add_response('describe_instances', {'Reservations': [{'ReservationId': 'r-1', 'Instances': [instance]}]})
+    requests = RequestCache([RUNNING_INSTANCES.name])
+    expected = [{'Instances': [{'InstanceId': 'i-1', 'InstanceType': 't3.micro'}]}]
+    assert list(requests.run(client, RUNNING_INSTANCES)) == expected
+    assert list(requests.run(client, RUNNING_INSTANCES)) == expected
+    assert query_stats()['running_instances']['shared_hits'] == 1
+
+
+@pytest.fixture
+def hedged_calls(monkeypatch):
+    # Stands in for hedge.hedged: answers from `pages` and records every request
+    requests = []
+
+    def hedged(client, operation_name):
+        def call(**kwargs):
+            requests.append(dict(kwargs))
+            return pages.pop(0)
+        return call
+    pages = []
+    monkeypatch.setattr(queries, 'hedged', hedged)
+    set_hedging(True)
+    yield pages, requests
+    set_hedging(False)
+
+
+def test_hedged_query_follows_the_token_to_the_end(hedged_calls):
+    pages, requests = hedged_calls
+    pages.extend([
+        {'DBInstances': [{'DBInstanceIdentifier': 'db-1', 'DBInstanceStatus': 'available'}], 'Marker': 'a'},
+        {'DBInstances': [{'DBInstanceIdentifier': 'db-2', 'DBInstanceStatus': 'stopped'}], 'Marker': 'b'},
+        {'DBInstances': [{'DBInstanceIdentifier': 'db-3', 'DBInstanceStatus': 'available'}]},
+    ])
+    items = run_query(None, AVAILABLE_DB_INSTANCES)
+    assert [item['DBInstanceIdentifier'] for item in items] == ['db-1', 'db-3']
+    assert requests == [{'MaxRecords': 100}, {'MaxRecords': 100, 'Marker': 'a'}, {'MaxRecords': 100, 'Marker': 'b'}]
+
+
+def test_hedged_query_stops_on_a_repeated_token(hedged_calls):
+    pages, requests = hedged_calls
+    pages.extend([{'Volumes': [volume('vol-1')], 'NextToken': 'a'}, {'Volumes': [], 'NextToken': 'a'}])
+    assert [item['VolumeId'] for item in run_query(None, ALL_VOLUMES)] == ['vol-1']
+    assert len(requests) == 2
+
+
+def test_hedged_query_without_pages_is_one_call(hedged_calls):
+    pages, requests = hedged_calls
+    pages.append({'Addresses': [{'PublicIp': '198.51.100.1'}]})
+    assert len(list(run_query(None, ALL_ADDRESSES))) == 1
+    assert requests == [{}]
@@ -0,0 +1,84 @@
+import gzip
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import pytest
+
+import report
+from fakeaws import FakeAWS
+from report import _clip, publish_report, url_expiry
+
+TOPIC = 'arn:aws:sns:us-west-2:123456789012:daily'
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    fake = FakeAWS()
+    fake.published = []
+    fake.uploaded = []
+    publish, put = fake._Publish, fake._PutObject
+
+    def put_object(params):
+        fake.uploaded.append((params['Bucket'], params['Key'], gzip.decompress(params['Body'].read()).decode()))
+        params['Body'].seek(0)
+        return put(params)
+    fake._Publish = lambda params: fake.published.append(params['Message']) or publish(params)
+    fake._PutObject = put_object
+    fake.session = fake.install(boto3.session.Session(aws_access_key_id='test', aws_secret_access_key='test',
+                                                      region_name='us-west-2'))
+    monkeypatch.setattr(report, 'INLINE_LIMIT', 100)
+    monkeypatch.setattr(report, 'HEADLINE_LIMIT', 40)
+    return fake
+
+
+LINES = [f"line {i:02d} " + "x" * 10 for i in range(20)]
+
+
+def test_report_within_the_limit_is_sent_as_is(fake):
+    message = publish_report(fake.session, LINES[:3], TOPIC, 'subject', bucket='reports')
+    assert message == "\n".join(LINES[:3])
+    assert fake.published == [message]
+    assert fake.uploaded == []
+
+
+def test_oversized_report_goes_to_s3_with_a_headline(fake):
+    message = publish_report(fake.session, iter(LINES), TOPIC, 'subject', bucket='reports')
+    [(bucket, key, body)] = fake.uploaded
+    assert (bucket, body) == ('reports', "\n".join(LINES) + "\n")
+    assert key.startswith(report.REPORT_PREFIX)
+    headline, notice = message.split("\n\n📄 ")
+    assert len(headline.encode()) <= 40 + len(" …".encode())
+    assert headline.startswith(LINES[0])
+    assert notice.startswith(f"Report too large for email (20 lines). Full report: s3://reports/{key}")
+    assert notice.splitlines()[-1].startswith(f"https://reports.s3.amazonaws.com/{key}?")
+    assert fake.published == [message]
+
+
+def test_oversized_report_without_a_bucket_is_truncated(fake, monkeypatch):
+    # The inline part leaves 200 bytes for the note
+    monkeypatch.setattr(report, 'INLINE_LIMIT', 300)
+    message = publish_report(fake.session, iter(LINES), TOPIC, 'subject', bucket='')
+    assert fake.uploaded == []
+    assert message.startswith(LINES[0])
+    assert message.endswith("✂️ Report truncated (20 lines). Set REPORT_BUCKET to receive the full report in S3.")
+    assert len(message.split("\n\n✂️")[0].encode()) <= 100 + len(" …".encode())
+
+
+def test_clip_cuts_the_last_line_short():
+    assert _clip(["abc", "defghij"], 6) == ["abc", "de …"]
+    assert _clip(["abc"], 10) == ["abc"]
+
+
+class Session:
+    def __init__(self, expiry):
+        self.credentials = type('Credentials', (), {'_expiry_time': expiry})()
+
+    def get_credentials(self):
+        return self.credentials
+
+
+def test_link_expiry_is_capped_at_the_credentials_lifetime():
+    expiry = datetime.now(timezone.utc) + timedelta(hours=1)
+    assert 3500 < url_expiry(Session(expiry), expiry=12 * 3600) <= 3600
+    assert url_expiry(Session(expiry), expiry=600) == 600
+    assert url_expiry(Session(None), expiry=600) == 600
@@ -0,0 +1,78 @@
+import json
+import os
+
+import pytest
+
+from rules import EXAMPLE_RULES_PATH, RuleSet, RulesError, load_rules, sort_findings
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_shipped_rules_add_no_findings():
+    assert load_rules(os.path.join(HERE, 'rules.json')).count == 0
+
+
+def test_shipped_free_tier_rule_reports_either_way():
+    rule_set = load_rules(os.path.join(HERE, 'rules.json'), section='ebs')
+    assert rule_set.evaluate('ebs', [{'id': 'vol-1', 'size': 20}, {'id': 'vol-2', 'size': 20}]) == [
+        ('critical', 'ebs-free-tier', 'ebs', 'EBS usage exceeds the 30 GiB Free Tier limit. Charges will apply.'),
+    ]
+    assert rule_set.evaluate('ebs', [{'id': 'vol-1', 'size': 30}]) == [
+        ('ok', 'ebs-free-tier', 'ebs', 'EBS usage is within the 30 GiB Free Tier limit.'),
+    ]
+
+
+def test_example_rules_leave_free_tier_instances_alone():
+    rule_set = load_rules(EXAMPLE_RULES_PATH)
+    records = [{'id': 'i-1', 'type': 't2.micro'}, {'id': 'i-2', 'type': 't2.large'}, {'id': 'i-3', 'type': 't3.micro'}]
+    assert [finding[2] for finding in rule_set.evaluate('ec2', records)] == ['i-2']
+
+
+def test_aggregate_rule_reports_against_the_resource_type():
+    rule_set = RuleSet([{
+        'name': 'ebs-total', 'resource': 'ebs', 'aggregate': 'sum', 'field': 'size',
+        'when': {'op': '>', 'value': 30}, 'severity': 'critical', 'message': '{value} GiB',
+    }])
+    assert rule_set.evaluate('ebs', [{'id': 'vol-1', 'size': 20}, {'id': 'vol-2', 'size': 20}]) == [
+        ('critical', 'ebs-total', 'ebs', '40 GiB'),
+    ]
+    assert rule_set.evaluate('ebs', [{'id': 'vol-1', 'size': 20}]) == []
+
+
+def test_findings_aggregate_otherwise_sorts_after_findings():
+    rule_set = RuleSet([
+        {'name': 'many-instances', 'resource': 'ec2', 'aggregate': 'count',
+         'when': {'op': '>', 'value': 100}, 'severity': 'warning', 'message': '{value} instances',
+         'otherwise': '{value} instances'},
+        {'name': 'large', 'resource': 'ec2', 'when': {'field': 'type', 'op': '==', 'value': 'm5.large'},
+         'severity': 'info', 'message': '{id} is large'},
+    ])
+    findings = rule_set.evaluate('ec2', [{'id': 'i-1', 'type': 'm5.large'}])
+    assert sort_findings(findings) == [
+        ('info', 'large', 'i-1', 'i-1 is large'),
+        ('ok', 'many-instances', 'ec2', '1 instances'),
+    ]
+
+
+def test_rules_with_unknown_severity_or_section_fail_to_load(tmp_path):
+    base = {'name': 'r', 'resource': 'ebs', 'when': {'field': 'type', 'op': '==', 'value': 'gp2'},
+            'severity': 'warning', 'message': '{id}'}
+    for bad in ({'severity': 'ok'}, {'section': 'ec2'}, {'otherwise': 'fine'}):
+        path = tmp_path / 'rules.json'
+        path.write_text(json.dumps({'rules': [dict(base, **bad)]}))
+        with pytest.raises(ValueError):
+            load_rules(str(path))
+
+
+def test_file_without_an_ebs_section_keeps_the_free_tier_limit():
+    rule_set = load_rules(EXAMPLE_RULES_PATH, section='ebs')
+    assert [finding[1] for finding in rule_set.evaluate('ebs', [{'id': 'vol-1', 'size': 40}])] == ['ebs-free-tier']
+
+
+def test_unreadable_rule_file_raises_rules_error(tmp_path):
+    with pytest.raises(RulesError, match='missing.json'):
+        load_rules(str(tmp_path / 'missing.json'))
+    path = tmp_path / 'rules.json'
+    path.write_text('{"rules": [')
+    with pytest.raises(RulesError):
+        load_rules(str(path))
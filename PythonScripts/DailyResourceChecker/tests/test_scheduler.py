@@ -0,0 +1,43 @@
+from scheduler import CHECK_PRIORITY, NO_DEADLINE, REPORT_RESERVE_SECONDS, Deadline
+
+
+class FakeContext:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+def test_no_context_has_no_deadline():
+    assert NO_DEADLINE.remaining() is None
+    assert NO_DEADLINE.timeout(5) == 5
+    assert all(NO_DEADLINE.should_start(name) for name in CHECK_PRIORITY)
+
+
+def test_long_timeout_keeps_the_full_reserve():
+    deadline = Deadline(FakeContext(900 * 1000))
+    assert 900 - REPORT_RESERVE_SECONDS - 1 < deadline.remaining() <= 900 - REPORT_RESERVE_SECONDS
+    assert all(deadline.should_start(name) for name in CHECK_PRIORITY)
+
+
+def test_default_lambda_timeout_still_runs_every_check():
+    # Lambda's default timeout is 3 s, far below the 15 s reserve
+    deadline = Deadline(FakeContext(3000))
+    assert not deadline.expired()
+    assert 2.0 < deadline.remaining() <= 2.25
+    assert all(deadline.should_start(name) for name in CHECK_PRIORITY + ['findings'])
+
+
+def test_timeout_equal_to_reserve_is_not_expired():
+    deadline = Deadline(FakeContext(REPORT_RESERVE_SECONDS * 1000))
+    assert deadline.remaining() > 0
+    assert deadline.timeout(60) < REPORT_RESERVE_SECONDS
+
+
+def test_low_priority_checks_are_skipped_when_time_runs_short():
+    deadline = Deadline(FakeContext(900 * 1000))
+    deadline.at -= 900 - REPORT_RESERVE_SECONDS - 20
+    assert deadline.should_start('ec2')
+    assert deadline.should_start('rds')
+    assert not deadline.should_start('ecs')
@@ -0,0 +1,156 @@
+import os
+
+import pytest
+
+script = pytest.importorskip('script')
+
+from queries import shared_queries
+
+
+@pytest.mark.skipif(script.IDLE_DETECTION or script.COST_ESTIMATION, reason='optional checks enabled')
+def test_default_checks_only_share_running_instances():
+    assert [name for name, _, _ in script.CHECKS] == ['ec2', 'rds', 'ecs', 'ebs', 'eip']
+    queries = {name: script.CHECK_QUERIES[name] for name, _, _ in script.CHECKS}
+    assert shared_queries(queries) == {'running_instances'}
+
+
+@pytest.mark.skipif(script.IDLE_DETECTION, reason='idle detection enabled')
+def test_cloudwatch_client_only_with_idle_detection():
+    assert script.SCAN_SERVICES == ('ec2', 'ecs', 'rds')
+
+
+@pytest.fixture
+def fake(tmp_path, monkeypatch):
+    # Runs the handler against FakeAWS and keeps what it publishes
+    import boto3
+
+    import clients
+    from fakeaws import FakeAWS
+
+    fake = FakeAWS(regions=('us-west-2', 'eu-west-1'))
+    fake.published = []
+    publish = fake._Publish
+    fake._Publish = lambda params: fake.published.append(params['Message']) or publish(params)
+    session = boto3.session.Session(aws_access_key_id='test', aws_secret_access_key='test', region_name='us-west-2')
+    clients.set_session(fake.install(session))
+    monkeypatch.setattr(script, 'SNAPSHOT_PATH', str(tmp_path / 'snapshot.json.gz'))
+    yield fake
+    clients.set_session(None)
+
+
+def run(event):
+    return script.lambda_handler(dict(event, report_mode='full'), None)['body']
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_failed_api_costs_one_section(fake, engine):
+    fake._DescribeVolumes = None
+    report = run({'engine': engine})
+    assert 'EBS in us-west-2 (failed)' in report
+    assert '❌ The EBS check failed: An error occurred (UnsupportedOperation)' in report
+    assert '🔶 Running EC2 Instances' in report
+    assert fake.published
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_failed_region_is_reported_and_the_rest_published(fake, engine, monkeypatch):
+    create = script.create_clients
+
+    def create_clients(session, region_name=None, **kwargs):
+        if region_name == 'eu-west-1':
+            raise script.ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Denied by SCP'}}, 'DescribeInstances')
+        return create(session, region_name=region_name, **kwargs)
+    monkeypatch.setattr(script, 'create_clients', create_clients)
+    report = run({'engine': engine, 'all_regions': True, 'regions': ['eu-west-1', 'us-west-2']})
+    assert ' - region eu-west-1\n' in report
+    assert '❌ Could not scan region eu-west-1: An error occurred (AccessDenied)' in report
+    assert '🔶 Running EC2 Instances' in report
+
+
+def test_assumed_role_credentials_use_a_shared_sts_client(monkeypatch):
+    from datetime import datetime, timedelta, timezone
+
+    class STS:
+        def assume_role(self, **kwargs):
+            expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+            return {'Credentials': {'AccessKeyId': 'AKID', 'SecretAccessKey': 'secret', 'SessionToken': 'token',
+                                    'Expiration': expiration}}
+    created = []
+    monkeypatch.setattr(script, 'get_client', lambda service, session=None: created.append(service) or STS())
+    monkeypatch.setattr(script, '_account_sessions', {})
+    monkeypatch.setattr(script, '_credential_cache', {})
+    import boto3
+    base = boto3.session.Session(aws_access_key_id='test', aws_secret_access_key='test', region_name='us-west-2')
+    session = script.assume_role_session(base, '111111111111')
+    assert session.get_credentials().get_frozen_credentials().access_key == 'AKID'
+    assert created == ['sts']
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_unreachable_account_is_reported_and_the_rest_published(fake, engine, monkeypatch):
+    import boto3
+    from botocore.exceptions import EndpointConnectionError
+
+    sessions = {}
+
+    def assume_role_session(base_session, account_id):
+        return sessions.setdefault(account_id, fake.install(boto3.session.Session(
+            aws_access_key_id='test', aws_secret_access_key='test', region_name='us-west-2')))
+    discover = script.discover_regions
+
+    def discover_regions(session):
+        if session is sessions.get('222222222222'):
+            raise EndpointConnectionError(endpoint_url='https://ec2.us-west-2.amazonaws.com/')
+        return discover(session)
+    monkeypatch.setattr(script, 'assume_role_session', assume_role_session)
+    monkeypatch.setattr(script, 'discover_regions', discover_regions)
+    report = run({'engine': engine, 'all_accounts': True, 'all_regions': True,
+                  'accounts': ['111111111111', '222222222222']})
+    assert '❌ Could not scan account 222222222222: Could not connect to the endpoint URL' in report
+    assert '🏢 Account: 111111111111' in report
+    assert '🔶 Running EC2 Instances' in report
+    assert fake.published
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_role_that_cannot_be_assumed_fails_the_account_once(fake, engine, monkeypatch):
+    import boto3
+    from botocore.credentials import DeferredRefreshableCredentials
+
+    attempts = []
+
+    def assume_role(*args, **kwargs):
+        attempts.append(1)
+        raise script.ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Not authorized'}}, 'AssumeRole')
+
+    def assume_role_session(base_session, account_id):
+        session = fake.install(boto3.session.Session(region_name='us-west-2'))
+        session._session._credentials = DeferredRefreshableCredentials(assume_role, 'assume-role')
+        return session
+    monkeypatch.setattr(script, 'assume_role_session', assume_role_session)
+    report = run({'engine': engine, 'all_accounts': True, 'accounts': ['222222222222']})
+    assert '❌ Could not scan account 222222222222: An error occurred (AccessDenied)' in report
+    assert 'The EC2 check failed' not in report
+    assert len(attempts) == 1
+
+
+def test_bad_rules_file_fails_the_findings_check_only(tmp_path):
+    # RULES_PATH is read when the modules load, so this runs in a fresh interpreter
+    import subprocess
+    import sys
+
+    code = (
+        "import boto3, clients, script\n"
+        "from fakeaws import FakeAWS\n"
+        "session = boto3.session.Session(aws_access_key_id='test', aws_secret_access_key='test', "
+        "region_name='us-west-2')\n"
+        "clients.set_session(FakeAWS().install(session))\n"
+        "print(script.lambda_handler({'report_mode': 'full'}, None)['body'])\n"
+    )
+    env = dict(os.environ, RULES_PATH=str(tmp_path / 'missing.json'),
+               SNAPSHOT_PATH=str(tmp_path / 'snapshot.json.gz'))
+    report = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(script.__file__), env=env,
+                            capture_output=True, text=True, check=True).stdout
+    assert '❌ The FINDINGS check failed: Could not load rules from' in report
+    assert '❌ EBS usage exceeds the 30 GiB Free Tier limit. Charges will apply.' in report
+    assert '🔶 Running EC2 Instances' in report
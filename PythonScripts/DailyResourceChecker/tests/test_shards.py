@@ -0,0 +1,78 @@
+import pytest
+
+from shards import LOCAL_SHARD_RESULTS_PATH, LambdaInvoker, LocalInvoker, encode_results, merge_shards, plan_shards
+
+
+def test_lambda_invoker_needs_an_s3_results_path():
+    with pytest.raises(ValueError, match='s3://'):
+        LambdaInvoker(function_name='checker', results_path='/tmp/daily-resource-shards')
+    with pytest.raises(ValueError, match='s3://'):
+        LambdaInvoker(function_name='checker', results_path='')
+
+
+def test_lambda_invoker_accepts_s3():
+    invoker = LambdaInvoker(function_name='checker', results_path='s3://bucket/shards')
+    assert invoker.results_path == 's3://bucket/shards'
+
+
+def test_local_invoker_defaults_to_tmp():
+    invoker = LocalInvoker(lambda event, context: None, results_path=LOCAL_SHARD_RESULTS_PATH)
+    assert invoker.results_path.startswith('/tmp/')
+
+
+def test_one_shard_per_account_and_region():
+    shards = plan_shards([None], ['us-east-1', 'eu-west-1'])
+    assert [shard['id'] for shard in shards] == ['local-us-east-1', 'local-eu-west-1']
+
+
+MARKERS = {}
+MISSING = {'ec2': 'incomplete'}
+
+
+def test_failed_region_shard_keeps_its_error():
+    shards = plan_shards([None], ['us-east-1', 'eu-west-1'])
+    payloads = {
+        'local-us-east-1': {'shard': shards[0], 'results': encode_results({'ec2': {}}, MARKERS), 'error': None},
+        'local-eu-west-1': {'shard': shards[1], 'results': None, 'error': 'AccessDenied'},
+    }
+    assert merge_shards(shards, payloads, MARKERS, MISSING) == {
+        None: {'us-east-1': {'ec2': {}}, 'eu-west-1': 'AccessDenied'},
+    }
+
+
+def test_account_fails_only_when_every_shard_failed():
+    shards = plan_shards(['111111111111', '222222222222'], ['us-east-1', 'eu-west-1'])
+    payloads = {
+        '111111111111-us-east-1': {'results': encode_results({'ec2': {}}, MARKERS), 'error': None},
+        '111111111111-eu-west-1': {'results': None, 'error': 'AccessDenied'},
+        '222222222222-us-east-1': {'results': None, 'error': 'AssumeRole denied'},
+        '222222222222-eu-west-1': {'results': None, 'error': 'AssumeRole denied'},
+    }
+    assert merge_shards(shards, payloads, MARKERS, MISSING) == {
+        '111111111111': {'us-east-1': {'ec2': {}}, 'eu-west-1': 'AccessDenied'},
+        '222222222222': 'AssumeRole denied',
+    }
+
+
+def test_unreported_shard_is_missing_not_failed():
+    shards = plan_shards(['111111111111'], ['us-east-1'])
+    assert merge_shards(shards, {}, MARKERS, MISSING) == {'111111111111': {'us-east-1': MISSING}}
+
+
+def test_local_invoker_shutdown_drops_queued_shards(tmp_path):
+    import threading
+
+    started, release, ran = threading.Event(), threading.Event(), []
+
+    def handler(event, context):
+        started.set()
+        release.wait(5)
+        ran.append(event)
+    invoker = LocalInvoker(handler, max_workers=1, results_path=str(tmp_path))
+    invoker.invoke({'shard': 1})
+    invoker.invoke({'shard': 2})
+    started.wait(5)
+    invoker.shutdown()
+    release.set()
+    invoker.pool.shutdown(wait=True)
+    assert ran == [{'shard': 1}]
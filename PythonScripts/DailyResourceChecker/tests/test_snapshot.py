@@ -0,0 +1,59 @@
+from snapshot import diff_inventory, load_snapshot, save_snapshot
+
+
+def test_changes_within_a_known_check():
+    previous = {'us-east-1': {'ec2': {'i-1': 't3.micro', 'i-2': 't3.large'}}}
+    current = {'us-east-1': {'ec2': {'i-1': 't3.small', 'i-3': 't3.large'}}}
+    assert diff_inventory(previous, current) == {
+        'us-east-1': {'ec2': {'new': ['i-3'], 'removed': ['i-2'], 'changed': [('i-1', 't3.micro', 't3.small')]}},
+    }
+
+
+def test_unchanged_check_is_left_out():
+    inventory = {'us-east-1': {'ec2': {'i-1': 't3.micro'}}}
+    assert diff_inventory(inventory, inventory) == {}
+
+
+def test_new_scope_reports_everything_as_new():
+    previous = {'us-east-1': {'ec2': {'i-1': 't3.micro'}}}
+    current = {
+        'us-east-1': {'ec2': {'i-1': 't3.micro'}},
+        '111111111111/eu-west-1': {'ec2': {'i-9': 'm5.large'}, 'eip': {'1.2.3.4': 'unattached'}},
+    }
+    assert diff_inventory(previous, current) == {
+        '111111111111/eu-west-1': {
+            'ec2': {'new': ['i-9'], 'removed': [], 'changed': []},
+            'eip': {'new': ['1.2.3.4'], 'removed': [], 'changed': []},
+        },
+    }
+
+
+def test_new_check_in_known_scope_reports_everything_as_new():
+    previous = {'us-east-1': {'ec2': {'i-1': 't3.micro'}}}
+    current = {'us-east-1': {'ec2': {'i-1': 't3.micro'}, 'rds': {'db-1': 'db.t3.micro'}}}
+    assert diff_inventory(previous, current) == {
+        'us-east-1': {'rds': {'new': ['db-1'], 'removed': [], 'changed': []}},
+    }
+
+
+def test_new_check_with_nothing_found_is_left_out():
+    previous = {'us-east-1': {'ec2': {'i-1': 't3.micro'}}}
+    current = {'us-east-1': {'ec2': {'i-1': 't3.micro'}, 'rds': {}}}
+    assert diff_inventory(previous, current) == {}
+
+
+def test_saved_snapshot_loads_back(tmp_path):
+    path = str(tmp_path / 'snapshot.json.gz')
+    save_snapshot(path, {'us-east-1': {'ec2': {'i-1': 't3.micro'}}}, None)
+    assert load_snapshot(path, None)['inventory'] == {'us-east-1': {'ec2': {'i-1': 't3.micro'}}}
+    assert list(tmp_path.iterdir()) == [tmp_path / 'snapshot.json.gz']
+
+
+def test_truncated_snapshot_counts_as_missing(tmp_path):
+    path = str(tmp_path / 'snapshot.json.gz')
+    save_snapshot(path, {'us-east-1': {'ec2': {'i-1': 't3.micro'}}}, None)
+    with open(path, 'rb') as f:
+        body = f.read()
+    with open(path, 'wb') as f:
+        f.write(body[:len(body) // 2])
+    assert load_snapshot(path, None) is None